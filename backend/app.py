@@ -1,33 +1,87 @@
 from flask import Flask, send_from_directory
 from flask_cors import CORS
+from config import load_config
 from database import init_db
+from commands import init_commands
 from errors import init_error_handlers
+from events import init_events
+from forecast import init_forecast
+from http_cache import init_http_cache
+from idempotency import init_idempotency
+from metrics import init_metrics
+from outlets import init_outlets
+from recipe_cache import init_recipe_cache
+from scheduler import init_scheduler
+from serializers import init_serializers
+from write_behind import init_write_behind
 from routes.bahan import bahan_bp
 from routes.menu import menu_bp
 from routes.penjualan import penjualan_bp
+from routes.reports import reports_bp
+from routes.export import export_bp
+from routes.stream import stream_bp
+from routes.admin import admin_bp
 import os
 
-def create_app():
-    """Create and configure the Flask application"""
+def create_app(config=None):
+    """
+    Create and configure the Flask application
+    config is a preset name from config.py ('development' or 'production'),
+    a mapping of settings, or None to pick the preset from APP_ENV.
+    """
     app = Flask(__name__, static_folder='../frontend')
+    app.config.from_mapping(load_config(config))
     
     # Enable CORS
     CORS(app)
     
-    # Configure SQLAlchemy
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///cafe_inventory.db'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Initialize outlets, which pick the database of each request
+    init_outlets(app)
     
-    # Initialize database
+    # Initialize database (configured from DATABASE_URL and friends)
     init_db(app)
     
+    # Initialize recipe cost cache
+    init_recipe_cache(app)
+    
+    # Initialize the stock forecast history
+    init_forecast(app)
+    
+    # Initialize idempotency key expiry
+    init_idempotency(app)
+    
+    # Initialize the optional usage log write-behind queue
+    init_write_behind(app)
+    
+    # Initialize the live event broker for /api/stream
+    init_events(app)
+    
+    # Initialize ETag versioning and the response payload cache
+    init_http_cache(app)
+    
+    # Initialize request and SQL instrumentation
+    init_metrics(app)
+    
+    # Select the JSON serializer (orjson when installed)
+    init_serializers(app)
+    
+    # Register the background jobs (end-of-day closing and maintenance)
+    init_scheduler(app)
+    
     # Initialize error handlers
     init_error_handlers(app)
     
+    # Register CLI commands
+    init_commands(app)
+    
     # Register blueprints
     app.register_blueprint(bahan_bp, url_prefix='/api')
     app.register_blueprint(menu_bp, url_prefix='/api')
     app.register_blueprint(penjualan_bp, url_prefix='/api')
+    app.register_blueprint(reports_bp, url_prefix='/api')
+    app.register_blueprint(export_bp, url_prefix='/api')
+    app.register_blueprint(stream_bp, url_prefix='/api')
+    app.register_blueprint(admin_bp, url_prefix='/api')
     
     # Serve frontend files
     @app.route('/')
@@ -46,7 +100,8 @@ def create_app():
     return app
 
 if __name__ == '__main__':
+    # Development server; production runs wsgi:app under gunicorn
     app = create_app()
     # Get port from environment variable or default to 8000
     port = int(os.environ.get('PORT', 8000))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    app.run(host='0.0.0.0', port=port, debug=app.config['DEBUG'])
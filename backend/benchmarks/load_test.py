@@ -0,0 +1,365 @@
+"""
+Load test the API against a synthetic cafe
+
+Seeds thousands of ingredients, hundreds of menus with recipes and up to
+millions of sales, then drives each endpoint through the Flask test client
+and through a threaded WSGI server (or one already running, with --url),
+reporting p50/p95/p99 latency and requests per second per endpoint. POST
+/api/penjualan runs with the same concurrency as the reads. Results are
+written as JSON; --compare prints the change against an earlier file.
+
+Usage: python benchmarks/load_test.py [--sales 1000000] [--requests 500]
+       [--concurrency 8] [--mode both] [--db PATH] [--output FILE]
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Sales and their usage logs inserted per transaction while seeding
+SEED_CHUNK_SIZE = 50000
+
+def seed(db, models, args, rng):
+    """Fill an empty database with the synthetic cafe"""
+    from rollup import rebuild_rollup
+    
+    db.session.bulk_insert_mappings(models.BahanBaku, [
+        {
+            'nama_bahan': f'Bahan {i}', 'satuan': 'gram',
+            'stok_awal': 1e12, 'harga_per_gram': rng.uniform(0.01, 5)
+        }
+        for i in range(args.bahan)
+    ])
+    db.session.bulk_insert_mappings(models.Menu, [
+        {'nama_menu': f'Menu {i}'} for i in range(args.menu)
+    ])
+    recipes = {
+        id_menu: [
+            (id_bahan, rng.uniform(1, 50), rng.choice((0, 2, 5, 10)))
+            for id_bahan in rng.sample(range(1, args.bahan + 1), args.recipe_lines)
+        ]
+        for id_menu in range(1, args.menu + 1)
+    }
+    db.session.bulk_insert_mappings(models.Resep, [
+        {'id_menu': id_menu, 'id_bahan': id_bahan, 'jumlah': jumlah, 'waste_percent': waste}
+        for id_menu, lines in recipes.items() for id_bahan, jumlah, waste in lines
+    ])
+    db.session.commit()
+    
+    cost = {
+        id_bahan: harga for id_bahan, harga in
+        db.session.query(models.BahanBaku.id_bahan, models.BahanBaku.harga_per_gram)
+    }
+    first_date = datetime.utcnow().date() - timedelta(days=args.days - 1)
+    for start in range(1, args.sales + 1, SEED_CHUNK_SIZE):
+        sale_rows, log_rows = [], []
+        for id_penjualan in range(start, min(start + SEED_CHUNK_SIZE, args.sales + 1)):
+            id_menu = rng.randint(1, args.menu)
+            quantity = rng.randint(1, 3)
+            tanggal = first_date + timedelta(days=(id_penjualan - 1) * args.days // args.sales)
+            created_at = datetime.combine(tanggal, datetime.min.time())
+            sale_rows.append({
+                'id_penjualan': id_penjualan, 'id_menu': id_menu, 'tanggal': tanggal,
+                'jumlah_terjual': quantity, 'created_at': created_at
+            })
+            for id_bahan, jumlah, waste in recipes[id_menu]:
+                used = jumlah * quantity
+                log_rows.append({
+                    'id_penjualan': id_penjualan, 'id_bahan': id_bahan,
+                    'jumlah_terpakai': used, 'jumlah_waste': used * waste / 100,
+                    'total_cost': used * (1 + waste / 100) * cost[id_bahan],
+                    'created_at': created_at
+                })
+        db.session.execute(models.Penjualan.__table__.insert(), sale_rows)
+        db.session.execute(models.LogPemakaian.__table__.insert(), log_rows)
+        db.session.commit()
+        print(f'  seeded {min(start + SEED_CHUNK_SIZE - 1, args.sales)} sales', file=sys.stderr)
+    rebuild_rollup()
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute('ANALYZE')
+    db.session.commit()
+
+def sample_space(db, models):
+    """Ranges the generated requests pick their IDs and dates from"""
+    from sqlalchemy import func
+    
+    first_date, last_date = db.session.query(
+        func.min(models.Penjualan.tanggal), func.max(models.Penjualan.tanggal)
+    ).one()
+    today = datetime.utcnow().date()
+    return {
+        'bahan': db.session.query(func.max(models.BahanBaku.id_bahan)).scalar(),
+        'menu': db.session.query(func.max(models.Menu.id_menu)).scalar(),
+        'sales': db.session.query(func.max(models.Penjualan.id_penjualan)).scalar(),
+        'first_date': first_date or today,
+        'days': ((last_date or today) - (first_date or today)).days + 1,
+        'sales_count': db.session.query(func.count(models.Penjualan.id_penjualan)).scalar(),
+        'log_count': db.session.query(func.count(models.LogPemakaian.id_log)).scalar()
+    }
+
+def scenarios(space):
+    """Endpoint name and a request factory: rng -> (method, path, body)"""
+    def day(rng):
+        return space['first_date'] + timedelta(days=rng.randrange(space['days']))
+    
+    def week(rng):
+        start = day(rng)
+        return f'start_date={start}&end_date={start + timedelta(days=6)}'
+    
+    def report_range(rng):
+        start = day(rng)
+        return f'start={start}&end={start + timedelta(days=27)}&bucket=week'
+    
+    today = datetime.utcnow().date().isoformat()
+    return [
+        ('GET /api/bahan', lambda rng: ('GET', '/api/bahan?limit=100', None)),
+        ('GET /api/bahan/<id>', lambda rng: ('GET', f'/api/bahan/{rng.randint(1, space["bahan"])}', None)),
+        ('GET /api/bahan/forecast', lambda rng: ('GET', '/api/bahan/forecast', None)),
+        ('GET /api/menu', lambda rng: ('GET', '/api/menu?limit=50', None)),
+        ('GET /api/menu/<id>', lambda rng: ('GET', f'/api/menu/{rng.randint(1, space["menu"])}', None)),
+        ('GET /api/menu/<id>/recipe', lambda rng: ('GET', f'/api/menu/{rng.randint(1, space["menu"])}/recipe', None)),
+        ('GET /api/penjualan', lambda rng: ('GET', f'/api/penjualan?limit=100&{week(rng)}', None)),
+        ('GET /api/penjualan/<id>', lambda rng: ('GET', f'/api/penjualan/{rng.randint(1, space["sales"])}', None)),
+        ('GET /api/penjualan/daily/<date>', lambda rng: ('GET', f'/api/penjualan/daily/{day(rng)}', None)),
+        ('GET /api/reports/bahan', lambda rng: ('GET', f'/api/reports/bahan?{report_range(rng)}', None)),
+        ('GET /api/reports/menu', lambda rng: ('GET', f'/api/reports/menu?{report_range(rng)}', None)),
+        ('POST /api/penjualan', lambda rng: ('POST', '/api/penjualan', {
+            'id_menu': rng.randint(1, space['menu']), 'tanggal': today, 'jumlah_terjual': 1
+        })),
+    ]
+
+class TestClientTarget:
+    """Send requests through Flask's test client, one client per thread"""
+    name = 'test_client'
+    
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+    
+    def request(self, method, path, body):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        response.get_data()
+        return response.status_code
+    
+    def close(self):
+        pass
+
+class HTTPTarget:
+    """Send requests over HTTP, keeping one connection per thread"""
+    name = 'wsgi_server'
+    
+    def __init__(self, base_url, server=None):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.server = server
+        self.local = threading.local()
+    
+    def _connection(self, fresh=False):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or fresh:
+            if connection is not None:
+                connection.close()
+            connection = self.local.connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=60
+            )
+        return connection
+    
+    def request(self, method, path, body):
+        payload = json.dumps(body) if body is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        for attempt in range(2):
+            connection = self._connection(fresh=attempt > 0)
+            try:
+                connection.request(method, path, payload, headers)
+                response = connection.getresponse()
+                response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed a kept-alive connection; retry on a new one
+                if attempt:
+                    raise
+                continue
+            if response.will_close:
+                self.local.connection = None
+                connection.close()
+            return response.status
+    
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+def start_server(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+    
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def run_scenario(target, factory, requests, concurrency, seed):
+    """Send requests from concurrency threads; returns the summary dictionary"""
+    per_thread = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        latencies, errors = [], 0
+        for _ in range(per_thread[index]):
+            method, path, body = factory(rng)
+            start = time.perf_counter()
+            status = target.request(method, path, body)
+            latencies.append(time.perf_counter() - start)
+            errors += status >= 400
+        return latencies, errors
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    
+    latencies = sorted(latency for thread_latencies, _ in results for latency in thread_latencies)
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors in results),
+        'concurrency': concurrency,
+        'seconds': elapsed,
+        'rps': len(latencies) / elapsed if elapsed else None,
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else None,
+        'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else None,
+        'p95_ms': percentile(latencies, 0.95) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None,
+        'max_ms': latencies[-1] * 1000 if latencies else None
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results, baseline=None):
+    previous = {}
+    if baseline is not None:
+        previous = {(r['target'], r['endpoint']): r for r in baseline['results']}
+    print(f'{"target":<12} {"endpoint":<32} {"rps":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"err":>5}')
+    for result in results:
+        line = (
+            f'{result["target"]:<12} {result["endpoint"]:<32} {result["rps"]:8.1f} '
+            f'{result["p50_ms"]:8.2f} {result["p95_ms"]:8.2f} {result["p99_ms"]:8.2f} {result["errors"]:5d}'
+        )
+        before = previous.get((result['target'], result['endpoint']))
+        if before:
+            line += f'  rps {(result["rps"] / before["rps"] - 1) * 100:+6.1f}%' \
+                f'  p95 {(result["p95_ms"] / before["p95_ms"] - 1) * 100:+6.1f}%'
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bahan', type=int, default=2000, help='ingredients to seed')
+    parser.add_argument('--menu', type=int, default=300, help='menus to seed')
+    parser.add_argument('--recipe-lines', type=int, default=6, help='ingredients per recipe')
+    parser.add_argument('--sales', type=int, default=1000000, help='sales to seed')
+    parser.add_argument('--days', type=int, default=365, help='days the seeded sales span')
+    parser.add_argument('--requests', type=int, default=500, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mode', choices=('test_client', 'server', 'both'), default='both')
+    parser.add_argument('--url', help='benchmark a running server instead of starting one')
+    parser.add_argument('--db', help='SQLite file to seed, or reuse when it already has data')
+    parser.add_argument('--endpoint', action='append', help='only run endpoints containing this text')
+    parser.add_argument('--output', help='JSON results file (default: load_test-<timestamp>.json)')
+    parser.add_argument('--compare', help='earlier JSON results file to compare against')
+    parser.add_argument('--seed', type=int, default=18)
+    args = parser.parse_args()
+    
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'load_test.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(db_path)}'
+    os.environ.setdefault('METRICS_ENABLED', '0')
+    
+    from app import create_app
+    from database import db
+    import models
+    
+    app = create_app()
+    with app.app_context():
+        seed_seconds = None
+        if models.Menu.query.first() is None:
+            print(f'Seeding {db_path}', file=sys.stderr)
+            start = time.perf_counter()
+            seed(db, models, args, random.Random(args.seed))
+            seed_seconds = time.perf_counter() - start
+        space = sample_space(db, models)
+        db.session.remove()
+    
+    targets = []
+    if args.mode in ('test_client', 'both'):
+        targets.append(TestClientTarget(app))
+    if args.mode in ('server', 'both'):
+        if args.url:
+            targets.append(HTTPTarget(args.url))
+        else:
+            server = start_server(app)
+            targets.append(HTTPTarget(f'http://127.0.0.1:{server.server_port}', server))
+    
+    results = []
+    for target in targets:
+        for index, (endpoint, factory) in enumerate(scenarios(space)):
+            if args.endpoint and not any(text in endpoint for text in args.endpoint):
+                continue
+            # One untimed pass warms caches and connections
+            run_scenario(target, factory, args.concurrency, args.concurrency, args.seed + index)
+            result = run_scenario(target, factory, args.requests, args.concurrency, args.seed + index)
+            results.append({'target': target.name, 'endpoint': endpoint, **result})
+            print(f'  {target.name} {endpoint}: {result["rps"]:.1f} req/s', file=sys.stderr)
+        target.close()
+    
+    report = {
+        'created_at': datetime.utcnow().isoformat(),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'arguments': vars(args),
+        'dataset': {
+            'bahan': space['bahan'], 'menu': space['menu'],
+            'sales': space['sales_count'], 'log_pemakaian': space['log_count'],
+            'seed_seconds': seed_seconds
+        },
+        'results': results
+    }
+    output = args.output or f'load_test-{datetime.utcnow():%Y%m%d-%H%M%S}.json'
+    with open(output, 'w') as handle:
+        json.dump(report, handle, indent=2)
+    
+    baseline = None
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+    print_results(results, baseline)
+    print(f'Results written to {output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark the lookups served by the indexes of migration 0002
+
+Seeds a database migrated to the baseline revision only, prints SQLite's
+query plan and timing for each lookup, then upgrades to head and repeats
+them, so the full table scans and the index searches sit side by side.
+
+Usage: python benchmarks/query_plans.py [--sales 50000] [--repeat 200]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUERIES = [
+    (
+        'penjualan by tanggal + id_menu',
+        'SELECT * FROM penjualan WHERE tanggal = :tanggal AND id_menu = :id_menu'
+    ),
+    (
+        'log_pemakaian by id_penjualan',
+        'SELECT * FROM log_pemakaian WHERE id_penjualan = :id_penjualan'
+    ),
+    (
+        'log_pemakaian by id_bahan + created_at',
+        'SELECT sum(jumlah_terpakai) FROM log_pemakaian '
+        'WHERE id_bahan = :id_bahan AND created_at >= :since'
+    ),
+    (
+        'resep by id_menu',
+        'SELECT * FROM resep WHERE id_menu = :id_menu'
+    ),
+]
+
+def seed(db, models, sales, rng):
+    from datetime import date, datetime, timedelta
+    
+    bahan_count, menu_count, lines_per_menu = 40, 200, 4
+    db.session.bulk_insert_mappings(models.BahanBaku, [
+        {'nama_bahan': f'Bahan {i}', 'satuan': 'gram', 'stok_awal': 1e9, 'harga_per_gram': 1}
+        for i in range(bahan_count)
+    ])
+    db.session.bulk_insert_mappings(models.Menu, [
+        {'nama_menu': f'Menu {i}'} for i in range(menu_count)
+    ])
+    recipes = {
+        id_menu: rng.sample(range(1, bahan_count + 1), lines_per_menu)
+        for id_menu in range(1, menu_count + 1)
+    }
+    db.session.bulk_insert_mappings(models.Resep, [
+        {'id_menu': id_menu, 'id_bahan': id_bahan, 'jumlah': 10, 'waste_percent': 5}
+        for id_menu, bahan_ids in recipes.items() for id_bahan in bahan_ids
+    ])
+    
+    start_date = date(2024, 1, 1)
+    sale_rows, log_rows = [], []
+    for id_penjualan in range(1, sales + 1):
+        id_menu = rng.randint(1, menu_count)
+        tanggal = start_date + timedelta(days=id_penjualan * 365 // sales)
+        sale_rows.append({
+            'id_penjualan': id_penjualan, 'id_menu': id_menu,
+            'tanggal': tanggal, 'jumlah_terjual': 1
+        })
+        created_at = datetime.combine(tanggal, datetime.min.time())
+        log_rows.extend(
+            {
+                'id_penjualan': id_penjualan, 'id_bahan': id_bahan, 'jumlah_terpakai': 10,
+                'jumlah_waste': 0.5, 'total_cost': 10.5, 'created_at': created_at
+            }
+            for id_bahan in recipes[id_menu]
+        )
+    db.session.bulk_insert_mappings(models.Penjualan, sale_rows)
+    db.session.bulk_insert_mappings(models.LogPemakaian, log_rows)
+    db.session.commit()
+    return {
+        'tanggal': [start_date + timedelta(days=i) for i in range(365)],
+        'id_menu': list(range(1, menu_count + 1)),
+        'id_penjualan': list(range(1, sales + 1)),
+        'id_bahan': list(range(1, bahan_count + 1)),
+        'since': [datetime(2024, 12, 1)]
+    }
+
+def measure(connection, repeat, values, rng):
+    from sqlalchemy import text
+    
+    results = {}
+    for label, sql in QUERIES:
+        names = [name for name in values if f':{name}' in sql]
+        plan_params = {name: values[name][0] for name in names}
+        plan = connection.execute(text(f'EXPLAIN QUERY PLAN {sql}'), plan_params).all()
+        params = [{name: rng.choice(values[name]) for name in names} for _ in range(repeat)]
+        start = time.perf_counter()
+        for bound in params:
+            connection.execute(text(sql), bound).all()
+        elapsed = (time.perf_counter() - start) / repeat
+        results[label] = (' / '.join(row[-1] for row in plan), elapsed)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sales', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "bench.db")}'
+    os.environ['METRICS_ENABLED'] = '0'
+    os.environ['DB_AUTO_MIGRATE'] = '0'
+    
+    from app import create_app
+    from database import db, upgrade_db
+    import models
+    
+    rng = random.Random(17)
+    app = create_app()
+    with app.app_context():
+        upgrade_db('0001')
+        values = seed(db, models, args.sales, rng)
+        
+        with db.engine.connect() as connection:
+            before = measure(connection, args.repeat, values, random.Random(1))
+        upgrade_db('head')
+        with db.engine.connect() as connection:
+            connection.exec_driver_sql('ANALYZE')
+            after = measure(connection, args.repeat, values, random.Random(1))
+    
+    print(f'{args.sales} sales, mean of {args.repeat} lookups each')
+    for label, _ in QUERIES:
+        (plan_before, time_before), (plan_after, time_after) = before[label], after[label]
+        print(f'{label}')
+        print(f'  0001 {time_before * 1000:9.3f} ms  {plan_before}')
+        print(f'  head {time_after * 1000:9.3f} ms  {plan_after}  ({time_before / time_after:.0f}x)')
+
+if __name__ == '__main__':
+    main()
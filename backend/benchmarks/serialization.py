@@ -0,0 +1,97 @@
+"""
+Benchmark the JSON path of a 10k-row /api/penjualan listing
+
+Compares the ORM + to_dict() + stdlib encoder path with plain column rows
+encoded by the stdlib encoder and by orjson, then times the HTTP listing
+(10 keyset pages of 1000) with each serializer.
+
+Usage: python benchmarks/serialization.py [--rows 10000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "bench.db")}'
+    os.environ['METRICS_ENABLED'] = '0'
+    
+    from app import create_app
+    from database import db
+    from models import BahanBaku, Menu, Penjualan
+    import serializers
+    from serializers import rows_to_dicts, select_columns
+    from datetime import date, timedelta
+    
+    app = create_app()
+    with app.app_context():
+        db.session.add(BahanBaku(nama_bahan='Kopi', satuan='gram', stok_awal=1e9, harga_per_gram=2))
+        db.session.add(Menu(nama_menu='Espresso'))
+        db.session.flush()
+        start_date = date(2024, 1, 1)
+        db.session.bulk_insert_mappings(Penjualan, [
+            {'id_menu': 1, 'tanggal': start_date + timedelta(days=i % 365), 'jumlah_terjual': 1 + i % 5}
+            for i in range(args.rows)
+        ])
+        db.session.commit()
+        
+        def orm_stdlib():
+            penjualan_list = Penjualan.query.order_by(Penjualan.id_penjualan).all()
+            json.dumps([penjualan.to_dict() for penjualan in penjualan_list])
+        
+        def rows_with(name):
+            def run():
+                serializers.use_serializer(name)
+                rows = db.session.query(
+                    *select_columns(Penjualan, None, Penjualan.id_penjualan)
+                ).order_by(Penjualan.id_penjualan).all()
+                serializers.dumps(rows_to_dicts(rows))
+            return run
+        
+        cases = [('orm + to_dict + json', orm_stdlib), ('rows + json', rows_with('json'))]
+        if 'orjson' in serializers.SERIALIZERS:
+            cases.append(('rows + orjson', rows_with('orjson')))
+        
+        print(f'{args.rows} penjualan rows, best/median of {args.repeat}')
+        baseline = None
+        for label, func in cases:
+            best, median = best_of(args.repeat, func)
+            baseline = baseline or best
+            print(f'  {label:<24} {best * 1000:8.1f} ms {median * 1000:8.1f} ms  {baseline / best:5.2f}x')
+    
+    client = app.test_client()
+    
+    def listing():
+        cursor = ''
+        while cursor is not None:
+            body = client.get(f'/api/penjualan?limit=1000{cursor}').get_json()
+            next_cursor = body['pagination']['next_cursor']
+            cursor = f'&cursor={next_cursor}' if next_cursor is not None else None
+    
+    print('HTTP listing, pages of 1000')
+    for name in serializers.SERIALIZERS:
+        serializers.use_serializer(name)
+        best, median = best_of(args.repeat, listing)
+        print(f'  {name:<24} {best * 1000:8.1f} ms {median * 1000:8.1f} ms')
+
+if __name__ == '__main__':
+    main()
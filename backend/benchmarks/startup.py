@@ -0,0 +1,122 @@
+"""
+Benchmark how fast the app starts
+
+Each measurement runs in a fresh interpreter: importing app, create_app()
+with the development preset (which checks migrations) and the production
+preset, and the time until gunicorn answers /health with and without
+preloading the app in the master.
+
+Usage: python benchmarks/startup.py [--repeat 5] [--workers 1]
+
+More than one worker needs EVENT_BROKER=redis and a reachable REDIS_URL.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app(sys.argv[1])
+created = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'loaded': sorted(name for name in ('alembic', 'numpy') if name in sys.modules)
+}))
+'''
+
+def probe(env, preset):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, preset], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def time_to_first_response(env, workers, preload, timeout=60):
+    """Seconds from launching gunicorn until /health answers"""
+    port = free_port()
+    server_env = dict(
+        env,
+        GUNICORN_BIND=f'127.0.0.1:{port}',
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_PRELOAD='1' if preload else '0',
+        GUNICORN_ACCESS_LOG=''
+    )
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'], cwd=BACKEND_DIR,
+        env=server_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+                connection.request('GET', '/health')
+                if connection.getresponse().status == 200:
+                    return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError('gunicorn did not answer in time')
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        DATABASE_URL=f'sqlite:///{os.path.join(workdir, "startup.db")}',
+        LOG_JOURNAL_DIR=os.path.join(workdir, 'log_journal')
+    )
+    env.pop('APP_ENV', None)
+    # Migrate once so every run below starts from an up-to-date schema
+    probe(env, 'development')
+    
+    print(f'Median of {args.repeat} runs')
+    for preset in ('development', 'production'):
+        runs = [probe(env, preset) for _ in range(args.repeat)]
+        print(
+            f'  {preset:<12} import app {statistics.median(r["import_ms"] for r in runs):7.1f} ms'
+            f'  create_app {statistics.median(r["create_app_ms"] for r in runs):7.1f} ms'
+            f'  loaded: {", ".join(runs[0]["loaded"]) or "-"}'
+        )
+    
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        print('gunicorn is not installed; skipping the server start-up runs')
+        return
+    for preload in (False, True):
+        timings = [
+            time_to_first_response(env, args.workers, preload) for _ in range(args.repeat)
+        ]
+        label = 'preload' if preload else 'no preload'
+        print(
+            f'  gunicorn {args.workers} workers, {label:<10} first response '
+            f'{statistics.median(timings) * 1000:7.1f} ms'
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,412 @@
+from database import db, insert_returning_ids
+from models import BahanBaku, Menu, Resep
+from errors import CatalogImportError, ValidationError
+from http_cache import STOK_VERSION, bump_session_versions
+from events import publish_on_commit
+from stock_ledger import JENIS_AWAL, JENIS_PENYESUAIAN, record_mutasi
+from sqlalchemy import bindparam, update
+from datetime import datetime
+import csv
+import io
+import json
+
+# Values bound per IN (...) lookup, below SQLite's oldest variable limit
+LOOKUP_CHUNK_SIZE = 900
+
+BAHAN_FIELDS = ('nama_bahan', 'satuan', 'stok_awal', 'harga_per_gram')
+
+def parse_catalog(text, format):
+    """
+    Read an import catalog from CSV or JSON text
+    JSON is a list of objects, or an object holding the list under "data".
+    Returns: list of (row number, record); CSV rows are numbered by their
+    line in the file and JSON records from 1
+    """
+    if format == 'csv':
+        reader = csv.DictReader(io.StringIO(text))
+        return [
+            (reader.line_num, {key: value for key, value in record.items() if value not in ('', None)})
+            for record in reader
+        ]
+    if format == 'json':
+        try:
+            data = json.loads(text)
+        except ValueError:
+            raise ValidationError('Catalog is not valid JSON')
+        if isinstance(data, dict):
+            data = data.get('data')
+        if not isinstance(data, list):
+            raise ValidationError('Catalog must be a list of records')
+        return list(enumerate(data, start=1))
+    raise ValidationError('Catalog format must be csv or json')
+
+def catalog_from_request(request):
+    """Read the catalog of an import request: text/csv, or JSON otherwise"""
+    format = 'csv' if request.mimetype == 'text/csv' else 'json'
+    return parse_catalog(request.get_data(as_text=True), format)
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        yield values[start:start + LOOKUP_CHUNK_SIZE]
+
+def _lookup(model, key_column, keys, *columns):
+    """Fetch rows whose key_column is in keys, a chunked IN (...) at a time"""
+    rows = []
+    for chunk in _chunks(keys):
+        rows.extend(
+            db.session.query(key_column, *columns).filter(key_column.in_(chunk)).all()
+        )
+    return rows
+
+def _number(record, field, errors, row, positive=False):
+    """Read a numeric field, recording an error when it is invalid"""
+    try:
+        # float() would read true as 1
+        if isinstance(record[field], bool):
+            raise ValueError
+        value = float(record[field])
+        if value < 0 or (positive and value == 0):
+            raise ValueError
+        return value
+    except (TypeError, ValueError):
+        kind = 'positive' if positive else 'non-negative'
+        errors.append({'row': row, 'field': field, 'message': f'{field} must be a {kind} number'})
+
+def _record_id(record, field, errors, row):
+    """Read an optional integer ID; False when it is invalid"""
+    if record.get(field) is None:
+        return None
+    try:
+        return int(record[field])
+    except (TypeError, ValueError):
+        errors.append({'row': row, 'field': field, 'message': f'{field} must be an integer'})
+        return False
+
+def _match_existing(model, id_column, records, errors, key, label):
+    """
+    Resolve each record to an existing row by ID or, failing that, by name
+    Both lookups are one set-based query over the whole catalog.
+    Returns: dictionary of row number -> existing ID (None for new rows)
+    """
+    ids = {record[key] for _, record in records if record.get(key) is not None}
+    names = {record['nama'] for _, record in records if record.get(key) is None}
+    known_ids = {row[0] for row in _lookup(model, id_column, ids)}
+    ids_by_name = {}
+    name_column = getattr(model, f'nama_{label}')
+    for name, row_id in _lookup(model, name_column, names, id_column):
+        ids_by_name.setdefault(name, []).append(row_id)
+    
+    matches = {}
+    matched_rows = {}
+    for row, record in records:
+        if record.get(key) is not None:
+            if record[key] not in known_ids:
+                errors.append({
+                    'row': row, 'field': key,
+                    'message': f'{label.capitalize()} with ID {record[key]} not found'
+                })
+            matches[row] = record[key]
+            continue
+        existing = ids_by_name.get(record['nama'], [])
+        if len(existing) > 1:
+            errors.append({
+                'row': row, 'field': f'nama_{label}',
+                'message': f'{len(existing)} existing {label} items are named '
+                           f'{record["nama"]!r}; give {key} instead'
+            })
+        matches[row] = existing[0] if existing else None
+    
+    # An ID and a name in the same catalog can still point at one row
+    for row in sorted(matches):
+        if matches[row] is None:
+            continue
+        if matches[row] in matched_rows:
+            errors.append({
+                'row': row, 'field': key,
+                'message': f'Same {label} as row {matched_rows[matches[row]]}'
+            })
+        else:
+            matched_rows[matches[row]] = row
+    return matches
+
+def _check_duplicates(records, errors, key, label):
+    """Reject a catalog that lists the same item twice"""
+    seen = {}
+    for row, record in records:
+        identity = ('id', record[key]) if record.get(key) is not None else ('nama', record['nama'])
+        if identity in seen:
+            errors.append({
+                'row': row, 'field': key if identity[0] == 'id' else f'nama_{label}',
+                'message': f'Duplicate of row {seen[identity]}'
+            })
+        else:
+            seen[identity] = row
+
+def import_bahan(records):
+    """
+    Create or update raw materials from catalog records in one transaction
+    A record updates the bahan with its id_bahan or, without one, the bahan
+    with the same nama_bahan; anything else is created. New rows need every
+    field, updates only the ones they change. Stock changes are recorded in
+    the ledger. Any invalid row rejects the whole catalog.
+    Returns: dictionary with created and updated counts
+    """
+    errors = []
+    parsed = []
+    for row, record in records:
+        if not isinstance(record, dict):
+            errors.append({'row': row, 'message': 'Record must be an object'})
+            continue
+        item = {'nama': record.get('nama_bahan')}
+        item['id_bahan'] = _record_id(record, 'id_bahan', errors, row)
+        for field in ('nama_bahan', 'satuan'):
+            if field in record:
+                if not isinstance(record[field], str) or not record[field].strip():
+                    errors.append({'row': row, 'field': field, 'message': f'{field} must be a non-empty string'})
+                else:
+                    item[field] = record[field]
+        for field in ('stok_awal', 'harga_per_gram'):
+            if field in record:
+                item[field] = _number(record, field, errors, row)
+        if item['id_bahan'] is None and item['nama'] is None:
+            errors.append({'row': row, 'message': 'Record needs id_bahan or nama_bahan'})
+        parsed.append((row, item))
+    
+    parsed = [(row, item) for row, item in parsed if item['id_bahan'] is not False]
+    _check_duplicates(parsed, errors, 'id_bahan', 'bahan')
+    matches = _match_existing(BahanBaku, BahanBaku.id_bahan, parsed, errors, 'id_bahan', 'bahan')
+    for row, item in parsed:
+        if matches[row] is None:
+            missing = [field for field in BAHAN_FIELDS if field not in item]
+            if missing:
+                errors.append({'row': row, 'message': f'New bahan missing fields: {", ".join(missing)}'})
+    if errors:
+        raise CatalogImportError(sorted(errors, key=lambda error: error['row']))
+    
+    now = datetime.utcnow()
+    new_rows = [item for row, item in parsed if matches[row] is None]
+    updates = [(matches[row], item) for row, item in parsed if matches[row] is not None]
+    
+    # Stock already on hand, to turn imported levels into ledger deltas
+    current = dict(_lookup(BahanBaku, BahanBaku.id_bahan, [id_bahan for id_bahan, _ in updates], BahanBaku.stok_awal))
+    
+    inserted = [
+        dict({field: item[field] for field in BAHAN_FIELDS}, created_at=now, updated_at=now)
+        for item in new_rows
+    ]
+    # One statement for all new rows; their primary keys are for the ledger rows
+    for row, id_bahan in zip(inserted, insert_returning_ids(BahanBaku, inserted)):
+        row['id_bahan'] = id_bahan
+    
+    db.session.bulk_update_mappings(BahanBaku, [
+        dict(
+            {field: item[field] for field in ('nama_bahan', 'satuan', 'harga_per_gram') if field in item},
+            id_bahan=id_bahan, updated_at=now
+        )
+        for id_bahan, item in updates
+    ])
+    
+    # Stock moves relative to what is on hand, so sales committed meanwhile
+    # stay in both the balance and the ledger
+    stock_deltas = {
+        id_bahan: item['stok_awal'] - current[id_bahan]
+        for id_bahan, item in updates
+        if 'stok_awal' in item and item['stok_awal'] != current[id_bahan]
+    }
+    if stock_deltas:
+        table = BahanBaku.__table__
+        db.session.execute(
+            update(table)
+            .where(table.c.id_bahan == bindparam('b_id_bahan'))
+            .values(stok_awal=table.c.stok_awal + bindparam('b_delta'), updated_at=now),
+            [{'b_id_bahan': id_bahan, 'b_delta': delta} for id_bahan, delta in stock_deltas.items()]
+        )
+        record_mutasi(JENIS_PENYESUAIAN, stock_deltas, 'Stok diubah lewat impor katalog')
+    if inserted:
+        record_mutasi(JENIS_AWAL, {row['id_bahan']: row['stok_awal'] for row in inserted}, 'Stok awal')
+    
+    # Bulk writes skip the unit of work, so the table versions are bumped explicitly
+    if inserted or updates:
+        bump_session_versions(
+            db.session,
+            {'bahan_baku', STOK_VERSION} if stock_deltas else {'bahan_baku'}
+        )
+        publish_on_commit('bahan_changed', {
+            'action': 'imported',
+            'created': [row['id_bahan'] for row in inserted],
+            'updated': [id_bahan for id_bahan, _ in updates]
+        })
+    if stock_deltas:
+        publish_on_commit('stock_changed', {'changes': [
+            {'id_bahan': id_bahan, 'delta': delta} for id_bahan, delta in stock_deltas.items()
+        ]})
+    db.session.commit()
+    
+    return {'created': len(inserted), 'updated': len(updates)}
+
+def _group_menu_lines(records, errors):
+    """
+    Fold catalog records into menus
+    A JSON record is one menu with a resep list; a CSV row is one recipe
+    line, and rows naming the same menu are joined.
+    Returns: list of (row number, menu item)
+    """
+    menus = []
+    by_key = {}
+    for row, record in records:
+        if not isinstance(record, dict):
+            errors.append({'row': row, 'message': 'Record must be an object'})
+            continue
+        id_menu = _record_id(record, 'id_menu', errors, row)
+        if id_menu is False:
+            continue
+        nama = record.get('nama_menu')
+        if nama is not None and (not isinstance(nama, str) or not nama.strip()):
+            errors.append({'row': row, 'field': 'nama_menu', 'message': 'nama_menu must be a non-empty string'})
+            continue
+        if id_menu is None and nama is None:
+            errors.append({'row': row, 'message': 'Record needs id_menu or nama_menu'})
+            continue
+        
+        if 'resep' in record:
+            if not isinstance(record['resep'], list):
+                errors.append({'row': row, 'field': 'resep', 'message': 'resep must be a list of ingredients'})
+                continue
+            lines = [(row, line) for line in record['resep']]
+            menus.append((row, {'id_menu': id_menu, 'nama': nama, 'lines': lines}))
+            continue
+        
+        # A CSV row: one recipe line of the menu it names
+        key = ('id', id_menu) if id_menu is not None else ('nama', nama)
+        item = by_key.get(key)
+        if item is None:
+            item = by_key[key] = {'id_menu': id_menu, 'nama': nama, 'lines': []}
+            menus.append((row, item))
+        elif nama is not None and item['nama'] is None:
+            item['nama'] = nama
+        line = {field: record[field] for field in ('id_bahan', 'nama_bahan', 'jumlah', 'waste_percent') if field in record}
+        if line:
+            item['lines'].append((row, line))
+    return menus
+
+def import_menu(records):
+    """
+    Create or update menu items and their recipes in one transaction
+    Menus are matched like bahan, by id_menu or else nama_menu. A recipe
+    line names its ingredient by id_bahan or nama_bahan; every reference is
+    checked with one set-based query. An imported recipe replaces the menu's
+    current one. Any invalid row rejects the whole catalog.
+    Returns: dictionary with created and updated counts
+    """
+    errors = []
+    menus = _group_menu_lines(records, errors)
+    _check_duplicates(menus, errors, 'id_menu', 'menu')
+    
+    # Validate recipe lines, then resolve every ingredient reference at once
+    for _, item in menus:
+        resep = []
+        for row, line in item['lines']:
+            if not isinstance(line, dict):
+                errors.append({'row': row, 'field': 'resep', 'message': 'Recipe item must be an object'})
+                continue
+            id_bahan = _record_id(line, 'id_bahan', errors, row)
+            if id_bahan is None and line.get('nama_bahan') is None:
+                errors.append({'row': row, 'message': 'Recipe item needs id_bahan or nama_bahan'})
+                continue
+            resep.append((row, {
+                'id_bahan': id_bahan,
+                'nama_bahan': line.get('nama_bahan'),
+                'jumlah': _number(line, 'jumlah', errors, row, positive=True),
+                'waste_percent': _number(line, 'waste_percent', errors, row)
+            }))
+        item['resep'] = resep
+    
+    lines = [line for _, item in menus for line in item['resep']]
+    known_bahan = {row[0] for row in _lookup(
+        BahanBaku, BahanBaku.id_bahan, {line['id_bahan'] for _, line in lines if line['id_bahan']}
+    )}
+    bahan_by_name = {}
+    for nama, id_bahan in _lookup(
+        BahanBaku, BahanBaku.nama_bahan,
+        {line['nama_bahan'] for _, line in lines if line['id_bahan'] is None},
+        BahanBaku.id_bahan
+    ):
+        bahan_by_name.setdefault(nama, []).append(id_bahan)
+    
+    for row, line in lines:
+        if line['id_bahan'] is False:
+            continue
+        if line['id_bahan'] is not None:
+            if line['id_bahan'] not in known_bahan:
+                errors.append({'row': row, 'field': 'id_bahan', 'message': f'Bahan with ID {line["id_bahan"]} not found'})
+            continue
+        found = bahan_by_name.get(line['nama_bahan'], [])
+        if len(found) == 1:
+            line['id_bahan'] = found[0]
+        else:
+            problem = 'not found' if not found else f'matches {len(found)} bahan; give id_bahan instead'
+            errors.append({'row': row, 'field': 'nama_bahan', 'message': f'Bahan {line["nama_bahan"]!r} {problem}'})
+    
+    # As in the menu API, an ingredient appears once per recipe, however it is named
+    for _, item in menus:
+        seen = set()
+        for row, line in item['resep']:
+            if line['id_bahan'] in (None, False):
+                continue
+            if line['id_bahan'] in seen:
+                errors.append({
+                    'row': row, 'field': 'id_bahan',
+                    'message': f'Bahan with ID {line["id_bahan"]} appears twice in the recipe'
+                })
+            seen.add(line['id_bahan'])
+    
+    matches = _match_existing(Menu, Menu.id_menu, menus, errors, 'id_menu', 'menu')
+    for row, item in menus:
+        if matches[row] is None and item['nama'] is None:
+            errors.append({'row': row, 'message': 'New menu needs nama_menu'})
+        if matches[row] is None and not item['resep']:
+            errors.append({'row': row, 'field': 'resep', 'message': 'New menu must include a recipe'})
+    if errors:
+        raise CatalogImportError(sorted(errors, key=lambda error: error['row']))
+    
+    now = datetime.utcnow()
+    inserted = [
+        {'nama_menu': item['nama'], 'created_at': now, 'updated_at': now}
+        for row, item in menus if matches[row] is None
+    ]
+    new_ids = iter(insert_returning_ids(Menu, inserted))
+    menu_ids = {row: matches[row] if matches[row] is not None else next(new_ids) for row, _ in menus}
+    
+    updated = [(menu_ids[row], item) for row, item in menus if matches[row] is not None]
+    db.session.bulk_update_mappings(Menu, [
+        {'id_menu': id_menu, 'nama_menu': item['nama'], 'updated_at': now}
+        for id_menu, item in updated if item['nama'] is not None
+    ])
+    
+    # Imported recipes replace the current ones
+    replaced = [id_menu for id_menu, item in updated if item['resep']]
+    for chunk in _chunks(replaced):
+        db.session.query(Resep).filter(Resep.id_menu.in_(chunk)).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(Resep, [
+        {
+            'id_menu': menu_ids[row],
+            'id_bahan': line['id_bahan'],
+            'jumlah': line['jumlah'],
+            'waste_percent': line['waste_percent'],
+            'created_at': now,
+            'updated_at': now
+        }
+        for row, item in menus for _, line in item['resep']
+    ])
+    
+    if menus:
+        bump_session_versions(db.session, {'menu', 'resep'})
+        publish_on_commit('menu_changed', {
+            'action': 'imported',
+            'created': [menu_ids[row] for row, _ in menus if matches[row] is None],
+            'updated': [id_menu for id_menu, _ in updated]
+        })
+    db.session.commit()
+    
+    return {'created': len(inserted), 'updated': len(updated)}
@@ -0,0 +1,174 @@
+from datetime import datetime
+from flask import current_app
+from flask.cli import AppGroup
+from database import each_outlet, run_migration_command
+from outlets import outlet_context
+from rollup import rebuild_rollup
+from idempotency import purge_expired_keys
+from stock_ledger import take_snapshots
+from scheduler import get_scheduler
+from catalog_import import import_bahan, import_menu, parse_catalog
+from errors import APIError, CatalogImportError, ValidationError
+import os
+import click
+
+def _parse_date(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise click.BadParameter('Invalid date format. Use YYYY-MM-DD')
+
+def _check_outlets(outlets):
+    unknown = [outlet for outlet in outlets if outlet not in current_app.config['OUTLETS']]
+    if unknown:
+        raise click.BadParameter(f'Unknown outlet(s): {", ".join(unknown)}', param_hint='--outlet')
+
+# Maintenance runs for every outlet unless some are picked
+outlets_option = click.option(
+    '--outlet', 'outlets', multiple=True,
+    help='Outlet to run for; repeat for several (default: every outlet)'
+)
+
+def _each_outlet(outlets):
+    """Select each chosen outlet in turn, echoing its name when there are several"""
+    app = current_app._get_current_object()
+    _check_outlets(outlets)
+    selected = list(outlets or app.config['OUTLETS'])
+    for outlet in each_outlet(app, selected):
+        if len(selected) > 1:
+            click.echo(f'[{outlet}]')
+        yield outlet
+
+def _import_catalog(importer, path, outlet):
+    """Run a catalog import from a .csv or .json file, printing row errors"""
+    _check_outlets([outlet] if outlet else [])
+    format = os.path.splitext(path)[1].lstrip('.').lower()
+    with open(path, encoding='utf-8-sig') as catalog:
+        text = catalog.read()
+    try:
+        with outlet_context(outlet or current_app.config['DEFAULT_OUTLET']):
+            result = importer(parse_catalog(text, format))
+    except CatalogImportError as error:
+        for row_error in error.payload['errors']:
+            field = f' [{row_error["field"]}]' if 'field' in row_error else ''
+            click.echo(f'Row {row_error["row"]}{field}: {row_error["message"]}', err=True)
+        raise click.ClickException(error.message)
+    except ValidationError as error:
+        raise click.ClickException(error.message)
+    click.echo(f'Created {result["created"]}, updated {result["updated"]}')
+
+def init_commands(app):
+    """Register maintenance commands on the Flask CLI"""
+    
+    @app.cli.command('rebuild-rollup')
+    @click.option('--start', callback=_parse_date, help='First date to rebuild (YYYY-MM-DD)')
+    @click.option('--end', callback=_parse_date, help='Last date to rebuild (YYYY-MM-DD)')
+    @outlets_option
+    def rebuild_rollup_command(start, end, outlets):
+        """Rebuild the daily sales rollup from the usage logs"""
+        for _ in _each_outlet(outlets):
+            days = rebuild_rollup(start, end)
+            click.echo(f'Rebuilt daily rollup for {days} day(s)')
+    
+    @app.cli.command('purge-idempotency-keys')
+    @outlets_option
+    def purge_idempotency_keys_command(outlets):
+        """Delete idempotency keys past their TTL"""
+        for _ in _each_outlet(outlets):
+            deleted = purge_expired_keys()
+            click.echo(f'Deleted {deleted} expired idempotency key(s)')
+    
+    @app.cli.command('snapshot-stok')
+    @outlets_option
+    def snapshot_stok_command(outlets):
+        """Snapshot the stock of ingredients that moved since their last snapshot"""
+        for _ in _each_outlet(outlets):
+            written = take_snapshots()
+            click.echo(f'Wrote {written} stock snapshot(s)')
+    
+    @app.cli.command('import-bahan')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--outlet', help='Outlet to import into (default: the default outlet)')
+    def import_bahan_command(path, outlet):
+        """Create or update raw materials from a CSV or JSON catalog"""
+        _import_catalog(import_bahan, path, outlet)
+    
+    @app.cli.command('import-menu')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--outlet', help='Outlet to import into (default: the default outlet)')
+    def import_menu_command(path, outlet):
+        """Create or update menu items and recipes from a CSV or JSON catalog"""
+        _import_catalog(import_menu, path, outlet)
+    
+    @app.cli.command('run-job')
+    @click.argument('name')
+    def run_job_command(name):
+        """Run a background job now, waiting for it to finish"""
+        scheduler = get_scheduler()
+        try:
+            scheduler.run(name)
+        except APIError as error:
+            raise click.ClickException(error.message)
+        job = next(job for job in scheduler.status() if job['name'] == name)
+        click.echo(f'{name}: {job["last_status"]} in {job["last_duration_ms"]:.1f} ms')
+        if job['last_error']:
+            raise click.ClickException(job['last_error'])
+    
+    @app.cli.command('list-jobs')
+    def list_jobs_command():
+        """Show the background jobs, their schedules and last runs"""
+        for job in get_scheduler().status():
+            last_run = (
+                f'{job["last_status"]} at {job["last_finished_at"]:%Y-%m-%d %H:%M}'
+                if job['last_finished_at'] else 'never run'
+            )
+            click.echo(f'{job["name"]:<24} {job["schedule"] or "manual":<14} {last_run}')
+    
+    db_cli = AppGroup('db', help='Manage database schema migrations')
+    
+    @db_cli.command('upgrade')
+    @click.argument('revision', default='head')
+    @outlets_option
+    def db_upgrade_command(revision, outlets):
+        """Upgrade the schema to a revision (default: head)"""
+        for _ in _each_outlet(outlets):
+            run_migration_command('upgrade', revision)
+    
+    @db_cli.command('downgrade')
+    @click.argument('revision')
+    @outlets_option
+    def db_downgrade_command(revision, outlets):
+        """Downgrade the schema to a revision"""
+        for _ in _each_outlet(outlets):
+            run_migration_command('downgrade', revision)
+    
+    @db_cli.command('stamp')
+    @click.argument('revision', default='head')
+    @outlets_option
+    def db_stamp_command(revision, outlets):
+        """Mark the schema as being at a revision without running migrations"""
+        for _ in _each_outlet(outlets):
+            run_migration_command('stamp', revision)
+    
+    @db_cli.command('current')
+    @outlets_option
+    def db_current_command(outlets):
+        """Show the revision the database is at"""
+        for _ in _each_outlet(outlets):
+            run_migration_command('current')
+    
+    @db_cli.command('history')
+    def db_history_command():
+        """List the migrations"""
+        run_migration_command('history')
+    
+    @db_cli.command('revision')
+    @click.option('-m', '--message', required=True, help='Short description of the change')
+    @click.option('--autogenerate', is_flag=True, help='Fill in the migration from the models')
+    def db_revision_command(message, autogenerate):
+        """Create a new migration file, comparing against the default outlet's database"""
+        run_migration_command('revision', message=message, autogenerate=autogenerate)
+    
+    app.cli.add_command(db_cli)
@@ -0,0 +1,41 @@
+import os
+
+# Settings presets for create_app(); the environment overrides any of them
+PRESETS = {
+    'development': {
+        'DEBUG': True,
+        # Create and migrate the schema whenever the app starts
+        'DB_AUTO_MIGRATE': True,
+        # Run background jobs only with `flask run-job` or the admin endpoint
+        'SCHEDULER_ENABLED': False
+    },
+    'production': {
+        'DEBUG': False,
+        # Run `flask db upgrade` on deploy instead of on every worker boot
+        'DB_AUTO_MIGRATE': False,
+        # Every worker runs the scheduler; leases keep each job to one of them
+        'SCHEDULER_ENABLED': True
+    }
+}
+
+DEFAULT_PRESET = 'development'
+
+def load_config(config=None):
+    """
+    Resolve the config argument of create_app() into a settings dictionary
+    config is the name of a preset, a mapping of settings, or None to use
+    the APP_ENV preset. Preset values yield to environment variables of the
+    same name, which the init_* functions read for everything left unset.
+    """
+    if config is None:
+        config = os.environ.get('APP_ENV', DEFAULT_PRESET)
+    if isinstance(config, str):
+        if config not in PRESETS:
+            raise RuntimeError(f'Unknown APP_ENV {config!r}; use one of: {", ".join(PRESETS)}')
+        settings = {
+            key: value for key, value in PRESETS[config].items()
+            if key not in os.environ
+        }
+        settings['APP_ENV'] = config
+        return settings
+    return dict(config)
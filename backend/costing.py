@@ -0,0 +1,127 @@
+from database import db
+from models import BahanBaku, Menu, Resep
+from http_cache import get_versions
+from errors import ValidationError
+from outlets import PerOutlet
+import threading
+
+# Tables the costing matrix is built from
+COSTING_TABLES = ('bahan_baku', 'menu', 'resep')
+
+class CostingMatrix:
+    """
+    Sparse menu x ingredient usage matrix for costing every menu at once
+    Each recipe line is one non-zero entry holding jumlah with waste applied,
+    kept as coordinate arrays. Unit costs are the matrix-vector product with
+    a price vector, computed by one np.bincount over the entries.
+    """
+    def __init__(self, menus, bahan, lines):
+        import numpy as np
+        
+        self.menu_ids = [menu.id_menu for menu in menus]
+        self.nama_menu = [menu.nama_menu for menu in menus]
+        self.bahan_ids = [item.id_bahan for item in bahan]
+        self.prices = np.array([item.harga_per_gram for item in bahan], dtype=float)
+        row_of = {id_menu: i for i, id_menu in enumerate(self.menu_ids)}
+        self.column_of = {id_bahan: i for i, id_bahan in enumerate(self.bahan_ids)}
+        
+        # Lines pointing at a missing menu or ingredient cannot be costed
+        lines = [
+            line for line in lines
+            if line.id_menu in row_of and line.id_bahan in self.column_of
+        ]
+        self.rows = np.array([row_of[line.id_menu] for line in lines], dtype=np.intp)
+        self.columns = np.array([self.column_of[line.id_bahan] for line in lines], dtype=np.intp)
+        self.usage = np.array(
+            [line.jumlah * (1 + line.waste_percent / 100) for line in lines], dtype=float
+        )
+    
+    @classmethod
+    def load(cls):
+        menus = db.session.query(Menu.id_menu, Menu.nama_menu).order_by(Menu.id_menu).all()
+        bahan = db.session.query(
+            BahanBaku.id_bahan, BahanBaku.harga_per_gram
+        ).order_by(BahanBaku.id_bahan).all()
+        lines = db.session.query(
+            Resep.id_menu, Resep.id_bahan, Resep.jumlah, Resep.waste_percent
+        ).all()
+        return cls(menus, bahan, lines)
+    
+    def unit_costs(self, prices=None):
+        """Cost of one unit of every menu, in menu_ids order"""
+        import numpy as np
+        
+        prices = self.prices if prices is None else prices
+        return np.bincount(
+            self.rows,
+            weights=self.usage * prices[self.columns],
+            minlength=len(self.menu_ids)
+        )
+    
+    def price_vector(self, overrides):
+        """Current prices with an {id_bahan: harga_per_gram} mapping applied"""
+        prices = self.prices.copy()
+        unknown = sorted(id_bahan for id_bahan in overrides if id_bahan not in self.column_of)
+        if unknown:
+            raise ValidationError(f'Unknown bahan IDs: {", ".join(map(str, unknown))}')
+        for id_bahan, harga in overrides.items():
+            prices[self.column_of[id_bahan]] = harga
+        return prices
+
+class CostingCache:
+    """
+    The costing matrix, rebuilt when the menu, recipe or ingredient tables
+    change
+    It is keyed on the table versions in the database, the same ones the
+    ETag of /menu/costing comes from, so a write made by any worker process
+    replaces the matrix everywhere.
+    """
+    def __init__(self):
+        self._versions = None
+        self._matrix = None
+        self._lock = threading.Lock()
+    
+    def get(self):
+        # Read before the matrix rows, so a matrix is never older than its key
+        versions = get_versions(COSTING_TABLES)
+        key = tuple(versions[name][0] for name in COSTING_TABLES)
+        with self._lock:
+            if self._matrix is not None and self._versions == key:
+                return self._matrix
+        
+        matrix = CostingMatrix.load()
+        with self._lock:
+            self._versions = key
+            self._matrix = matrix
+        return matrix
+
+costing_cache = PerOutlet(CostingCache)
+
+def menu_costing(overrides=None):
+    """
+    Unit cost of every menu, optionally under changed ingredient prices
+    overrides maps id_bahan to a hypothetical harga_per_gram; nothing is saved.
+    Returns: list of dictionaries ordered by id_menu
+    """
+    matrix = costing_cache.get()
+    unit_costs = matrix.unit_costs().tolist()
+    if not overrides:
+        return [
+            {'id_menu': id_menu, 'nama_menu': nama_menu, 'unit_cost': cost}
+            for id_menu, nama_menu, cost in zip(matrix.menu_ids, matrix.nama_menu, unit_costs)
+        ]
+    
+    simulated_costs = matrix.unit_costs(matrix.price_vector(overrides)).tolist()
+    return [
+        {
+            'id_menu': id_menu,
+            'nama_menu': nama_menu,
+            'unit_cost': cost,
+            'simulated_cost': simulated,
+            'difference': simulated - cost,
+            'difference_percent': (simulated - cost) / cost * 100 if cost else None
+        }
+        for id_menu, nama_menu, cost, simulated in zip(
+            matrix.menu_ids, matrix.nama_menu, unit_costs, simulated_costs
+        )
+    ]
@@ -1,18 +1,253 @@
-from flask_sqlalchemy import SQLAlchemy
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, func, insert, orm
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
 from datetime import datetime
+from functools import partial
+from outlets import current_outlet, is_default_outlet, outlet_context
+import os
+import threading
 
-db = SQLAlchemy()
+DEFAULT_DATABASE_URL = 'sqlite:///cafe_inventory.db'
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Request methods that may be served from the read-only engine
+READ_METHODS = ('GET', 'HEAD')
+
+def _env_int(name, default=None):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+def sqlite_pragmas_from_env():
+    """SQLite pragmas applied to every new connection"""
+    return {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000),
+        # Negative cache_size is in KiB rather than pages
+        'cache_size': -_env_int('SQLITE_CACHE_SIZE_KB', 20000),
+        'mmap_size': _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+    }
+
+def engine_options_from_env(uri):
+    """Pool settings for the engine, tuned from the environment"""
+    options = {}
+    pool_size = _env_int('DB_POOL_SIZE')
+    if pool_size:
+        options['pool_size'] = pool_size
+        options['max_overflow'] = _env_int('DB_MAX_OVERFLOW', 10)
+        options['pool_timeout'] = _env_int('DB_POOL_TIMEOUT', 30)
+    pool_recycle = _env_int('DB_POOL_RECYCLE')
+    if pool_recycle:
+        options['pool_recycle'] = pool_recycle
+    
+    if make_url(uri).get_backend_name() == 'sqlite':
+        if pool_size:
+            # SQLAlchemy defaults file databases to NullPool; a queue pool
+            # hands connections between threads, which pysqlite must allow
+            options['poolclass'] = QueuePool
+            options['connect_args'] = {'check_same_thread': False}
+        options['sqlite_pragmas'] = sqlite_pragmas_from_env()
+    
+    return options
+
+def _apply_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+class RoutingSession(SignallingSession):
+    """
+    Session that routes statements to the current outlet's database, and
+    for the default outlet sends reads from GET requests to the read-only
+    engine
+    """
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        outlet = current_outlet()
+        if not is_default_outlet(self.app, outlet):
+            return outlet_engine(self.app, outlet)
+        
+        read_engine = self.app.extensions.get('sqlalchemy_read_engine')
+        if (
+            read_engine is not None
+            and not self._flushing
+            and has_request_context()
+            and request.method in READ_METHODS
+        ):
+            return read_engine
+        return super().get_bind(mapper, clause)
+
+class Database(SQLAlchemy):
+    """SQLAlchemy extension with SQLite tuning and read/write routing"""
+    def create_engine(self, sa_url, engine_opts):
+        pragmas = engine_opts.pop('sqlite_pragmas', None)
+        engine = super().create_engine(sa_url, engine_opts)
+        if pragmas and engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', partial(_apply_pragmas, pragmas))
+        return engine
+    
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+db = Database()
+
+def configure_database(app):
+    """Fill in database settings from the environment unless already set"""
+    uri = app.config.setdefault(
+        'SQLALCHEMY_DATABASE_URI',
+        os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    )
+    app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options_from_env(uri))
+    app.config.setdefault('DATABASE_READ_URL', os.environ.get('DATABASE_READ_URL'))
+
+def resolve_url(app, url):
+    """Parse a database URL, resolving relative SQLite paths the way Flask-SQLAlchemy does"""
+    sa_url = make_url(url)
+    database = sa_url.database
+    if (
+        sa_url.get_backend_name() == 'sqlite'
+        and database
+        and not database.startswith('file:')
+        and not os.path.isabs(database)
+    ):
+        sa_url = sa_url.set(database=os.path.join(app.root_path, database))
+    return sa_url
+
+def init_read_engine(app):
+    """Create the optional read-only engine used by GET requests"""
+    read_url = app.config.get('DATABASE_READ_URL')
+    if not read_url:
+        return
+    
+    options = engine_options_from_env(read_url)
+    pragmas = options.get('sqlite_pragmas')
+    if pragmas:
+        # A read-only connection cannot switch the journal mode
+        pragmas.pop('journal_mode', None)
+    app.extensions['sqlalchemy_read_engine'] = db.create_engine(resolve_url(app, read_url), options)
+
+def outlet_engine(app, outlet):
+    """
+    The engine of an outlet other than the default one, created on first use
+    Each outlet has its own database, so its writes never wait on another
+    outlet's lock.
+    """
+    engines = app.extensions['outlet_engines']
+    engine = engines.get(outlet)
+    if engine is None:
+        with app.extensions['outlet_engines_lock']:
+            engine = engines.get(outlet)
+            if engine is None:
+                url = app.config['OUTLET_DATABASE_URL'].format(outlet=outlet)
+                sa_url = resolve_url(app, url)
+                if sa_url.get_backend_name() == 'sqlite' and sa_url.database:
+                    os.makedirs(os.path.dirname(sa_url.database), exist_ok=True)
+                engine = engines[outlet] = db.create_engine(sa_url, engine_options_from_env(url))
+    return engine
+
+def current_engine():
+    """The write engine of the current outlet"""
+    outlet = current_outlet()
+    if is_default_outlet(current_app, outlet):
+        return db.engine
+    return outlet_engine(current_app._get_current_object(), outlet)
+
+def insert_returning_ids(model, rows):
+    """
+    Insert rows of a model in one round trip and return their new primary
+    keys, in the order of rows
+    PostgreSQL reports the keys with RETURNING; a sequence hands them out
+    in row order, so sorting them lines them up with the rows. Elsewhere
+    the rows go in with one executemany and the keys are read back as the
+    range ending at the new maximum: the insert holds SQLite's write lock
+    until the commit, so the rowids of one statement are contiguous.
+    """
+    if not rows:
+        return []
+    primary_key = model.__mapper__.primary_key[0]
+    if current_engine().dialect.full_returning:
+        return sorted(db.session.execute(
+            insert(model).values(rows).returning(primary_key)
+        ).scalars())
+    db.session.execute(insert(model), rows)
+    last = db.session.query(func.max(primary_key)).scalar()
+    return list(range(last - len(rows) + 1, last + 1))
+
+def each_outlet(app, outlets=None):
+    """
+    Select each outlet in turn, for work that covers all of them
+    The session is removed after each one so that no ORM state leaks from
+    one outlet's database into the next.
+    """
+    for outlet in outlets or app.config['OUTLETS']:
+        with outlet_context(outlet):
+            try:
+                yield outlet
+            finally:
+                db.session.remove()
+
+def migration_config():
+    """Alembic configuration for the current app's database"""
+    # Alembic is only needed when migrating, so serving workers never load it
+    from alembic.config import Config
+    
+    config = Config()
+    config.set_main_option('script_location', MIGRATIONS_DIR)
+    # Config values are interpolated, so a literal % must be doubled
+    config.set_main_option('sqlalchemy.url', str(current_engine().url).replace('%', '%%'))
+    return config
+
+def run_migration_command(name, *args, **kwargs):
+    """Run an Alembic command against the current outlet's database in one transaction"""
+    from alembic import command
+    
+    config = migration_config()
+    with current_engine().begin() as connection:
+        config.attributes['connection'] = connection
+        return getattr(command, name)(config, *args, **kwargs)
+
+def upgrade_db(revision='head'):
+    """Migrate the schema up to a revision (the latest by default)"""
+    run_migration_command('upgrade', revision)
 
 def init_db(app):
     """Initialize the database with SQLAlchemy"""
+    configure_database(app)
+    app.config.setdefault('DB_AUTO_MIGRATE', os.environ.get('DB_AUTO_MIGRATE', '1') == '1')
     db.init_app(app)
+    init_read_engine(app)
+    app.extensions['outlet_engines'] = {}
+    app.extensions['outlet_engines_lock'] = threading.Lock()
     
+    if app.config['DB_AUTO_MIGRATE']:
+        with app.app_context():
+            for _ in each_outlet(app):
+                upgrade_db()
+
+def dispose_engines(app):
+    """
+    Close the pooled connections of the app's engines
+    Called in a preloading server before it forks, so that workers never
+    share a connection opened by the master.
+    """
     with app.app_context():
-        # Create all tables
-        db.create_all()
-        
+        db.engine.dispose()
+    for engine in app.extensions['outlet_engines'].values():
+        engine.dispose()
+    read_engine = app.extensions.get('sqlalchemy_read_engine')
+    if read_engine is not None:
+        read_engine.dispose()
+
 def reset_db(app):
-    """Reset the database (for development purposes)"""
+    """Reset every outlet's database (for development purposes)"""
     with app.app_context():
-        db.drop_all()
-        db.create_all()
+        for _ in each_outlet(app):
+            engine = current_engine()
+            db.Model.metadata.drop_all(bind=engine)
+            with engine.begin() as connection:
+                connection.exec_driver_sql('DROP TABLE IF EXISTS alembic_version')
+            upgrade_db()
@@ -1,4 +1,4 @@
-from flask import jsonify
+from serializers import jsonify
 
 class APIError(Exception):
     """Base class for API errors"""
@@ -7,7 +7,7 @@ class APIError(Exception):
         self.message = message
         self.status_code = status_code
         self.payload = payload
-
+    
     def to_dict(self):
         rv = dict(self.payload or ())
         rv['message'] = self.message
@@ -22,21 +22,21 @@ def init_error_handlers(app):
         response = jsonify(error.to_dict())
         response.status_code = error.status_code
         return response
-
+    
     @app.errorhandler(404)
     def not_found_error(error):
         return jsonify({
             'status': 'error',
             'message': 'Resource not found'
         }), 404
-
+    
     @app.errorhandler(400)
     def bad_request_error(error):
         return jsonify({
             'status': 'error',
             'message': 'Bad request'
         }), 400
-
+    
     @app.errorhandler(500)
     def internal_error(error):
         return jsonify({
@@ -58,3 +58,24 @@ class StockError(APIError):
     """Raised when there's insufficient stock"""
     def __init__(self, message='Insufficient stock'):
         super().__init__(message=message, status_code=400)
+
+class IdempotencyError(APIError):
+    """Raised when an idempotency key is reused for a different request"""
+    def __init__(self, message='Idempotency key already used for a different request'):
+        super().__init__(message=message, status_code=422)
+
+class CatalogImportError(ValidationError):
+    """Raised with every row-level problem when an import catalog is rejected"""
+    def __init__(self, errors):
+        super().__init__(f'Import rejected: {len(errors)} row error(s), nothing was saved')
+        self.payload = {'errors': errors}
+
+class JobRunningError(APIError):
+    """Raised when a background job is started while a run of it holds the lease"""
+    def __init__(self, message='Job is already running'):
+        super().__init__(message=message, status_code=409)
+
+class ForbiddenError(APIError):
+    """Raised when a request lacks the credentials an endpoint requires"""
+    def __init__(self, message='Forbidden'):
+        super().__init__(message=message, status_code=403)
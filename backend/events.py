@@ -0,0 +1,268 @@
+from abc import ABC, abstractmethod
+from collections import deque
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from database import db
+from outlets import current_outlet
+from serializers import dumps
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import weakref
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Sent to a subscriber that missed events and must reload its state
+RESET_EVENT = 'reset'
+
+# Session.info key holding events waiting for the commit
+PENDING_KEY = 'pending_events'
+
+# Brokers to reset in a forked child, e.g. a gunicorn worker of a preloaded app
+_brokers = weakref.WeakSet()
+
+def encode_event(event_id, event_type, data):
+    """Format one server-sent event"""
+    return f'id: {event_id}\nevent: {event_type}\ndata: '.encode() + dumps(data) + b'\n\n'
+
+class Broker(ABC):
+    """
+    Publish/subscribe fan-out for server-sent events
+    Published events go into a bounded ring buffer shared by every
+    subscriber of the process. Publishing is O(1) however many streams are
+    open: each subscriber keeps its own cursor into the buffer and is woken
+    through one condition variable. A subscriber that falls further behind
+    than the buffer, or resumes with an ID from another process, gets a
+    reset event instead. Events carry the outlet they happened at, and a
+    subscriber only receives its own outlet's. Each subscriber holds a
+    server thread, so at most max_subscribers are let in at once.
+    """
+    def __init__(self, buffer_size=1000, max_subscribers=None):
+        self.max_subscribers = max_subscribers
+        self._events = deque(maxlen=buffer_size)
+        self._start_epoch()
+        _brokers.add(self)
+    
+    def _start_epoch(self):
+        # Event IDs are "<epoch>-<sequence>"; the epoch is unique to this broker
+        self.epoch = uuid.uuid4().hex[:8]
+        self._events.clear()
+        self._sequence = 0
+        self._subscribers = 0
+        self._condition = threading.Condition()
+    
+    def after_fork(self):
+        """Start a fresh epoch in a forked child so IDs never clash with the parent's"""
+        self._start_epoch()
+    
+    @abstractmethod
+    def publish(self, event_type, data, outlet=None):
+        """Send an event to every subscriber, in this process or all of them"""
+    
+    def close(self):
+        pass
+    
+    def add_subscriber(self):
+        """Take a subscriber slot; returns False when all are in use"""
+        with self._condition:
+            if self.max_subscribers is not None and self._subscribers >= self.max_subscribers:
+                return False
+            self._subscribers += 1
+            return True
+    
+    def remove_subscriber(self):
+        with self._condition:
+            self._subscribers -= 1
+    
+    def _append(self, event_type, data, outlet=None):
+        with self._condition:
+            self._sequence += 1
+            event_id = f'{self.epoch}-{self._sequence}'
+            self._events.append((outlet, encode_event(event_id, event_type, data)))
+            self._condition.notify_all()
+    
+    def _cursor(self, last_event_id):
+        """Sequence a resumed stream continues after, or None if it cannot resume"""
+        epoch, _, sequence = (last_event_id or '').partition('-')
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        return int(sequence)
+    
+    def listen(self, last_event_id=None, heartbeat=15, outlet=None):
+        """
+        Yield encoded events for one subscriber, forever
+        With an outlet, events of other outlets are skipped. Yields None when
+        nothing was sent for heartbeat seconds so the caller can keep the
+        connection alive.
+        """
+        with self._condition:
+            cursor = self._cursor(last_event_id)
+            reset = last_event_id is not None and (cursor is None or cursor > self._sequence)
+            if cursor is None or reset:
+                cursor = self._sequence
+        if reset:
+            yield encode_event(f'{self.epoch}-{cursor}', RESET_EVENT, {})
+        
+        last_sent = time.monotonic()
+        while True:
+            with self._condition:
+                if cursor == self._sequence:
+                    self._condition.wait(max(0.0, last_sent + heartbeat - time.monotonic()))
+                missed = self._sequence - cursor
+                size = len(self._events)
+                if missed > size:
+                    # Some events already left the buffer
+                    messages = [encode_event(f'{self.epoch}-{self._sequence}', RESET_EVENT, {})]
+                else:
+                    messages = [
+                        message for event_outlet, message in (
+                            self._events[i] for i in range(size - missed, size)
+                        )
+                        if outlet is None or event_outlet in (None, outlet)
+                    ]
+                cursor = self._sequence
+            
+            now = time.monotonic()
+            if messages:
+                last_sent = now
+            elif now - last_sent >= heartbeat:
+                last_sent = now
+                yield None
+            for message in messages:
+                yield message
+
+class InProcessBroker(Broker):
+    """Broker for a single process: publishing appends straight to the buffer"""
+    def publish(self, event_type, data, outlet=None):
+        self._append(event_type, data, outlet)
+
+class RedisBroker(Broker):
+    """
+    Broker for several workers, relaying events through a Redis channel
+    Every process publishes to the channel and a listener thread appends
+    what it receives to the local buffer, so each worker serves its own
+    subscribers from memory.
+    """
+    def __init__(self, url, channel='cafe_inventory:events', buffer_size=1000,
+                 max_subscribers=None):
+        if redis is None:
+            raise RuntimeError('EVENT_BROKER=redis needs the redis package installed')
+        super().__init__(buffer_size, max_subscribers)
+        self.channel = channel
+        self.redis = redis.Redis.from_url(url)
+        self.pubsub = None
+        self._relay_lock = threading.Lock()
+        self._start_relay()
+    
+    def _start_relay(self):
+        with self._relay_lock:
+            if self.pubsub is not None:
+                return
+            self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            self.pubsub.subscribe(self.channel)
+            self.thread = threading.Thread(target=self._relay, name='event-relay', daemon=True)
+            self.thread.start()
+    
+    def after_fork(self):
+        """
+        Leave the parent's subscription to the parent
+        redis-py reconnects after a fork on its own; the child subscribes
+        again when its first stream opens.
+        """
+        super().after_fork()
+        self.pubsub = None
+        self._relay_lock = threading.Lock()
+    
+    def listen(self, last_event_id=None, heartbeat=15, outlet=None):
+        self._start_relay()
+        return super().listen(last_event_id, heartbeat, outlet)
+    
+    def publish(self, event_type, data, outlet=None):
+        self.redis.publish(self.channel, dumps({'type': event_type, 'data': data, 'outlet': outlet}))
+    
+    def _relay(self):
+        for message in self.pubsub.listen():
+            try:
+                event = json.loads(message['data'])
+                self._append(event['type'], event['data'], event.get('outlet'))
+            except (KeyError, TypeError, ValueError):
+                logger.warning('Ignoring malformed event on %s', self.channel)
+    
+    def close(self):
+        if self.pubsub is not None:
+            self.pubsub.close()
+
+def _after_fork_in_child():
+    for broker in list(_brokers):
+        broker.after_fork()
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+def publish(event_type, data):
+    """Publish an event to the stream subscribers; call it after the commit"""
+    broker = current_app.extensions.get('event_broker')
+    if broker is not None:
+        broker.publish(event_type, data, current_outlet())
+
+def publish_on_commit(event_type, data):
+    """Publish an event once the current transaction commits"""
+    db.session.info.setdefault(PENDING_KEY, []).append((event_type, data, current_outlet()))
+
+def _after_commit(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        broker = session.app.extensions.get('event_broker')
+        for event_type, data, outlet in pending:
+            broker.publish(event_type, data, outlet)
+
+def _after_rollback(session):
+    session.info.pop(PENDING_KEY, None)
+
+def init_events(app):
+    """
+    Create the event broker: EVENT_BROKER=memory (default) or redis
+    The memory broker is refused when WEB_CONCURRENCY runs several workers.
+    EVENT_MAX_SUBSCRIBERS caps the open streams per process; it defaults to
+    half of GUNICORN_THREADS so the other threads are left for requests.
+    """
+    app.config.setdefault('EVENT_BROKER', os.environ.get('EVENT_BROKER', 'memory'))
+    app.config.setdefault('EVENT_BUFFER_SIZE', int(os.environ.get('EVENT_BUFFER_SIZE', 1000)))
+    app.config.setdefault('EVENT_HEARTBEAT_SECONDS', 15)
+    app.config.setdefault('EVENT_MAX_SUBSCRIBERS', int(os.environ.get(
+        'EVENT_MAX_SUBSCRIBERS', max(1, int(os.environ.get('GUNICORN_THREADS', 8)) // 2)
+    )))
+    app.config.setdefault('REDIS_URL', os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+    
+    if app.config['EVENT_BROKER'] == 'redis':
+        broker = RedisBroker(
+            app.config['REDIS_URL'],
+            buffer_size=app.config['EVENT_BUFFER_SIZE'],
+            max_subscribers=app.config['EVENT_MAX_SUBSCRIBERS']
+        )
+    elif app.config['EVENT_BROKER'] == 'memory':
+        # Each worker would only stream the events published in that worker
+        if int(os.environ.get('WEB_CONCURRENCY', 1)) > 1:
+            raise RuntimeError(
+                'EVENT_BROKER=memory only works with one worker; '
+                'set EVENT_BROKER=redis or WEB_CONCURRENCY=1'
+            )
+        broker = InProcessBroker(
+            buffer_size=app.config['EVENT_BUFFER_SIZE'],
+            max_subscribers=app.config['EVENT_MAX_SUBSCRIBERS']
+        )
+    else:
+        raise RuntimeError(f'Unknown EVENT_BROKER {app.config["EVENT_BROKER"]!r}')
+    app.extensions['event_broker'] = broker
+    
+    if not event.contains(Session, 'after_commit', _after_commit):
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
@@ -0,0 +1,158 @@
+from database import db
+from models import BahanBaku, Penjualan, LogPemakaian
+from sqlalchemy import func, select
+from outlets import PerOutlet
+from datetime import datetime, timedelta
+from functools import partial
+import threading
+
+class ConsumptionHistory:
+    """
+    Daily ingredient consumption over a rolling window, as a NumPy matrix
+    Rows are ingredients and columns are days, oldest first. The matrix is
+    filled once from the window's usage logs and afterwards only from logs
+    with an id_log above the last one seen, so polling never rescans the log.
+    """
+    def __init__(self, window_days=28):
+        self.window_days = window_days
+        self.reset()
+    
+    def reset(self):
+        self.end_date = None
+        self.last_id_log = None
+        self.row_of = {}
+        # Filled on the first refresh, which also imports NumPy
+        self.usage = None
+        self.lock = threading.Lock()
+    
+    def _row(self, id_bahan):
+        import numpy as np
+        
+        row = self.row_of.get(id_bahan)
+        if row is None:
+            row = self.row_of[id_bahan] = len(self.row_of)
+            self.usage = np.vstack([self.usage, np.zeros((1, self.window_days))])
+        return row
+    
+    def _add(self, rows):
+        """Add (tanggal, id_bahan, amount) rows that fall inside the window"""
+        start_date = self.end_date - timedelta(days=self.window_days - 1)
+        for tanggal, id_bahan, amount in rows:
+            if start_date <= tanggal <= self.end_date:
+                row = self._row(id_bahan)
+                self.usage[row, (tanggal - start_date).days] += amount
+    
+    def _advance(self, today):
+        """Shift the window so that it ends today"""
+        import numpy as np
+        
+        days = (today - self.end_date).days
+        if days <= 0:
+            return
+        if days >= self.window_days:
+            self.usage[:] = 0
+        else:
+            self.usage = np.roll(self.usage, -days, axis=1)
+            self.usage[:, -days:] = 0
+        self.end_date = today
+    
+    def _usage_query(self, *conditions):
+        return select(
+            Penjualan.tanggal,
+            LogPemakaian.id_bahan,
+            func.sum(LogPemakaian.jumlah_terpakai + LogPemakaian.jumlah_waste),
+            func.max(LogPemakaian.id_log)
+        ).join(
+            Penjualan, Penjualan.id_penjualan == LogPemakaian.id_penjualan
+        ).where(*conditions).group_by(Penjualan.tanggal, LogPemakaian.id_bahan)
+    
+    def refresh(self, today=None):
+        """Bring the matrix up to date with the logs written since the last call"""
+        import numpy as np
+        
+        today = today or datetime.utcnow().date()
+        with self.lock:
+            if self.last_id_log is None:
+                self.end_date = today
+                self.usage = np.zeros((0, self.window_days))
+                start_date = today - timedelta(days=self.window_days - 1)
+                rows = db.session.execute(self._usage_query(
+                    Penjualan.tanggal.between(start_date, today)
+                )).all()
+                # Logs outside the window still move the watermark forward
+                self.last_id_log = db.session.query(
+                    func.coalesce(func.max(LogPemakaian.id_log), 0)
+                ).scalar()
+            else:
+                self._advance(today)
+                rows = db.session.execute(self._usage_query(
+                    LogPemakaian.id_log > self.last_id_log
+                )).all()
+                if rows:
+                    self.last_id_log = max(self.last_id_log, max(row[3] for row in rows))
+            self._add((row[0], row[1], row[2]) for row in rows)
+            return self.usage.copy(), dict(self.row_of)
+
+consumption_history = PerOutlet(ConsumptionHistory)
+
+def forecast_stock(lead_time_days, safety_factor, cover_days, today=None):
+    """
+    Forecast days to stockout and reorder points for every ingredient
+    The daily rate is the mean consumption over the window (counted from the
+    first day with any sales), and safety stock is safety_factor standard
+    deviations of daily consumption over the lead time.
+    Returns: list of forecast dictionaries, soonest stockout first
+    """
+    import numpy as np
+    
+    usage, row_of = consumption_history.refresh(today)
+    bahan_list = db.session.query(
+        BahanBaku.id_bahan, BahanBaku.nama_bahan, BahanBaku.satuan, BahanBaku.stok_awal
+    ).order_by(BahanBaku.id_bahan).all()
+    if not bahan_list:
+        return []
+    
+    # Align the history with the ingredient list; ingredients without sales get zeros
+    history = np.zeros((len(bahan_list), usage.shape[1]))
+    for i, bahan in enumerate(bahan_list):
+        row = row_of.get(bahan.id_bahan)
+        if row is not None:
+            history[i] = usage[row]
+    
+    active = np.flatnonzero(history.any(axis=0))
+    if active.size:
+        history = history[:, active[0]:]
+    stock = np.array([bahan.stok_awal for bahan in bahan_list])
+    
+    daily_rate = history.mean(axis=1)
+    deviation = history.std(axis=1)
+    safety_stock = safety_factor * deviation * np.sqrt(lead_time_days)
+    reorder_point = daily_rate * lead_time_days + safety_stock
+    reorder_quantity = np.maximum(reorder_point + daily_rate * cover_days - stock, 0)
+    with np.errstate(divide='ignore'):
+        days_to_stockout = np.where(daily_rate > 0, stock / daily_rate, np.inf)
+    
+    forecasts = [
+        {
+            'id_bahan': bahan.id_bahan,
+            'nama_bahan': bahan.nama_bahan,
+            'satuan': bahan.satuan,
+            'stok': bahan.stok_awal,
+            'daily_rate': float(daily_rate[i]),
+            'days_to_stockout': float(days_to_stockout[i]) if np.isfinite(days_to_stockout[i]) else None,
+            'reorder_point': float(reorder_point[i]),
+            'reorder_quantity': float(reorder_quantity[i]),
+            'needs_reorder': bool(daily_rate[i] > 0 and stock[i] <= reorder_point[i])
+        }
+        for i, bahan in enumerate(bahan_list)
+    ]
+    forecasts.sort(key=lambda f: (f['days_to_stockout'] is None, f['days_to_stockout'] or 0))
+    return forecasts
+
+def init_forecast(app):
+    """Size the consumption window and drop history from a previous app"""
+    app.config.setdefault('FORECAST_WINDOW_DAYS', 28)
+    app.config.setdefault('FORECAST_LEAD_TIME_DAYS', 3)
+    app.config.setdefault('FORECAST_SAFETY_FACTOR', 1.65)
+    app.config.setdefault('FORECAST_COVER_DAYS', 7)
+    consumption_history.reset(partial(ConsumptionHistory, app.config['FORECAST_WINDOW_DAYS']))
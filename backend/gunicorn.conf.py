@@ -0,0 +1,75 @@
+"""
+Gunicorn settings for serving wsgi:app
+
+    gunicorn -c gunicorn.conf.py
+
+Every setting can be changed from the environment. With preloading the app
+is created once in the master and workers fork from it, which makes them
+ready almost at once and shares the imported code between them.
+"""
+import os
+import sys
+
+wsgi_app = 'wsgi:app'
+
+bind = os.environ.get('GUNICORN_BIND', f'0.0.0.0:{os.environ.get("PORT", 8000)}')
+
+# Processes; SQLite serializes writers anyway. One by default, because the
+# memory event broker only reaches its own worker: more need EVENT_BROKER=redis
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# Threads per worker (gthread). Each open /api/stream connection holds one
+# until the client leaves, so size this for the dashboards expected plus
+# the requests at peak. Streams are capped at EVENT_MAX_SUBSCRIBERS, half of
+# this by default; workers warn when that leaves no thread for requests
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers after this many requests (0 keeps them forever)
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+# An empty GUNICORN_ACCESS_LOG turns the access log off
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = os.environ.get('GUNICORN_ERROR_LOG', '-')
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+def when_ready(server):
+    """Close connections the preloaded app opened before any worker forks"""
+    if server.cfg.preload_app:
+        from database import dispose_engines
+        from wsgi import app
+        dispose_engines(app)
+
+def post_worker_init(worker):
+    """
+    Start the background job scheduler as soon as the worker boots, and
+    warn when event streams could take every thread
+    """
+    wsgi = sys.modules.get('wsgi')
+    if wsgi is None:
+        return
+    max_subscribers = wsgi.app.config['EVENT_MAX_SUBSCRIBERS']
+    if max_subscribers >= worker.cfg.threads:
+        worker.log.warning(
+            'EVENT_MAX_SUBSCRIBERS=%d lets event streams take all %d threads; '
+            'raise GUNICORN_THREADS or lower EVENT_MAX_SUBSCRIBERS',
+            max_subscribers, worker.cfg.threads
+        )
+    if wsgi.app.config['SCHEDULER_ENABLED']:
+        wsgi.app.extensions['scheduler'].ensure_started()
+
+def worker_exit(server, worker):
+    """Stop scheduling and flush the worker's queued usage logs before it goes away"""
+    wsgi = sys.modules.get('wsgi')
+    if wsgi is None:
+        return
+    wsgi.app.extensions['scheduler'].shutdown()
+    writer = wsgi.app.extensions.get('usage_log_writer')
+    if writer is not None:
+        writer.drain()
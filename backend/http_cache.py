@@ -0,0 +1,187 @@
+from collections import OrderedDict
+from flask import current_app, make_response, request
+from sqlalchemy import event, insert, inspect, update
+from sqlalchemy.orm import Session
+from database import db
+from models import BahanBaku, TableVersion, STOCK_COLUMNS
+from outlets import current_outlet
+from functools import wraps
+from datetime import datetime
+import hashlib
+import threading
+
+# Tables whose writes change the catalog responses
+TRACKED_TABLES = {'bahan_baku', 'menu', 'resep'}
+
+# Version bumped instead of bahan_baku when a write only moves stock, so
+# sales leave the ETags of menu and costing responses alone
+STOK_VERSION = 'stok'
+
+# Session.info key holding the tables bumped in the current transaction
+BUMPED_KEY = 'http_cache_bumped'
+
+class PayloadCache:
+    """Bounded LRU cache of serialized response bodies keyed by ETag"""
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, etag):
+        with self._lock:
+            entry = self._entries.get(etag)
+            if entry is not None:
+                self._entries.move_to_end(etag)
+            return entry
+    
+    def put(self, etag, body, mimetype):
+        with self._lock:
+            self._entries[etag] = (body, mimetype)
+            self._entries.move_to_end(etag)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+payload_cache = PayloadCache()
+
+def bump_versions(connection, tables):
+    """Increment the version of each table inside the caller's transaction"""
+    now = datetime.utcnow()
+    version_table = TableVersion.__table__
+    for name in sorted(tables):
+        result = connection.execute(
+            update(version_table)
+            .where(version_table.c.name == name)
+            .values(version=version_table.c.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(
+                insert(version_table).values(name=name, version=1, updated_at=now)
+            )
+
+def bump_session_versions(session, tables):
+    """Bump versions in the session's transaction, remembering them until it ends"""
+    session.info.setdefault(BUMPED_KEY, set()).update(tables)
+    bump_versions(session.connection(), tables)
+
+def has_uncommitted_versions(session, tables):
+    """Whether the session's open transaction bumped any of the tables"""
+    return not session.info.get(BUMPED_KEY, set()).isdisjoint(tables)
+
+def get_versions(tables):
+    """
+    Read the current version of each table in one query
+    Returns: dictionary of table name to (version, updated_at)
+    """
+    rows = db.session.query(
+        TableVersion.name, TableVersion.version, TableVersion.updated_at
+    ).filter(TableVersion.name.in_(tables)).all()
+    versions = {name: (0, None) for name in tables}
+    versions.update((name, (version, updated_at)) for name, version, updated_at in rows)
+    return versions
+
+def _stock_only(obj):
+    """Whether a flushed BahanBaku only had its stock columns changed"""
+    return all(
+        attr.key in STOCK_COLUMNS or not attr.history.has_changes()
+        for attr in inspect(obj).attrs
+    )
+
+def _after_flush(session, flush_context):
+    """Bump the version of every tracked table the flush wrote to"""
+    tables = set()
+    for obj in session.new | session.dirty | session.deleted:
+        table = obj.__table__.name
+        if table not in TRACKED_TABLES:
+            continue
+        if isinstance(obj, BahanBaku) and obj in session.dirty and _stock_only(obj):
+            tables.add(STOK_VERSION)
+        else:
+            tables.add(table)
+    if tables:
+        bump_session_versions(session, tables)
+
+def _after_bulk_update(update_context):
+    """Bump the version after query.update(), e.g. stock usage"""
+    table = update_context.mapper.local_table.name
+    if table not in TRACKED_TABLES:
+        return
+    keys = {getattr(key, 'key', key) for key in update_context.values}
+    if update_context.mapper.class_ is BahanBaku and keys <= STOCK_COLUMNS:
+        table = STOK_VERSION
+    bump_session_versions(update_context.session, {table})
+
+def _after_bulk_delete(delete_context):
+    table = delete_context.mapper.local_table.name
+    if table in TRACKED_TABLES:
+        bump_session_versions(delete_context.session, {table})
+
+def _end_transaction(session):
+    session.info.pop(BUMPED_KEY, None)
+
+def conditional(*tables):
+    """
+    Serve a GET view with a strong ETag and Last-Modified derived from the
+    versions of the tables it reads
+    A matching If-None-Match (or If-Modified-Since) gets a 304 after the
+    single version lookup, and unchanged payloads are replayed from the
+    payload cache instead of being queried and serialized again.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = get_versions(tables)
+            # Outlets share paths and version numbers but not data
+            signature = f'{current_outlet()}|{request.full_path}|' + ','.join(
+                f'{name}:{versions[name][0]}' for name in sorted(versions)
+            )
+            etag = hashlib.sha1(signature.encode()).hexdigest()
+            timestamps = [updated_at for _, updated_at in versions.values() if updated_at]
+            last_modified = max(timestamps).replace(microsecond=0) if timestamps else None
+            
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = (
+                    since is not None
+                    and last_modified is not None
+                    and last_modified <= since.replace(tzinfo=None)
+                )
+            
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                cached = payload_cache.get(etag)
+                if cached is not None:
+                    body, mimetype = cached
+                    response = current_app.response_class(body, mimetype=mimetype)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    payload_cache.put(etag, response.get_data(), response.mimetype)
+            
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # Let clients keep the body but revalidate it on every use
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def init_http_cache(app):
+    """Size the payload cache and track writes to the catalog tables"""
+    payload_cache.maxsize = app.config.get('HTTP_CACHE_SIZE', 256)
+    payload_cache.clear()
+    
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'after_bulk_update', _after_bulk_update)
+        event.listen(Session, 'after_bulk_delete', _after_bulk_delete)
+        event.listen(Session, 'after_commit', _end_transaction)
+        event.listen(Session, 'after_rollback', _end_transaction)
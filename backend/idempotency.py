@@ -0,0 +1,116 @@
+from flask import current_app, g, request
+from sqlalchemy.exc import IntegrityError
+from database import db
+from models import IdempotencyKey
+from errors import IdempotencyError, ValidationError
+from serializers import dumps
+from functools import wraps
+from datetime import datetime, timedelta
+import hashlib
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+# Longest key a client may send; it is the primary key of the key table
+MAX_KEY_LENGTH = 255
+
+def _request_hash():
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+def _is_live(record, request_hash):
+    """Whether a stored key still applies; raises if it was used for a different request"""
+    if record is None or record.expires_at <= datetime.utcnow():
+        return False
+    if record.request_hash != request_hash:
+        raise IdempotencyError(
+            f'Idempotency-Key {record.key!r} was already used for a different request'
+        )
+    return True
+
+def _replay(record):
+    response = current_app.response_class(
+        record.response,
+        status=record.status_code,
+        mimetype='application/json'
+    )
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def idempotent(view):
+    """
+    Make a write endpoint safe to retry with an Idempotency-Key header
+    The first request runs normally and its response is stored, in the same
+    transaction, by remember_response(). Repeats of the key within the TTL
+    get the stored response back without the view running again.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise ValidationError(
+                f'{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters'
+            )
+        
+        request_hash = _request_hash()
+        record = IdempotencyKey.query.get(key)
+        if _is_live(record, request_hash):
+            return _replay(record)
+        
+        expired = record is not None
+        if expired:
+            # remember_response() replaces it with a new row
+            db.session.expunge(record)
+        g.idempotency = (key, request_hash, expired)
+        try:
+            return view(*args, **kwargs)
+        except IntegrityError:
+            # A concurrent request with the same key committed first
+            db.session.rollback()
+            record = IdempotencyKey.query.get(key)
+            if not _is_live(record, request_hash):
+                raise
+            return _replay(record)
+    return wrapper
+
+def remember_response(body, status_code):
+    """Store the response for the current Idempotency-Key before the commit"""
+    idempotency = g.pop('idempotency', None)
+    if idempotency is None:
+        return
+    
+    key, request_hash, expired = idempotency
+    now = datetime.utcnow()
+    if expired:
+        # Delete and insert rather than update, so a concurrent request that
+        # also found the key expired still fails on the primary key
+        IdempotencyKey.query.filter(
+            IdempotencyKey.key == key,
+            IdempotencyKey.expires_at <= now
+        ).delete(synchronize_session=False)
+    ttl = timedelta(hours=current_app.config['IDEMPOTENCY_TTL_HOURS'])
+    db.session.add(IdempotencyKey(
+        key=key,
+        request_hash=request_hash,
+        status_code=status_code,
+        response=dumps(body).decode(),
+        expires_at=now + ttl
+    ))
+
+def purge_expired_keys():
+    """
+    Delete idempotency keys past their TTL
+    Returns: number of keys deleted
+    """
+    deleted = IdempotencyKey.query.filter(
+        IdempotencyKey.expires_at <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+def init_idempotency(app):
+    """Read how long idempotency keys are kept"""
+    app.config.setdefault('IDEMPOTENCY_TTL_HOURS', 24)
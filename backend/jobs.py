@@ -0,0 +1,89 @@
+from flask import current_app
+from sqlalchemy import text
+from database import current_engine, each_outlet
+from rollup import rebuild_rollup
+from idempotency import purge_expired_keys
+from stock_ledger import take_snapshots
+from datetime import datetime, timedelta
+
+def _for_each_outlet(work):
+    """Run work once per outlet; returns a dictionary of outlet -> result"""
+    app = current_app._get_current_object()
+    return {outlet: work() for outlet in each_outlet(app)}
+
+def _autocommit():
+    """Connection outside a transaction, which VACUUM and some pragmas need"""
+    return current_engine().connect().execution_options(isolation_level='AUTOCOMMIT')
+
+def _database_size(connection):
+    page_count = connection.execute(text('PRAGMA page_count')).scalar()
+    page_size = connection.execute(text('PRAGMA page_size')).scalar()
+    return page_count * page_size
+
+def daily_closing():
+    """
+    Close yesterday's sales: rebuild its rollup from Penjualan and
+    LogPemakaian, then snapshot the stock
+    The rollup is kept up to date by every sale; rebuilding the closed day
+    settles anything written around midnight or edited afterwards.
+    """
+    yesterday = datetime.utcnow().date() - timedelta(days=1)
+    
+    def close():
+        days = rebuild_rollup(yesterday, yesterday)
+        return {'tanggal': yesterday, 'days': days, 'snapshots': take_snapshots()}
+    return _for_each_outlet(close)
+
+def snapshot_stok():
+    """Snapshot the stock of ingredients that moved since their last snapshot"""
+    return _for_each_outlet(lambda: {'snapshots': take_snapshots()})
+
+def purge_idempotency_keys():
+    """Delete idempotency keys past their TTL"""
+    return _for_each_outlet(lambda: {'deleted': purge_expired_keys()})
+
+def optimize_db():
+    """
+    Refresh the planner statistics; on SQLite also fold the WAL back into
+    the database file so it stops growing
+    """
+    def optimize():
+        with _autocommit() as connection:
+            connection.execute(text('ANALYZE'))
+            if connection.dialect.name != 'sqlite':
+                return {'analyzed': True}
+            busy, wal_pages, checkpointed = connection.execute(
+                text('PRAGMA wal_checkpoint(TRUNCATE)')
+            ).one()
+            return {
+                'analyzed': True,
+                'wal_pages': wal_pages,
+                'checkpointed': checkpointed,
+                'busy': bool(busy)
+            }
+    return _for_each_outlet(optimize)
+
+def vacuum_db():
+    """Rebuild SQLite databases to return the space of deleted rows"""
+    def vacuum():
+        with _autocommit() as connection:
+            if connection.dialect.name != 'sqlite':
+                return {'skipped': 'autovacuum handles this outside SQLite'}
+            size_before = _database_size(connection)
+            connection.execute(text('VACUUM'))
+            return {'size_before': size_before, 'size_after': _database_size(connection)}
+    return _for_each_outlet(vacuum)
+
+# (name, function, default cron schedule in UTC, description)
+DEFAULT_JOBS = [
+    ('daily-closing', daily_closing, '10 0 * * *',
+     "Rebuild yesterday's rollup and snapshot the stock"),
+    ('snapshot-stok', snapshot_stok, '0 * * * *',
+     'Snapshot the stock of ingredients that moved'),
+    ('purge-idempotency-keys', purge_idempotency_keys, '15 * * * *',
+     'Delete expired idempotency keys'),
+    ('optimize-db', optimize_db, '45 3 * * *',
+     'Refresh planner statistics and checkpoint the WAL'),
+    ('vacuum-db', vacuum_db, '30 4 * * 0',
+     'Rebuild SQLite databases to reclaim free space')
+]
@@ -0,0 +1,202 @@
+from flask import Response, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from functools import wraps
+import os
+import threading
+import time
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_local = threading.local()
+
+class Histogram:
+    """Cumulative histogram in the Prometheus bucket layout"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+class RouteStats:
+    """Everything recorded for one endpoint and method"""
+    def __init__(self):
+        self.latency = Histogram()
+        self.responses = {}
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.serialization_seconds = 0.0
+
+class MetricsRegistry:
+    """Per-process request metrics, keyed by (endpoint, method)"""
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+    
+    def record(self, endpoint, method, status, seconds, sql_queries, sql_seconds,
+               serialization_seconds):
+        with self._lock:
+            stats = self._routes.get((endpoint, method))
+            if stats is None:
+                stats = self._routes[(endpoint, method)] = RouteStats()
+            stats.latency.observe(seconds)
+            stats.responses[status] = stats.responses.get(status, 0) + 1
+            stats.sql_queries += sql_queries
+            stats.sql_seconds += sql_seconds
+            stats.serialization_seconds += serialization_seconds
+    
+    def render(self):
+        """Render every metric in the Prometheus text exposition format"""
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = [
+                '# HELP http_request_duration_seconds Request latency by endpoint',
+                '# TYPE http_request_duration_seconds histogram'
+            ]
+            for (endpoint, method), stats in routes:
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                cumulative = 0
+                for bound, count in zip(stats.latency.buckets, stats.latency.counts):
+                    cumulative += count
+                    lines.append(
+                        f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}'
+                    )
+                lines.append(
+                    f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.latency.count}'
+                )
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {stats.latency.sum}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {stats.latency.count}')
+            
+            lines.append('# HELP http_requests_total Responses by endpoint and status')
+            lines.append('# TYPE http_requests_total counter')
+            for (endpoint, method), stats in routes:
+                for status, count in sorted(stats.responses.items()):
+                    lines.append(
+                        f'http_requests_total{{endpoint="{endpoint}",method="{method}",'
+                        f'status="{status}"}} {count}'
+                    )
+            
+            counters = (
+                ('db_queries_total', 'SQL statements executed', 'sql_queries'),
+                ('db_query_duration_seconds_total', 'Time spent in SQL', 'sql_seconds'),
+                ('serialization_duration_seconds_total', 'Time spent in to_dict()',
+                 'serialization_seconds')
+            )
+            for name, help_text, attribute in counters:
+                lines.append(f'# HELP {name} {help_text} by endpoint')
+                lines.append(f'# TYPE {name} counter')
+                for (endpoint, method), stats in routes:
+                    lines.append(
+                        f'{name}{{endpoint="{endpoint}",method="{method}"}} '
+                        f'{getattr(stats, attribute)}'
+                    )
+            
+            return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+class RequestTimings:
+    """Counters collected while one request is being handled"""
+    __slots__ = ('start', 'sql_queries', 'sql_seconds', 'serialization_seconds',
+                 'serialization_depth')
+    
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.serialization_depth = 0
+
+def timed_serialization(to_dict):
+    """Add the time spent in a to_dict() method to the current request"""
+    @wraps(to_dict)
+    def wrapper(*args, **kwargs):
+        timings = getattr(_local, 'timings', None)
+        if timings is None:
+            return to_dict(*args, **kwargs)
+        
+        # Nested to_dict() calls are already covered by the outermost one
+        timings.serialization_depth += 1
+        start = time.perf_counter()
+        try:
+            return to_dict(*args, **kwargs)
+        finally:
+            timings.serialization_depth -= 1
+            if timings.serialization_depth == 0:
+                timings.serialization_seconds += time.perf_counter() - start
+    return wrapper
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_local, 'timings', None) is not None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = getattr(_local, 'timings', None)
+    if timings is None:
+        return
+    starts = conn.info.get('query_start')
+    if starts:
+        timings.sql_seconds += time.perf_counter() - starts.pop()
+    timings.sql_queries += 1
+
+def init_metrics(app):
+    """Instrument requests and SQL, and expose the results at /metrics"""
+    app.config.setdefault('METRICS_ENABLED', os.environ.get('METRICS_ENABLED', '1') != '0')
+    slow_ms = os.environ.get('SLOW_REQUEST_MS')
+    app.config.setdefault('SLOW_REQUEST_MS', float(slow_ms) if slow_ms else None)
+    
+    if not app.config['METRICS_ENABLED']:
+        return
+    
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    
+    @app.before_request
+    def start_request_timer():
+        _local.timings = RequestTimings()
+    
+    @app.after_request
+    def record_request_metrics(response):
+        timings = getattr(_local, 'timings', None)
+        _local.timings = None
+        if timings is None:
+            return response
+        
+        seconds = time.perf_counter() - timings.start
+        endpoint = request.endpoint or 'unmatched'
+        registry.record(
+            endpoint,
+            request.method,
+            response.status_code,
+            seconds,
+            timings.sql_queries,
+            timings.sql_seconds,
+            timings.serialization_seconds
+        )
+        
+        slow_ms = app.config['SLOW_REQUEST_MS']
+        if slow_ms is not None and seconds * 1000 >= slow_ms:
+            app.logger.warning(
+                'Slow request: %s %s took %.1f ms (%d queries, %.1f ms SQL, %.1f ms to_dict)',
+                request.method,
+                request.full_path.rstrip('?'),
+                seconds * 1000,
+                timings.sql_queries,
+                timings.sql_seconds * 1000,
+                timings.serialization_seconds * 1000
+            )
+        return response
+    
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
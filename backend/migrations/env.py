@@ -0,0 +1,43 @@
+"""Alembic environment for the cafe inventory database"""
+from alembic import context
+from sqlalchemy import create_engine
+from database import db
+import models  # noqa: F401 - registers the tables on db.metadata
+
+config = context.config
+target_metadata = db.metadata
+
+def _configure(**kwargs):
+    context.configure(
+        target_metadata=target_metadata,
+        # SQLite cannot ALTER most things in place; batch mode copies the table
+        render_as_batch=True,
+        compare_type=True,
+        **kwargs
+    )
+
+def run_migrations_offline():
+    """Emit the migration SQL without connecting to the database"""
+    _configure(url=config.get_main_option('sqlalchemy.url'), literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+def _run(connection):
+    _configure(connection=connection)
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    """Run migrations on the connection handed over by database.migrate()"""
+    connection = config.attributes.get('connection')
+    if connection is not None:
+        _run(connection)
+        return
+    engine = create_engine(config.get_main_option('sqlalchemy.url'))
+    with engine.connect() as connection:
+        _run(connection)
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
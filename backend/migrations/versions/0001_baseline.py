@@ -0,0 +1,107 @@
+"""Baseline schema
+
+Creates the tables that create_all() used to build at startup. Databases
+created before migrations existed already have them, so each table is only
+created when it is missing and such databases simply adopt this revision.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def _create_table(name, *columns):
+    if not sa.inspect(op.get_bind()).has_table(name):
+        op.create_table(name, *columns)
+
+def upgrade():
+    _create_table(
+        'bahan_baku',
+        sa.Column('id_bahan', sa.Integer(), primary_key=True),
+        sa.Column('nama_bahan', sa.String(100), nullable=False),
+        sa.Column('satuan', sa.String(20), nullable=False),
+        sa.Column('stok_awal', sa.Float(), nullable=False),
+        sa.Column('harga_per_gram', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime()),
+        sa.Column('updated_at', sa.DateTime())
+    )
+    _create_table(
+        'menu',
+        sa.Column('id_menu', sa.Integer(), primary_key=True),
+        sa.Column('nama_menu', sa.String(100), nullable=False),
+        sa.Column('created_at', sa.DateTime()),
+        sa.Column('updated_at', sa.DateTime())
+    )
+    _create_table(
+        'resep',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('id_menu', sa.Integer(), sa.ForeignKey('menu.id_menu'), nullable=False),
+        sa.Column('id_bahan', sa.Integer(), sa.ForeignKey('bahan_baku.id_bahan'), nullable=False),
+        sa.Column('jumlah', sa.Float(), nullable=False),
+        sa.Column('waste_percent', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime()),
+        sa.Column('updated_at', sa.DateTime())
+    )
+    _create_table(
+        'penjualan',
+        sa.Column('id_penjualan', sa.Integer(), primary_key=True),
+        sa.Column('id_menu', sa.Integer(), sa.ForeignKey('menu.id_menu'), nullable=False),
+        sa.Column('tanggal', sa.Date(), nullable=False),
+        sa.Column('jumlah_terjual', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime())
+    )
+    _create_table(
+        'log_pemakaian',
+        sa.Column('id_log', sa.Integer(), primary_key=True),
+        sa.Column('id_penjualan', sa.Integer(), sa.ForeignKey('penjualan.id_penjualan'), nullable=False),
+        sa.Column('id_bahan', sa.Integer(), sa.ForeignKey('bahan_baku.id_bahan'), nullable=False),
+        sa.Column('jumlah_terpakai', sa.Float(), nullable=False),
+        sa.Column('jumlah_waste', sa.Float(), nullable=False),
+        sa.Column('total_cost', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime())
+    )
+    _create_table(
+        'rekap_harian_menu',
+        sa.Column('tanggal', sa.Date(), primary_key=True),
+        sa.Column('id_menu', sa.Integer(), primary_key=True),
+        sa.Column('jumlah_transaksi', sa.Integer(), nullable=False),
+        sa.Column('jumlah_terjual', sa.Integer(), nullable=False),
+        sa.Column('jumlah_terpakai', sa.Float(), nullable=False),
+        sa.Column('jumlah_waste', sa.Float(), nullable=False),
+        sa.Column('total_cost', sa.Float(), nullable=False)
+    )
+    _create_table(
+        'rekap_harian_bahan',
+        sa.Column('tanggal', sa.Date(), primary_key=True),
+        sa.Column('id_bahan', sa.Integer(), primary_key=True),
+        sa.Column('jumlah_terpakai', sa.Float(), nullable=False),
+        sa.Column('jumlah_waste', sa.Float(), nullable=False),
+        sa.Column('total_cost', sa.Float(), nullable=False)
+    )
+    _create_table(
+        'table_version',
+        sa.Column('name', sa.String(50), primary_key=True),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime())
+    )
+    _create_table(
+        'idempotency_key',
+        sa.Column('key', sa.String(255), primary_key=True),
+        sa.Column('request_hash', sa.String(64), nullable=False),
+        sa.Column('status_code', sa.Integer(), nullable=False),
+        sa.Column('response', sa.Text(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False)
+    )
+
+def downgrade():
+    for name in (
+        'idempotency_key', 'table_version', 'rekap_harian_bahan', 'rekap_harian_menu',
+        'log_pemakaian', 'penjualan', 'resep', 'menu', 'bahan_baku'
+    ):
+        op.drop_table(name)
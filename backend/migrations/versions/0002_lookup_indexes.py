@@ -0,0 +1,41 @@
+"""Add indexes for the lookups that scanned whole tables
+
+penjualan(tanggal, id_menu) serves the date filters and keyset pages of
+sales. log_pemakaian(id_penjualan, id_bahan) serves lookups by sale (it also
+covers log_pemakaian(id_penjualan) on its own), log_pemakaian(id_bahan,
+created_at) ingredient usage over time, and resep(id_menu) loading recipes.
+Some databases already got a few of these from the startup index pass that
+preceded migrations, so existing indexes are left alone.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_penjualan_tanggal_id_menu', 'penjualan', ['tanggal', 'id_menu']),
+    ('ix_log_pemakaian_id_penjualan_id_bahan', 'log_pemakaian', ['id_penjualan', 'id_bahan']),
+    ('ix_log_pemakaian_id_bahan_id_penjualan', 'log_pemakaian', ['id_bahan', 'id_penjualan']),
+    ('ix_log_pemakaian_id_bahan_created_at', 'log_pemakaian', ['id_bahan', 'created_at']),
+    ('ix_resep_id_menu', 'resep', ['id_menu']),
+    ('ix_idempotency_key_expires_at', 'idempotency_key', ['expires_at']),
+]
+
+def _existing_indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        if name not in _existing_indexes(table):
+            op.create_index(name, table, columns)
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,60 @@
+"""Add the stock movement ledger and stock snapshots
+
+Every ingredient gets an opening ledger row holding its current stock, so
+point-in-time stock is known from this migration onwards.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+from datetime import datetime
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'mutasi_stok',
+        sa.Column('id_mutasi', sa.Integer(), primary_key=True),
+        sa.Column('id_bahan', sa.Integer(), sa.ForeignKey('bahan_baku.id_bahan'), nullable=False),
+        sa.Column('jenis', sa.String(20), nullable=False),
+        sa.Column('jumlah', sa.Float(), nullable=False),
+        sa.Column('keterangan', sa.String(255)),
+        sa.Column('created_at', sa.DateTime(), nullable=False)
+    )
+    op.create_index('ix_mutasi_stok_id_bahan_id_mutasi', 'mutasi_stok', ['id_bahan', 'id_mutasi'])
+    op.create_table(
+        'snapshot_stok',
+        sa.Column('id_snapshot', sa.Integer(), primary_key=True),
+        sa.Column('id_bahan', sa.Integer(), sa.ForeignKey('bahan_baku.id_bahan'), nullable=False),
+        sa.Column('stok', sa.Float(), nullable=False),
+        sa.Column('id_mutasi_terakhir', sa.Integer(), nullable=False),
+        sa.Column('diambil_pada', sa.DateTime(), nullable=False)
+    )
+    op.create_index('ix_snapshot_stok_id_bahan_diambil_pada', 'snapshot_stok', ['id_bahan', 'diambil_pada'])
+    
+    bahan_baku = sa.table('bahan_baku', sa.column('id_bahan'), sa.column('stok_awal'))
+    mutasi_stok = sa.table(
+        'mutasi_stok', sa.column('id_bahan'), sa.column('jenis'), sa.column('jumlah'),
+        sa.column('keterangan'), sa.column('created_at', sa.DateTime())
+    )
+    op.execute(mutasi_stok.insert().from_select(
+        ['id_bahan', 'jenis', 'jumlah', 'keterangan', 'created_at'],
+        sa.select(
+            bahan_baku.c.id_bahan,
+            sa.literal('awal'),
+            bahan_baku.c.stok_awal,
+            sa.literal('Saldo awal ledger'),
+            sa.literal(datetime.utcnow(), sa.DateTime())
+        )
+    ))
+
+def downgrade():
+    op.drop_index('ix_snapshot_stok_id_bahan_diambil_pada', table_name='snapshot_stok')
+    op.drop_table('snapshot_stok')
+    op.drop_index('ix_mutasi_stok_id_bahan_id_mutasi', table_name='mutasi_stok')
+    op.drop_table('mutasi_stok')
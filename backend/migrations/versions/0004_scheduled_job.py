@@ -0,0 +1,33 @@
+"""Add the scheduled job lease table
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'scheduled_job',
+        sa.Column('name', sa.String(64), primary_key=True),
+        sa.Column('slot', sa.DateTime()),
+        sa.Column('owner', sa.String(128)),
+        sa.Column('lease_until', sa.DateTime()),
+        sa.Column('last_started_at', sa.DateTime()),
+        sa.Column('last_finished_at', sa.DateTime()),
+        sa.Column('last_status', sa.String(20)),
+        sa.Column('last_duration_ms', sa.Float()),
+        sa.Column('last_error', sa.Text()),
+        sa.Column('last_result', sa.Text()),
+        sa.Column('run_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_duration_ms', sa.Float(), nullable=False, server_default='0')
+    )
+
+def downgrade():
+    op.drop_table('scheduled_job')
@@ -1,5 +1,19 @@
 from database import db
+from metrics import timed_serialization
 from datetime import datetime
+from sqlalchemy.orm import selectinload
+
+def project(data, fields):
+    """Keep only the requested fields of a serialized record"""
+    if fields is None:
+        return data
+    return {key: value for key, value in data.items() if key in fields}
+
+# BahanBaku columns that sales change; catalog views leave them out
+STOCK_COLUMNS = {'stok_awal', 'updated_at'}
+
+# BahanBaku fields embedded in menu recipes, which must not move with stock
+BAHAN_CATALOG_FIELDS = ('id_bahan', 'nama_bahan', 'satuan', 'harga_per_gram', 'created_at')
 
 class BahanBaku(db.Model):
     """Model for raw materials (bahan baku)"""
@@ -13,8 +27,9 @@ class BahanBaku(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    def to_dict(self):
-        return {
+    @timed_serialization
+    def to_dict(self, fields=None):
+        return project({
             'id_bahan': self.id_bahan,
             'nama_bahan': self.nama_bahan,
             'satuan': self.satuan,
@@ -22,7 +37,7 @@ class BahanBaku(db.Model):
             'harga_per_gram': self.harga_per_gram,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
-        }
+        }, fields)
 
 class Menu(db.Model):
     """Model for menu items"""
@@ -36,18 +51,37 @@ class Menu(db.Model):
     # Relationship with Resep
     resep = db.relationship('Resep', backref='menu', lazy=True, cascade='all, delete-orphan')
 
-    def to_dict(self):
-        return {
+    @classmethod
+    def query_with_resep(cls):
+        """Query menus with their recipes and ingredients loaded up front"""
+        return cls.query.options(
+            selectinload(cls.resep).joinedload(Resep.bahan)
+        )
+
+    @timed_serialization
+    def to_dict(self, fields=None, bahan_index=None):
+        """
+        Serialize the menu, expanding its recipe when included
+        With a bahan_index dictionary, recipe lines refer to their ingredient
+        by id_bahan and each ingredient is serialized into the index once.
+        """
+        data = {
             'id_menu': self.id_menu,
             'nama_menu': self.nama_menu,
-            'resep': [r.to_dict() for r in self.resep],
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
+        # Only expand the recipe when it was asked for
+        if fields is None or 'resep' in fields:
+            data['resep'] = [r.to_dict(bahan_index) for r in self.resep]
+        return project(data, fields)
 
 class Resep(db.Model):
     """Model for recipes"""
     __tablename__ = 'resep'
+    __table_args__ = (
+        db.Index('ix_resep_id_menu', 'id_menu'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     id_menu = db.Column(db.Integer, db.ForeignKey('menu.id_menu'), nullable=False)
@@ -60,21 +94,29 @@ class Resep(db.Model):
     # Relationship with BahanBaku
     bahan = db.relationship('BahanBaku')
 
-    def to_dict(self):
-        return {
+    @timed_serialization
+    def to_dict(self, bahan_index=None):
+        data = {
             'id': self.id,
             'id_menu': self.id_menu,
             'id_bahan': self.id_bahan,
             'jumlah': self.jumlah,
             'waste_percent': self.waste_percent,
-            'bahan': self.bahan.to_dict(),
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
+        if bahan_index is None:
+            data['bahan'] = self.bahan.to_dict(BAHAN_CATALOG_FIELDS)
+        elif self.id_bahan not in bahan_index:
+            bahan_index[self.id_bahan] = self.bahan.to_dict(BAHAN_CATALOG_FIELDS)
+        return data
 
 class Penjualan(db.Model):
     """Model for sales records"""
     __tablename__ = 'penjualan'
+    __table_args__ = (
+        db.Index('ix_penjualan_tanggal_id_menu', 'tanggal', 'id_menu'),
+    )
     
     id_penjualan = db.Column(db.Integer, primary_key=True)
     id_menu = db.Column(db.Integer, db.ForeignKey('menu.id_menu'), nullable=False)
@@ -85,18 +127,24 @@ class Penjualan(db.Model):
     # Relationship with Menu
     menu = db.relationship('Menu')
     
-    def to_dict(self):
-        return {
+    @timed_serialization
+    def to_dict(self, fields=None):
+        return project({
             'id_penjualan': self.id_penjualan,
             'id_menu': self.id_menu,
             'tanggal': self.tanggal.isoformat(),
             'jumlah_terjual': self.jumlah_terjual,
             'created_at': self.created_at.isoformat()
-        }
+        }, fields)
 
 class LogPemakaian(db.Model):
     """Model for usage logs"""
     __tablename__ = 'log_pemakaian'
+    __table_args__ = (
+        db.Index('ix_log_pemakaian_id_penjualan_id_bahan', 'id_penjualan', 'id_bahan'),
+        db.Index('ix_log_pemakaian_id_bahan_id_penjualan', 'id_bahan', 'id_penjualan'),
+        db.Index('ix_log_pemakaian_id_bahan_created_at', 'id_bahan', 'created_at'),
+    )
     
     id_log = db.Column(db.Integer, primary_key=True)
     id_penjualan = db.Column(db.Integer, db.ForeignKey('penjualan.id_penjualan'), nullable=False)
@@ -110,6 +158,7 @@ class LogPemakaian(db.Model):
     penjualan = db.relationship('Penjualan')
     bahan = db.relationship('BahanBaku')
     
+    @timed_serialization
     def to_dict(self):
         return {
             'id_log': self.id_log,
@@ -120,3 +169,124 @@ class LogPemakaian(db.Model):
             'total_cost': self.total_cost,
             'created_at': self.created_at.isoformat()
         }
+
+class RekapHarianMenu(db.Model):
+    """Model for daily sales totals per menu, maintained with every sale"""
+    __tablename__ = 'rekap_harian_menu'
+    
+    tanggal = db.Column(db.Date, primary_key=True)
+    id_menu = db.Column(db.Integer, primary_key=True)
+    jumlah_transaksi = db.Column(db.Integer, nullable=False, default=0)
+    jumlah_terjual = db.Column(db.Integer, nullable=False, default=0)
+    jumlah_terpakai = db.Column(db.Float, nullable=False, default=0)
+    jumlah_waste = db.Column(db.Float, nullable=False, default=0)
+    total_cost = db.Column(db.Float, nullable=False, default=0)
+    
+    @timed_serialization
+    def to_dict(self):
+        return {
+            'tanggal': self.tanggal.isoformat(),
+            'id_menu': self.id_menu,
+            'jumlah_transaksi': self.jumlah_transaksi,
+            'jumlah_terjual': self.jumlah_terjual,
+            'jumlah_terpakai': self.jumlah_terpakai,
+            'jumlah_waste': self.jumlah_waste,
+            'total_cost': self.total_cost
+        }
+
+class RekapHarianBahan(db.Model):
+    """Model for daily ingredient usage totals, maintained with every sale"""
+    __tablename__ = 'rekap_harian_bahan'
+    
+    tanggal = db.Column(db.Date, primary_key=True)
+    id_bahan = db.Column(db.Integer, primary_key=True)
+    jumlah_terpakai = db.Column(db.Float, nullable=False, default=0)
+    jumlah_waste = db.Column(db.Float, nullable=False, default=0)
+    total_cost = db.Column(db.Float, nullable=False, default=0)
+    
+    @timed_serialization
+    def to_dict(self):
+        return {
+            'tanggal': self.tanggal.isoformat(),
+            'id_bahan': self.id_bahan,
+            'jumlah_terpakai': self.jumlah_terpakai,
+            'jumlah_waste': self.jumlah_waste,
+            'total_cost': self.total_cost
+        }
+
+class TableVersion(db.Model):
+    """Model for per-table change counters used to build HTTP ETags"""
+    __tablename__ = 'table_version'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class IdempotencyKey(db.Model):
+    """Model for stored responses of requests sent with an Idempotency-Key"""
+    __tablename__ = 'idempotency_key'
+    
+    key = db.Column(db.String(255), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer, nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class MutasiStok(db.Model):
+    """Model for the append-only stock movement ledger"""
+    __tablename__ = 'mutasi_stok'
+    __table_args__ = (
+        db.Index('ix_mutasi_stok_id_bahan_id_mutasi', 'id_bahan', 'id_mutasi'),
+    )
+    
+    id_mutasi = db.Column(db.Integer, primary_key=True)
+    id_bahan = db.Column(db.Integer, db.ForeignKey('bahan_baku.id_bahan'), nullable=False)
+    # One of stock_ledger.JENIS_MUTASI
+    jenis = db.Column(db.String(20), nullable=False)
+    # Signed change in stock: receipts are positive, usage negative
+    jumlah = db.Column(db.Float, nullable=False)
+    keterangan = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    @timed_serialization
+    def to_dict(self):
+        return {
+            'id_mutasi': self.id_mutasi,
+            'id_bahan': self.id_bahan,
+            'jenis': self.jenis,
+            'jumlah': self.jumlah,
+            'keterangan': self.keterangan,
+            'created_at': self.created_at.isoformat()
+        }
+
+class SnapshotStok(db.Model):
+    """Model for periodic per-ingredient stock snapshots taken from the ledger"""
+    __tablename__ = 'snapshot_stok'
+    __table_args__ = (
+        db.Index('ix_snapshot_stok_id_bahan_diambil_pada', 'id_bahan', 'diambil_pada'),
+    )
+    
+    id_snapshot = db.Column(db.Integer, primary_key=True)
+    id_bahan = db.Column(db.Integer, db.ForeignKey('bahan_baku.id_bahan'), nullable=False)
+    stok = db.Column(db.Float, nullable=False)
+    # Last ledger row included in stok
+    id_mutasi_terakhir = db.Column(db.Integer, nullable=False)
+    diambil_pada = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class ScheduledJob(db.Model):
+    """Model for the lease and last run of each background job"""
+    __tablename__ = 'scheduled_job'
+    
+    name = db.Column(db.String(64), primary_key=True)
+    # Latest schedule slot claimed; a slot runs at most once across workers
+    slot = db.Column(db.DateTime)
+    owner = db.Column(db.String(128))
+    lease_until = db.Column(db.DateTime)
+    last_started_at = db.Column(db.DateTime)
+    last_finished_at = db.Column(db.DateTime)
+    last_status = db.Column(db.String(20))
+    last_duration_ms = db.Column(db.Float)
+    last_error = db.Column(db.Text)
+    last_result = db.Column(db.Text)
+    run_count = db.Column(db.Integer, nullable=False, default=0)
+    total_duration_ms = db.Column(db.Float, nullable=False, default=0)
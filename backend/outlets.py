@@ -0,0 +1,116 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import current_app, g, has_app_context, request
+from errors import ResourceNotFoundError
+import os
+import re
+import threading
+
+OUTLET_HEADER = 'X-Outlet-ID'
+
+# Outlet IDs name database files, so they are kept to a safe alphabet
+OUTLET_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+
+DEFAULT_OUTLET_DATABASE_URL = 'sqlite:///outlets/{outlet}.db'
+
+_current = ContextVar('outlet', default=None)
+
+def current_outlet():
+    """
+    The outlet whose data is being read or written
+    Set per request from the X-Outlet-ID header (or ?outlet=) and by
+    outlet_context() elsewhere; falls back to the default outlet.
+    """
+    outlet = _current.get()
+    if outlet is None and has_app_context():
+        return current_app.config['DEFAULT_OUTLET']
+    return outlet
+
+@contextmanager
+def outlet_context(outlet):
+    """Select an outlet for the code inside the block"""
+    token = _current.set(outlet)
+    try:
+        yield outlet
+    finally:
+        _current.reset(token)
+
+def is_default_outlet(app, outlet):
+    return outlet is None or outlet == app.config['DEFAULT_OUTLET']
+
+class PerOutlet:
+    """
+    One instance of an in-process cache per outlet
+    Attribute access goes to the current outlet's instance, created on first
+    use, so callers keep using the cache as if there were a single one.
+    """
+    def __init__(self, factory):
+        self._factory = factory
+        self._instances = {}
+        self._lock = threading.Lock()
+    
+    def for_outlet(self, outlet):
+        instance = self._instances.get(outlet)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(outlet)
+                if instance is None:
+                    instance = self._instances[outlet] = self._factory()
+        return instance
+    
+    def reset(self, factory=None):
+        """Drop every outlet's instance, optionally building new ones differently"""
+        with self._lock:
+            if factory is not None:
+                self._factory = factory
+            self._instances = {}
+    
+    def __getattr__(self, name):
+        return getattr(self.for_outlet(current_outlet()), name)
+
+def parse_outlets(value):
+    """Read a comma-separated list of outlet IDs"""
+    outlets = [outlet.strip() for outlet in (value or '').split(',') if outlet.strip()]
+    for outlet in outlets:
+        if not OUTLET_ID_PATTERN.match(outlet):
+            raise RuntimeError(
+                f'Invalid outlet ID {outlet!r}: use up to 32 letters, digits, _ or -'
+            )
+    return outlets
+
+def init_outlets(app):
+    """
+    Configure the outlets and select one for every request
+    OUTLETS lists the outlet IDs. The default outlet (DEFAULT_OUTLET, else
+    the first listed) keeps the main database; every other outlet gets its
+    own database from the OUTLET_DATABASE_URL template.
+    """
+    app.config.setdefault('OUTLETS', parse_outlets(os.environ.get('OUTLETS')))
+    # Parsed before the default outlet is taken from it
+    if isinstance(app.config['OUTLETS'], str):
+        app.config['OUTLETS'] = parse_outlets(app.config['OUTLETS'])
+    app.config.setdefault('DEFAULT_OUTLET', os.environ.get('DEFAULT_OUTLET') or (
+        app.config['OUTLETS'][0] if app.config['OUTLETS'] else 'default'
+    ))
+    app.config.setdefault('OUTLET_DATABASE_URL', os.environ.get(
+        'OUTLET_DATABASE_URL', DEFAULT_OUTLET_DATABASE_URL
+    ))
+    app.config.setdefault('OUTLET_FANOUT_WORKERS', int(os.environ.get('OUTLET_FANOUT_WORKERS', 8)))
+    
+    if app.config['DEFAULT_OUTLET'] not in app.config['OUTLETS']:
+        app.config['OUTLETS'] = [app.config['DEFAULT_OUTLET']] + app.config['OUTLETS']
+    
+    @app.before_request
+    def select_outlet():
+        outlet = request.headers.get(OUTLET_HEADER) or request.args.get('outlet')
+        if outlet is None:
+            return
+        if outlet not in app.config['OUTLETS']:
+            raise ResourceNotFoundError(f'Outlet {outlet!r} not found')
+        g.outlet_token = _current.set(outlet)
+    
+    @app.teardown_request
+    def release_outlet(exc):
+        token = g.pop('outlet_token', None)
+        if token is not None:
+            _current.reset(token)
@@ -0,0 +1,54 @@
+from errors import ValidationError
+
+# Page size used when a list request does not ask for one
+DEFAULT_LIMIT = 100
+
+# Largest page a client may request
+MAX_LIMIT = 1000
+
+def parse_limit(args):
+    """Read the page size from the query string"""
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+        if limit <= 0:
+            raise ValueError
+    except ValueError:
+        raise ValidationError('limit must be a positive integer')
+    return min(limit, MAX_LIMIT)
+
+def parse_fields(args, allowed):
+    """
+    Read the fields= projection from the query string
+    Returns: set of field names, or None when every field is wanted
+    """
+    if 'fields' not in args:
+        return None
+    
+    fields = {field.strip() for field in args['fields'].split(',') if field.strip()}
+    unknown = fields - set(allowed)
+    if unknown:
+        raise ValidationError(f'Unknown fields: {", ".join(sorted(unknown))}')
+    return fields
+
+def paginate(query, key_column, args):
+    """
+    Apply keyset pagination on an integer key column
+    The cursor is the last key of the previous page, so each page is an
+    index range scan no matter how deep the client has paged.
+    Returns: tuple of (items, pagination dictionary)
+    """
+    limit = parse_limit(args)
+    cursor = args.get('cursor')
+    if cursor is not None:
+        try:
+            query = query.filter(key_column > int(cursor))
+        except ValueError:
+            raise ValidationError('cursor must be an integer')
+    
+    items = query.order_by(key_column).limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = getattr(items[-1], key_column.key)
+    
+    return items, {'limit': limit, 'next_cursor': next_cursor}
@@ -0,0 +1,135 @@
+from collections import OrderedDict, namedtuple
+from database import db
+from http_cache import get_versions, has_uncommitted_versions
+from models import Menu
+from outlets import PerOutlet
+from functools import partial
+import threading
+
+# One compiled recipe line: usage and cost for a single unit of the menu
+ResepVector = namedtuple('ResepVector', [
+    'id_bahan',
+    'nama_bahan',
+    'satuan',
+    'jumlah',
+    'waste_percent',
+    'usage_per_unit',
+    'cost_per_unit'
+])
+
+# Tables compiled recipes are built from
+RECIPE_TABLES = ('bahan_baku', 'menu', 'resep')
+
+class RecipeCache:
+    """
+    Bounded LRU cache of compiled recipes keyed by id_menu
+    The entries belong to one set of recipe table versions. A write
+    committed by any worker bumps them, which empties the cache of every
+    process on its next lookup.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.versions = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sync(self, versions):
+        """
+        Drop the entries if the recipe tables changed since they were cached
+        Returns: whether the cache now holds these versions; it does not when
+        another thread already saw newer ones
+        """
+        with self._lock:
+            if versions == self.versions:
+                return True
+            if self.versions is None or all(
+                new >= old for new, old in zip(versions, self.versions)
+            ):
+                self.versions = versions
+                self._entries.clear()
+                return True
+            return False
+    
+    def get(self, id_menu):
+        with self._lock:
+            vector = self._entries.get(id_menu)
+            if vector is not None:
+                self._entries.move_to_end(id_menu)
+            return vector
+
+    def put(self, id_menu, vector, versions):
+        """Store a vector unless the tables changed since it was read"""
+        with self._lock:
+            if versions != self.versions:
+                return
+            self._entries[id_menu] = vector
+            self._entries.move_to_end(id_menu)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+# Each outlet has its own menus, so each gets its own cache
+recipe_cache = PerOutlet(RecipeCache)
+
+def recipe_versions():
+    """
+    Committed versions of the recipe tables, read in one query
+    Returns: tuple of versions, or None while the session's transaction has
+    written to those tables, since what it reads may still roll back
+    """
+    if has_uncommitted_versions(db.session, RECIPE_TABLES):
+        return None
+    versions = get_versions(RECIPE_TABLES)
+    return tuple(versions[name][0] for name in RECIPE_TABLES)
+
+def compile_resep(menu):
+    """Compile a menu's recipe into a tuple of ResepVector lines"""
+    vector = []
+    for resep_item in menu.resep:
+        bahan = resep_item.bahan
+        usage_per_unit = resep_item.jumlah * (1 + resep_item.waste_percent / 100)
+        vector.append(ResepVector(
+            id_bahan=bahan.id_bahan,
+            nama_bahan=bahan.nama_bahan,
+            satuan=bahan.satuan,
+            jumlah=resep_item.jumlah,
+            waste_percent=resep_item.waste_percent,
+            usage_per_unit=usage_per_unit,
+            cost_per_unit=usage_per_unit * bahan.harga_per_gram
+        ))
+    return tuple(vector)
+
+def get_resep_vectors(menu_ids):
+    """
+    Get compiled recipes for several menus, loading misses in one query
+    Returns: dictionary of id_menu -> vector; unknown menus are left out
+    """
+    # Versions are read before the recipes, so cached rows are never older
+    versions = recipe_versions()
+    cacheable = versions is not None and recipe_cache.sync(versions)
+    
+    vectors = {}
+    missing = []
+    for id_menu in set(menu_ids):
+        vector = recipe_cache.get(id_menu) if cacheable else None
+        if vector is None:
+            missing.append(id_menu)
+        else:
+            vectors[id_menu] = vector
+
+    if missing:
+        menus = Menu.query_with_resep().filter(Menu.id_menu.in_(missing)).all()
+        for menu in menus:
+            vector = compile_resep(menu)
+            if cacheable:
+                recipe_cache.put(menu.id_menu, vector, versions)
+            vectors[menu.id_menu] = vector
+
+    return vectors
+
+def get_resep_vector(id_menu):
+    """Get the compiled recipe for a menu, or None if the menu does not exist"""
+    return get_resep_vectors([id_menu]).get(id_menu)
+
+def init_recipe_cache(app):
+    """Size the recipe cache"""
+    recipe_cache.reset(partial(RecipeCache, app.config.get('RECIPE_CACHE_SIZE', 1024)))
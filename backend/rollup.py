@@ -0,0 +1,157 @@
+from database import current_engine, db
+from models import Penjualan, LogPemakaian, RekapHarianMenu, RekapHarianBahan
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+def _upsert(model, keys, rows):
+    """Insert rows, adding their values onto any existing row with the same keys"""
+    if not rows:
+        return
+    
+    table = model.__table__
+    if current_engine().dialect.name == 'postgresql':
+        stmt = postgresql.insert(table)
+    else:
+        stmt = sqlite.insert(table)
+    
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={
+            column: table.c[column] + stmt.excluded[column]
+            for column in rows[0] if column not in keys
+        }
+    )
+    db.session.execute(stmt, rows)
+
+def record_sales(sales):
+    """
+    Add sales to the daily rollup inside the caller's transaction
+    sales is a list of (tanggal, id_menu, jumlah_terjual, usage_details)
+    tuples, with usage_details as returned by calculate_usage_and_cost.
+    """
+    menu_totals = {}
+    bahan_totals = {}
+    for tanggal, id_menu, quantity, usage_details in sales:
+        menu_row = menu_totals.setdefault((tanggal, id_menu), {
+            'tanggal': tanggal,
+            'id_menu': id_menu,
+            'jumlah_transaksi': 0,
+            'jumlah_terjual': 0,
+            'jumlah_terpakai': 0,
+            'jumlah_waste': 0,
+            'total_cost': 0
+        })
+        menu_row['jumlah_transaksi'] += 1
+        menu_row['jumlah_terjual'] += quantity
+        
+        for usage in usage_details:
+            menu_row['jumlah_terpakai'] += usage['jumlah_terpakai']
+            menu_row['jumlah_waste'] += usage['jumlah_waste']
+            menu_row['total_cost'] += usage['cost']
+            bahan_row = bahan_totals.setdefault((tanggal, usage['id_bahan']), {
+                'tanggal': tanggal,
+                'id_bahan': usage['id_bahan'],
+                'jumlah_terpakai': 0,
+                'jumlah_waste': 0,
+                'total_cost': 0
+            })
+            bahan_row['jumlah_terpakai'] += usage['jumlah_terpakai']
+            bahan_row['jumlah_waste'] += usage['jumlah_waste']
+            bahan_row['total_cost'] += usage['cost']
+    
+    _upsert(RekapHarianMenu, ['tanggal', 'id_menu'], list(menu_totals.values()))
+    _upsert(RekapHarianBahan, ['tanggal', 'id_bahan'], list(bahan_totals.values()))
+
+def get_daily_totals(tanggal):
+    """
+    Read the totals for one day from the rollup
+    Returns: dictionary of totals plus the per-menu rows
+    """
+    menu_rows = RekapHarianMenu.query.filter_by(tanggal=tanggal).all()
+    usage = db.session.query(
+        func.coalesce(func.sum(RekapHarianBahan.jumlah_terpakai), 0),
+        func.coalesce(func.sum(RekapHarianBahan.jumlah_waste), 0),
+        func.coalesce(func.sum(RekapHarianBahan.total_cost), 0)
+    ).filter(RekapHarianBahan.tanggal == tanggal).one()
+    
+    return {
+        'total_sales': sum(row.jumlah_transaksi for row in menu_rows),
+        'total_items_sold': sum(row.jumlah_terjual for row in menu_rows),
+        'total_ingredient_usage': usage[0],
+        'total_waste': usage[1],
+        'total_cost': usage[2],
+        'menu': [row.to_dict() for row in menu_rows]
+    }
+
+def rebuild_rollup(start=None, end=None):
+    """
+    Rebuild the daily rollup from Penjualan and LogPemakaian
+    start and end are optional inclusive dates limiting the rebuilt range.
+    Returns: number of days rebuilt
+    """
+    def in_range(column):
+        conditions = []
+        if start is not None:
+            conditions.append(column >= start)
+        if end is not None:
+            conditions.append(column <= end)
+        return conditions
+    
+    RekapHarianMenu.query.filter(*in_range(RekapHarianMenu.tanggal)).delete(
+        synchronize_session=False
+    )
+    RekapHarianBahan.query.filter(*in_range(RekapHarianBahan.tanggal)).delete(
+        synchronize_session=False
+    )
+    
+    sale_usage = select(
+        LogPemakaian.id_penjualan,
+        func.sum(LogPemakaian.jumlah_terpakai).label('jumlah_terpakai'),
+        func.sum(LogPemakaian.jumlah_waste).label('jumlah_waste'),
+        func.sum(LogPemakaian.total_cost).label('total_cost')
+    ).join(
+        Penjualan, Penjualan.id_penjualan == LogPemakaian.id_penjualan
+    ).where(
+        *in_range(Penjualan.tanggal)
+    ).group_by(LogPemakaian.id_penjualan).subquery()
+    
+    menu_select = select(
+        Penjualan.tanggal,
+        Penjualan.id_menu,
+        func.count(Penjualan.id_penjualan),
+        func.sum(Penjualan.jumlah_terjual),
+        func.coalesce(func.sum(sale_usage.c.jumlah_terpakai), 0),
+        func.coalesce(func.sum(sale_usage.c.jumlah_waste), 0),
+        func.coalesce(func.sum(sale_usage.c.total_cost), 0)
+    ).outerjoin(
+        sale_usage, sale_usage.c.id_penjualan == Penjualan.id_penjualan
+    ).where(
+        *in_range(Penjualan.tanggal)
+    ).group_by(Penjualan.tanggal, Penjualan.id_menu)
+    
+    bahan_select = select(
+        Penjualan.tanggal,
+        LogPemakaian.id_bahan,
+        func.sum(LogPemakaian.jumlah_terpakai),
+        func.sum(LogPemakaian.jumlah_waste),
+        func.sum(LogPemakaian.total_cost)
+    ).join(
+        Penjualan, Penjualan.id_penjualan == LogPemakaian.id_penjualan
+    ).where(
+        *in_range(Penjualan.tanggal)
+    ).group_by(Penjualan.tanggal, LogPemakaian.id_bahan)
+    
+    db.session.execute(insert(RekapHarianMenu).from_select(
+        ['tanggal', 'id_menu', 'jumlah_transaksi', 'jumlah_terjual',
+         'jumlah_terpakai', 'jumlah_waste', 'total_cost'],
+        menu_select
+    ))
+    db.session.execute(insert(RekapHarianBahan).from_select(
+        ['tanggal', 'id_bahan', 'jumlah_terpakai', 'jumlah_waste', 'total_cost'],
+        bahan_select
+    ))
+    db.session.commit()
+    
+    return db.session.query(
+        func.count(func.distinct(RekapHarianMenu.tanggal))
+    ).filter(*in_range(RekapHarianMenu.tanggal)).scalar()
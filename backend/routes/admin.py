@@ -0,0 +1,38 @@
+from flask import Blueprint, current_app, request
+from errors import ForbiddenError
+from scheduler import get_scheduler
+from serializers import jsonify
+import hmac
+
+admin_bp = Blueprint('admin', __name__)
+
+@admin_bp.before_request
+def require_admin_token():
+    """
+    Only serve requests bearing ADMIN_TOKEN
+    CORS is open to every origin, so without a token any page a cashier
+    opens could start a job; the endpoints are off until one is set.
+    """
+    token = current_app.config['ADMIN_TOKEN']
+    if not token:
+        raise ForbiddenError('Admin endpoints are disabled; set ADMIN_TOKEN to enable them')
+    scheme, _, given = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(given.encode(), token.encode()):
+        raise ForbiddenError('Invalid or missing admin token')
+
+@admin_bp.route('/admin/jobs', methods=['GET'])
+def get_jobs():
+    """Schedule, lease and per-job timing of the background jobs"""
+    return jsonify({
+        'status': 'success',
+        'data': get_scheduler().status()
+    })
+
+@admin_bp.route('/admin/jobs/<name>/run', methods=['POST'])
+def run_job(name):
+    """Start a background job now instead of waiting for its schedule"""
+    get_scheduler().trigger(name)
+    return jsonify({
+        'status': 'success',
+        'message': f'Job {name} started'
+    }), 202
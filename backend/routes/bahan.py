@@ -1,20 +1,103 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request
 from database import db
-from models import BahanBaku
+from models import BahanBaku, MutasiStok
 from errors import ValidationError, ResourceNotFoundError
+from pagination import paginate, parse_fields
+from http_cache import STOK_VERSION, conditional
+from serializers import jsonify, rows_to_dicts, select_columns
+from forecast import forecast_stock
+from catalog_import import catalog_from_request, import_bahan
+from events import publish, publish_on_commit
+from stock_ledger import (
+    JENIS_AWAL, JENIS_PENERIMAAN, JENIS_PENYESUAIAN,
+    change_stock, delete_history, record_mutasi, set_stock, stock_at
+)
+from datetime import datetime, time
 
 bahan_bp = Blueprint('bahan', __name__)
 
 @bahan_bp.route('/bahan', methods=['GET'])
+@conditional('bahan_baku', STOK_VERSION)
 def get_all_bahan():
-    """Get all raw materials"""
-    bahan_list = BahanBaku.query.all()
+    """Get raw materials, one keyset page at a time"""
+    fields = parse_fields(request.args, BahanBaku.__table__.columns.keys())
+    query = db.session.query(*select_columns(BahanBaku, fields, BahanBaku.id_bahan))
+    rows, pagination = paginate(query, BahanBaku.id_bahan, request.args)
     return jsonify({
         'status': 'success',
-        'data': [bahan.to_dict() for bahan in bahan_list]
+        'data': rows_to_dicts(rows, fields),
+        'pagination': pagination
+    })
+
+@bahan_bp.route('/bahan/forecast', methods=['GET'])
+def get_bahan_forecast():
+    """
+    Forecast days to stockout and reorder points from consumption history
+    Optional: lead_time_days, safety_factor and cover_days override the
+    configured defaults.
+    """
+    params = {}
+    for name, config_key in (
+        ('lead_time_days', 'FORECAST_LEAD_TIME_DAYS'),
+        ('safety_factor', 'FORECAST_SAFETY_FACTOR'),
+        ('cover_days', 'FORECAST_COVER_DAYS')
+    ):
+        try:
+            params[name] = float(request.args.get(name, current_app.config[config_key]))
+            if params[name] < 0:
+                raise ValueError
+        except ValueError:
+            raise ValidationError(f'{name} must be a non-negative number')
+    
+    return jsonify({
+        'status': 'success',
+        'data': forecast_stock(**params),
+        'parameters': dict(params, window_days=current_app.config['FORECAST_WINDOW_DAYS'])
+    })
+
+def parse_moment(value):
+    """Read a point in time; a bare date means the end of that day"""
+    try:
+        if len(value) == 10:
+            return datetime.combine(datetime.strptime(value, '%Y-%m-%d').date(), time.max)
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValidationError('at must be a date (YYYY-MM-DD) or an ISO 8601 datetime')
+
+@bahan_bp.route('/bahan/stok', methods=['GET'])
+def get_bahan_stok():
+    """
+    Get the stock of every raw material, now or at a point in time
+    Current stock is read straight from bahan_baku. With ?at= it is rebuilt
+    from the newest snapshot before that moment and the ledger after it.
+    """
+    bahan_list = db.session.query(
+        BahanBaku.id_bahan, BahanBaku.nama_bahan, BahanBaku.satuan, BahanBaku.stok_awal
+    ).order_by(BahanBaku.id_bahan).all()
+    
+    if 'at' not in request.args:
+        moment = None
+        stock = {bahan.id_bahan: bahan.stok_awal for bahan in bahan_list}
+    else:
+        moment = parse_moment(request.args['at'])
+        stock = stock_at(moment)
+    
+    return jsonify({
+        'status': 'success',
+        'at': moment,
+        'data': [
+            {
+                'id_bahan': bahan.id_bahan,
+                'nama_bahan': bahan.nama_bahan,
+                'satuan': bahan.satuan,
+                'stok': stock[bahan.id_bahan]
+            }
+            for bahan in bahan_list if bahan.id_bahan in stock
+        ]
     })
 
 @bahan_bp.route('/bahan/<int:id_bahan>', methods=['GET'])
+@conditional('bahan_baku', STOK_VERSION)
 def get_bahan(id_bahan):
     """Get a specific raw material by ID"""
     bahan = BahanBaku.query.get(id_bahan)
@@ -55,14 +138,33 @@ def create_bahan():
     )
     
     db.session.add(bahan)
+    db.session.flush()
+    record_mutasi(JENIS_AWAL, {bahan.id_bahan: stok_awal}, 'Stok awal')
     db.session.commit()
     
+    bahan_data = bahan.to_dict()
+    publish('bahan_changed', {'action': 'created', 'bahan': bahan_data})
+    
     return jsonify({
         'status': 'success',
         'message': 'Bahan created successfully',
-        'data': bahan.to_dict()
+        'data': bahan_data
     }), 201
 
+@bahan_bp.route('/bahan/import', methods=['POST'])
+def import_bahan_catalog():
+    """
+    Create or update many raw materials at once from a CSV or JSON catalog
+    Rows match existing bahan by id_bahan, else nama_bahan. Every row is
+    validated first; any error rejects the catalog with the row errors.
+    """
+    result = import_bahan(catalog_from_request(request))
+    return jsonify({
+        'status': 'success',
+        'message': 'Bahan imported successfully',
+        'data': result
+    })
+
 @bahan_bp.route('/bahan/<int:id_bahan>', methods=['PUT'])
 def update_bahan(id_bahan):
     """Update a specific raw material"""
@@ -82,9 +184,10 @@ def update_bahan(id_bahan):
             stok_awal = float(data['stok_awal'])
             if stok_awal < 0:
                 raise ValueError
-            bahan.stok_awal = stok_awal
         except ValueError:
             raise ValidationError('stok_awal must be a positive number')
+        # A new stock level is a counted adjustment recorded in the ledger
+        set_stock(id_bahan, stok_awal, 'Stok diubah lewat PUT /bahan')
     if 'harga_per_gram' in data:
         try:
             harga_per_gram = float(data['harga_per_gram'])
@@ -96,10 +199,13 @@ def update_bahan(id_bahan):
     
     db.session.commit()
     
+    bahan_data = bahan.to_dict()
+    publish('bahan_changed', {'action': 'updated', 'bahan': bahan_data})
+    
     return jsonify({
         'status': 'success',
         'message': 'Bahan updated successfully',
-        'data': bahan.to_dict()
+        'data': bahan_data
     })
 
 @bahan_bp.route('/bahan/<int:id_bahan>', methods=['DELETE'])
@@ -109,10 +215,64 @@ def delete_bahan(id_bahan):
     if not bahan:
         raise ResourceNotFoundError(f'Bahan with ID {id_bahan} not found')
     
+    delete_history(id_bahan)
     db.session.delete(bahan)
     db.session.commit()
     
+    publish('bahan_changed', {'action': 'deleted', 'id_bahan': id_bahan})
+    
     return jsonify({
         'status': 'success',
         'message': 'Bahan deleted successfully'
     })
+
+@bahan_bp.route('/bahan/<int:id_bahan>/mutasi', methods=['GET'])
+def get_bahan_mutasi(id_bahan):
+    """Get the stock ledger of a raw material, one keyset page at a time"""
+    if not db.session.query(BahanBaku.id_bahan).filter_by(id_bahan=id_bahan).scalar():
+        raise ResourceNotFoundError(f'Bahan with ID {id_bahan} not found')
+    
+    query = db.session.query(
+        *select_columns(MutasiStok, None, MutasiStok.id_mutasi)
+    ).filter(MutasiStok.id_bahan == id_bahan)
+    rows, pagination = paginate(query, MutasiStok.id_mutasi, request.args)
+    return jsonify({
+        'status': 'success',
+        'data': rows_to_dicts(rows),
+        'pagination': pagination
+    })
+
+@bahan_bp.route('/bahan/<int:id_bahan>/mutasi', methods=['POST'])
+def create_bahan_mutasi(id_bahan):
+    """
+    Record a stock receipt or a manual adjustment for a raw material
+    Body: jenis ('penerimaan' or 'penyesuaian'), jumlah (the signed change;
+    receipts must be positive) and an optional keterangan.
+    """
+    data = request.get_json()
+    if not isinstance(data, dict):
+        raise ValidationError('Mutasi must be a JSON object')
+    
+    jenis = data.get('jenis')
+    if jenis not in (JENIS_PENERIMAAN, JENIS_PENYESUAIAN):
+        raise ValidationError(f'jenis must be one of: {JENIS_PENERIMAAN}, {JENIS_PENYESUAIAN}')
+    try:
+        jumlah = float(data['jumlah'])
+        if jumlah == 0 or (jenis == JENIS_PENERIMAAN and jumlah < 0):
+            raise ValueError
+    except (KeyError, TypeError, ValueError):
+        raise ValidationError('jumlah must be a non-zero number, positive for a penerimaan')
+    keterangan = data.get('keterangan')
+    if keterangan is not None and (not isinstance(keterangan, str) or len(keterangan) > 255):
+        raise ValidationError('keterangan must be a string of at most 255 characters')
+    
+    change_stock(id_bahan, jumlah, jenis, keterangan)
+    publish_on_commit('stock_changed', {'changes': [{'id_bahan': id_bahan, 'delta': jumlah}]})
+    db.session.commit()
+    
+    bahan = BahanBaku.query.get(id_bahan)
+    return jsonify({
+        'status': 'success',
+        'message': 'Mutasi recorded successfully',
+        'data': bahan.to_dict()
+    }), 201
@@ -0,0 +1,114 @@
+from flask import Blueprint, Response, request, stream_with_context
+from database import db
+from models import Penjualan, LogPemakaian
+from errors import ValidationError
+from serializers import dumps
+from sqlalchemy import select
+from datetime import date, datetime
+import csv
+import io
+
+export_bp = Blueprint('export', __name__)
+
+# Rows fetched from the database per round trip while streaming
+EXPORT_BATCH_SIZE = 1000
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+def _plain(value):
+    """Convert dates to ISO strings so rows can be written as CSV"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def _encode_ndjson(columns, rows):
+    return b''.join(dumps(dict(zip(columns, row))) + b'\n' for row in rows)
+
+def _encode_csv(columns, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_plain(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+def parse_export_args(args):
+    """
+    Validate the format and date range of an export request
+    Returns: tuple of (format, start_date, end_date)
+    """
+    export_format = args.get('format', 'ndjson')
+    if export_format not in FORMATS:
+        raise ValidationError(f'format must be one of: {", ".join(FORMATS)}')
+    
+    try:
+        start_date = datetime.strptime(args['start_date'], '%Y-%m-%d').date() \
+            if 'start_date' in args else None
+        end_date = datetime.strptime(args['end_date'], '%Y-%m-%d').date() \
+            if 'end_date' in args else None
+    except ValueError:
+        raise ValidationError('Invalid date format. Use YYYY-MM-DD')
+    
+    return export_format, start_date, end_date
+
+def filter_by_tanggal(statement, start_date, end_date):
+    if start_date is not None:
+        statement = statement.where(Penjualan.tanggal >= start_date)
+    if end_date is not None:
+        statement = statement.where(Penjualan.tanggal <= end_date)
+    return statement
+
+def stream_export(statement, export_format, filename):
+    """
+    Stream the rows of a Core select as NDJSON or CSV
+    Rows are fetched as plain tuples in batches of EXPORT_BATCH_SIZE, so no
+    ORM objects are built and memory stays flat however long the history is.
+    """
+    columns = [column.name for column in statement.selected_columns]
+    encode = _encode_ndjson if export_format == 'ndjson' else _encode_csv
+    
+    def generate():
+        if export_format == 'csv':
+            yield _encode_csv(columns, [columns])
+        
+        result = db.session.execute(
+            statement,
+            execution_options={'stream_results': True}
+        )
+        for rows in result.partitions(EXPORT_BATCH_SIZE):
+            yield encode(columns, rows)
+    
+    extension = 'ndjson' if export_format == 'ndjson' else 'csv'
+    return Response(
+        stream_with_context(generate()),
+        mimetype=FORMATS[export_format],
+        headers={
+            'Content-Disposition': f'attachment; filename={filename}.{extension}'
+        }
+    )
+
+@export_bp.route('/export/penjualan', methods=['GET'])
+def export_penjualan():
+    """Stream every sales record, optionally limited to a date range"""
+    export_format, start_date, end_date = parse_export_args(request.args)
+    statement = filter_by_tanggal(
+        select(*Penjualan.__table__.columns),
+        start_date,
+        end_date
+    ).order_by(Penjualan.id_penjualan)
+    
+    return stream_export(statement, export_format, 'penjualan')
+
+@export_bp.route('/export/log_pemakaian', methods=['GET'])
+def export_log_pemakaian():
+    """Stream every usage log with its sale date, optionally limited to a date range"""
+    export_format, start_date, end_date = parse_export_args(request.args)
+    statement = filter_by_tanggal(
+        select(*LogPemakaian.__table__.columns, Penjualan.tanggal).join(
+            Penjualan, Penjualan.id_penjualan == LogPemakaian.id_penjualan
+        ),
+        start_date,
+        end_date
+    ).order_by(LogPemakaian.id_log)
+    
+    return stream_export(statement, export_format, 'log_pemakaian')
@@ -1,23 +1,83 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request
 from database import db
 from models import Menu, Resep, BahanBaku
 from errors import ValidationError, ResourceNotFoundError
+from pagination import paginate, parse_fields
+from http_cache import conditional
+from serializers import jsonify
+from events import publish
+from costing import menu_costing
+from sqlalchemy.orm import selectinload
+from catalog_import import catalog_from_request, import_menu
+
+# Menu payloads embed recipe lines and their ingredients
+MENU_TABLES = ('menu', 'resep', 'bahan_baku')
 
 menu_bp = Blueprint('menu', __name__)
 
 @menu_bp.route('/menu', methods=['GET'])
+@conditional(*MENU_TABLES)
 def get_all_menu():
-    """Get all menu items with their recipes"""
-    menu_list = Menu.query.all()
+    """Get menu items with their recipes, one keyset page at a time"""
+    fields = parse_fields(request.args, Menu.__table__.columns.keys() + ['resep'])
+    
+    # Skip loading recipes when the projection leaves them out
+    with_resep = fields is None or 'resep' in fields
+    query = Menu.query_with_resep() if with_resep else Menu.query
+    
+    menu_list, pagination = paginate(query, Menu.id_menu, request.args)
+    
+    # Ingredients shared by several recipes are listed once, keyed by id_bahan
+    bahan_index = {}
+    response = {
+        'status': 'success',
+        'data': [menu.to_dict(fields, bahan_index) for menu in menu_list],
+        'pagination': pagination
+    }
+    if with_resep:
+        response['bahan'] = bahan_index
+    return jsonify(response)
+
+@menu_bp.route('/menu/costing', methods=['GET'])
+@conditional(*MENU_TABLES)
+def get_menu_costing():
+    """Get the unit cost of every menu item at current ingredient prices"""
+    return jsonify({
+        'status': 'success',
+        'data': menu_costing()
+    })
+
+@menu_bp.route('/menu/costing', methods=['POST'])
+def simulate_menu_costing():
+    """
+    Simulate menu unit costs with changed ingredient prices
+    Body: {"harga_per_gram": {"<id_bahan>": price, ...}}. Nothing is saved.
+    """
+    data = request.get_json()
+    if not isinstance(data, dict) or not isinstance(data.get('harga_per_gram'), dict):
+        raise ValidationError('Body must include harga_per_gram: an object of id_bahan to price')
+    
+    overrides = {}
+    for id_bahan, harga in data['harga_per_gram'].items():
+        try:
+            id_bahan = int(id_bahan)
+        except ValueError:
+            raise ValidationError(f'Invalid bahan ID: {id_bahan}')
+        if isinstance(harga, bool) or not isinstance(harga, (int, float)) or harga < 0:
+            raise ValidationError(f'harga_per_gram for bahan {id_bahan} must be a non-negative number')
+        overrides[id_bahan] = harga
+    
     return jsonify({
         'status': 'success',
-        'data': [menu.to_dict() for menu in menu_list]
+        'data': menu_costing(overrides),
+        'harga_per_gram': overrides
     })
 
 @menu_bp.route('/menu/<int:id_menu>', methods=['GET'])
+@conditional(*MENU_TABLES)
 def get_menu(id_menu):
     """Get a specific menu item by ID"""
-    menu = Menu.query.get(id_menu)
+    menu = Menu.query_with_resep().get(id_menu)
     if not menu:
         raise ResourceNotFoundError(f'Menu with ID {id_menu} not found')
     
@@ -26,6 +86,97 @@ def get_menu(id_menu):
         'data': menu.to_dict()
     })
 
+def parse_resep_line(item, partial=False):
+    """
+    Validate one recipe line
+    With partial, jumlah and waste_percent may be left out to keep the
+    current values.
+    Returns: dictionary of the given fields with id_bahan as an integer
+    """
+    if not isinstance(item, dict):
+        raise ValidationError('Recipe item must be an object')
+    required_fields = ['id_bahan'] if partial else ['id_bahan', 'jumlah', 'waste_percent']
+    for field in required_fields:
+        if field not in item:
+            raise ValidationError(f'Recipe item missing required field: {field}')
+    
+    try:
+        line = {'id_bahan': int(item['id_bahan'])}
+    except (TypeError, ValueError):
+        raise ValidationError(f'Invalid bahan ID: {item["id_bahan"]}')
+    
+    # Validate numeric fields; float() would read true as 1
+    try:
+        if any(isinstance(item.get(field), bool) for field in ('jumlah', 'waste_percent')):
+            raise ValueError
+        if 'jumlah' in item:
+            line['jumlah'] = float(item['jumlah'])
+            if line['jumlah'] <= 0:
+                raise ValueError
+        if 'waste_percent' in item:
+            line['waste_percent'] = float(item['waste_percent'])
+            if line['waste_percent'] < 0:
+                raise ValueError
+    except (TypeError, ValueError):
+        raise ValidationError('jumlah must be positive and waste_percent must be non-negative')
+    return line
+
+def parse_resep(items):
+    """
+    Validate a full recipe
+    Returns: dictionary of id_bahan -> validated line, in the given order
+    """
+    if not isinstance(items, list):
+        raise ValidationError('Recipe must be a list of ingredients')
+    lines = {}
+    for item in items:
+        line = parse_resep_line(item)
+        if line['id_bahan'] in lines:
+            raise ValidationError(f'Bahan with ID {line["id_bahan"]} appears twice in the recipe')
+        lines[line['id_bahan']] = line
+    return lines
+
+def check_bahan_exist(bahan_ids):
+    """Check that every referenced ingredient exists, in one query"""
+    if not bahan_ids:
+        return
+    found = {
+        id_bahan for id_bahan, in db.session.query(BahanBaku.id_bahan)
+        .filter(BahanBaku.id_bahan.in_(bahan_ids))
+    }
+    missing = sorted(set(bahan_ids) - found)
+    if missing:
+        raise ResourceNotFoundError(f'Bahan with ID {missing[0]} not found')
+
+def apply_resep_diff(menu, lines, removed=()):
+    """
+    Bring a menu's recipe in line with the given lines, keyed by id_bahan
+    Unchanged lines are left alone, changed ones are updated in place and
+    keep their ID and created_at, new ones are inserted and lines for the
+    ingredients in removed are deleted. Only new ingredients are looked up.
+    """
+    # Validate before touching the recipe, so nothing is flushed for a bad request
+    existing = {resep.id_bahan for resep in menu.resep}
+    check_bahan_exist([id_bahan for id_bahan in lines if id_bahan not in existing])
+    
+    current = {}
+    for resep in list(menu.resep):
+        if resep.id_bahan in removed or resep.id_bahan in current:
+            # Also drops duplicate lines left by older clear-and-reinsert saves
+            menu.resep.remove(resep)
+        else:
+            current[resep.id_bahan] = resep
+    
+    for id_bahan, line in lines.items():
+        resep = current.get(id_bahan)
+        if resep is None:
+            menu.resep.append(Resep(**line))
+            continue
+        for field in ('jumlah', 'waste_percent'):
+            # Assigning an equal value would still mark the row for UPDATE
+            if field in line and getattr(resep, field) != line[field]:
+                setattr(resep, field, line[field])
+
 @menu_bp.route('/menu', methods=['POST'])
 def create_menu():
     """Create a new menu item with its recipe"""
@@ -37,52 +188,46 @@ def create_menu():
     if 'resep' not in data or not isinstance(data['resep'], list):
         raise ValidationError('Menu must include a recipe (list of ingredients)')
     
-    # Create new menu
+    lines = parse_resep(data['resep'])
+    check_bahan_exist(list(lines))
+    
+    # Create new menu with its recipe items
     menu = Menu(nama_menu=data['nama_menu'])
+    menu.resep.extend(Resep(**line) for line in lines.values())
     db.session.add(menu)
-    
-    # Add recipe items
-    for item in data['resep']:
-        # Validate recipe item
-        required_fields = ['id_bahan', 'jumlah', 'waste_percent']
-        for field in required_fields:
-            if field not in item:
-                raise ValidationError(f'Recipe item missing required field: {field}')
-        
-        # Validate bahan exists
-        bahan = BahanBaku.query.get(item['id_bahan'])
-        if not bahan:
-            raise ResourceNotFoundError(f'Bahan with ID {item["id_bahan"]} not found')
-        
-        # Validate numeric fields
-        try:
-            jumlah = float(item['jumlah'])
-            waste_percent = float(item['waste_percent'])
-            if jumlah <= 0 or waste_percent < 0:
-                raise ValueError
-        except ValueError:
-            raise ValidationError('jumlah must be positive and waste_percent must be non-negative')
-        
-        # Create recipe item
-        resep = Resep(
-            id_bahan=item['id_bahan'],
-            jumlah=jumlah,
-            waste_percent=waste_percent
-        )
-        menu.resep.append(resep)
-    
     db.session.commit()
     
+    menu_data = menu.to_dict()
+    publish('menu_changed', {'action': 'created', 'menu': menu_data})
+    
     return jsonify({
         'status': 'success',
         'message': 'Menu created successfully',
-        'data': menu.to_dict()
+        'data': menu_data
     }), 201
 
+@menu_bp.route('/menu/import', methods=['POST'])
+def import_menu_catalog():
+    """
+    Create or update many menu items and recipes from a CSV or JSON catalog
+    JSON records carry a resep list; CSV has one recipe line per row. Any
+    error rejects the catalog with the row errors.
+    """
+    result = import_menu(catalog_from_request(request))
+    return jsonify({
+        'status': 'success',
+        'message': 'Menu imported successfully',
+        'data': result
+    })
+
 @menu_bp.route('/menu/<int:id_menu>', methods=['PUT'])
 def update_menu(id_menu):
-    """Update a menu item and its recipe"""
-    menu = Menu.query.get(id_menu)
+    """
+    Update a menu item and its recipe
+    A given recipe replaces the current one, but only the lines that differ
+    are written.
+    """
+    menu = Menu.query.options(selectinload(Menu.resep)).get(id_menu)
     if not menu:
         raise ResourceNotFoundError(f'Menu with ID {id_menu} not found')
     
@@ -93,49 +238,74 @@ def update_menu(id_menu):
         menu.nama_menu = data['nama_menu']
     
     # Update recipe if provided
+    if 'resep' in data:
+        lines = parse_resep(data['resep'])
+        dropped = {resep.id_bahan for resep in menu.resep} - set(lines)
+        apply_resep_diff(menu, lines, dropped)
+    
+    db.session.commit()
+    
+    menu_data = menu.to_dict()
+    publish('menu_changed', {'action': 'updated', 'menu': menu_data})
+    
+    return jsonify({
+        'status': 'success',
+        'message': 'Menu updated successfully',
+        'data': menu_data
+    })
+
+@menu_bp.route('/menu/<int:id_menu>', methods=['PATCH'])
+def patch_menu(id_menu):
+    """
+    Change part of a menu item
+    resep lists only the lines to change, keyed by id_bahan: a line for a
+    new ingredient is added, jumlah or waste_percent of an existing one is
+    updated, and {"id_bahan": ..., "delete": true} removes it. Other lines
+    are left as they are.
+    """
+    menu = Menu.query.options(selectinload(Menu.resep)).get(id_menu)
+    if not menu:
+        raise ResourceNotFoundError(f'Menu with ID {id_menu} not found')
+    
+    data = request.get_json()
+    if not isinstance(data, dict):
+        raise ValidationError('Body must be a JSON object')
+    
+    if 'nama_menu' in data:
+        menu.nama_menu = data['nama_menu']
+    
     if 'resep' in data:
         if not isinstance(data['resep'], list):
             raise ValidationError('Recipe must be a list of ingredients')
-        
-        # Remove existing recipe items
-        menu.resep.clear()
-        
-        # Add new recipe items
+        current = {resep.id_bahan for resep in menu.resep}
+        lines = {}
+        removed = set()
         for item in data['resep']:
-            # Validate recipe item
-            required_fields = ['id_bahan', 'jumlah', 'waste_percent']
-            for field in required_fields:
-                if field not in item:
-                    raise ValidationError(f'Recipe item missing required field: {field}')
-            
-            # Validate bahan exists
-            bahan = BahanBaku.query.get(item['id_bahan'])
-            if not bahan:
-                raise ResourceNotFoundError(f'Bahan with ID {item["id_bahan"]} not found')
-            
-            # Validate numeric fields
-            try:
-                jumlah = float(item['jumlah'])
-                waste_percent = float(item['waste_percent'])
-                if jumlah <= 0 or waste_percent < 0:
-                    raise ValueError
-            except ValueError:
-                raise ValidationError('jumlah must be positive and waste_percent must be non-negative')
-            
-            # Create recipe item
-            resep = Resep(
-                id_bahan=item['id_bahan'],
-                jumlah=jumlah,
-                waste_percent=waste_percent
-            )
-            menu.resep.append(resep)
+            line = parse_resep_line(item, partial=True)
+            id_bahan = line['id_bahan']
+            if id_bahan in lines or id_bahan in removed:
+                raise ValidationError(f'Bahan with ID {id_bahan} appears twice in the recipe')
+            if item.get('delete'):
+                if id_bahan not in current:
+                    raise ResourceNotFoundError(f'Bahan with ID {id_bahan} is not in the recipe')
+                removed.add(id_bahan)
+                continue
+            if id_bahan not in current and len(line) < 3:
+                raise ValidationError(
+                    f'New recipe item for bahan {id_bahan} needs jumlah and waste_percent'
+                )
+            lines[id_bahan] = line
+        apply_resep_diff(menu, lines, removed)
     
     db.session.commit()
     
+    menu_data = menu.to_dict()
+    publish('menu_changed', {'action': 'updated', 'menu': menu_data})
+    
     return jsonify({
         'status': 'success',
         'message': 'Menu updated successfully',
-        'data': menu.to_dict()
+        'data': menu_data
     })
 
 @menu_bp.route('/menu/<int:id_menu>', methods=['DELETE'])
@@ -148,15 +318,18 @@ def delete_menu(id_menu):
     db.session.delete(menu)
     db.session.commit()
     
+    publish('menu_changed', {'action': 'deleted', 'id_menu': id_menu})
+    
     return jsonify({
         'status': 'success',
         'message': 'Menu deleted successfully'
     })
 
 @menu_bp.route('/menu/<int:id_menu>/recipe', methods=['GET'])
+@conditional(*MENU_TABLES)
 def get_menu_recipe(id_menu):
     """Get the recipe for a specific menu item"""
-    menu = Menu.query.get(id_menu)
+    menu = Menu.query_with_resep().get(id_menu)
     if not menu:
         raise ResourceNotFoundError(f'Menu with ID {id_menu} not found')
     
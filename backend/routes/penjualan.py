@@ -1,20 +1,34 @@
-from flask import Blueprint, request, jsonify
-from database import db
-from models import Penjualan, Menu, LogPemakaian, BahanBaku
-from errors import ValidationError, ResourceNotFoundError, StockError
+from flask import Blueprint, request
+from database import db, insert_returning_ids
+from models import Penjualan, LogPemakaian, BahanBaku
+from errors import APIError, ValidationError, ResourceNotFoundError, StockError
+from recipe_cache import get_resep_vector, get_resep_vectors
+from rollup import record_sales, get_daily_totals
+from pagination import paginate, parse_fields
+from serializers import jsonify, rows_to_dicts, select_columns
+from idempotency import idempotent, remember_response
+from write_behind import write_usage_logs
+from events import publish_on_commit
+from stock_ledger import JENIS_PENJUALAN, record_mutasi
 from datetime import datetime
+import json
 
 penjualan_bp = Blueprint('penjualan', __name__)
 
-def calculate_usage_and_cost(menu, quantity):
+# Maximum number of sales accepted by a single batch upload
+MAX_BATCH_SIZE = 1000
+
+def calculate_usage_and_cost(resep_vector, quantity, available_stock):
     """
     Calculate ingredient usage, waste, and costs for a menu item
+    resep_vector is the compiled recipe from the recipe cache and
+    available_stock maps id_bahan to the stock the sale may draw from.
     Returns: list of dictionaries containing usage details per ingredient
     """
     usage_details = []
     
-    for resep_item in menu.resep:
-        bahan = resep_item.bahan
+    for resep_item in resep_vector:
+        available = available_stock[resep_item.id_bahan]
         
         # Calculate quantities
         base_usage = resep_item.jumlah * quantity
@@ -22,18 +36,18 @@ def calculate_usage_and_cost(menu, quantity):
         total_usage = base_usage + waste_amount
         
         # Calculate cost
-        cost = total_usage * bahan.harga_per_gram
+        cost = resep_item.cost_per_unit * quantity
         
         # Check stock availability
-        if total_usage > bahan.stok_awal:
+        if total_usage > available:
             raise StockError(
-                f'Insufficient stock for {bahan.nama_bahan}. ' +
-                f'Required: {total_usage:.2f} {bahan.satuan}, ' +
-                f'Available: {bahan.stok_awal:.2f} {bahan.satuan}'
+                f'Insufficient stock for {resep_item.nama_bahan}. ' +
+                f'Required: {total_usage:.2f} {resep_item.satuan}, ' +
+                f'Available: {available:.2f} {resep_item.satuan}'
             )
         
         usage_details.append({
-            'id_bahan': bahan.id_bahan,
+            'id_bahan': resep_item.id_bahan,
             'jumlah_terpakai': base_usage,
             'jumlah_waste': waste_amount,
             'total_usage': total_usage,
@@ -42,13 +56,177 @@ def calculate_usage_and_cost(menu, quantity):
     
     return usage_details
 
+def load_stock(id_bahan_list):
+    """
+    Read the current stock of the given ingredients in one query
+    Returns: dictionary of id_bahan -> stok_awal
+    """
+    rows = db.session.query(BahanBaku.id_bahan, BahanBaku.stok_awal).filter(
+        BahanBaku.id_bahan.in_(set(id_bahan_list))
+    )
+    return dict(rows)
+
+def apply_stock_usage(usage_totals):
+    """
+    Decrement stock with one conditional UPDATE per ingredient
+    Each UPDATE only matches while enough stock is left, so concurrent sales
+    cannot drive stock negative or overwrite each other's decrement. If any
+    ingredient falls short the whole transaction is rolled back. The usage
+    is appended to the stock ledger in the same transaction.
+    """
+    now = datetime.utcnow()
+    
+    # Lock rows in a fixed order so concurrent sales cannot deadlock
+    for id_bahan in sorted(usage_totals):
+        total_usage = usage_totals[id_bahan]
+        updated = BahanBaku.query.filter(
+            BahanBaku.id_bahan == id_bahan,
+            BahanBaku.stok_awal >= total_usage
+        ).update(
+            {
+                'stok_awal': BahanBaku.stok_awal - total_usage,
+                'updated_at': now
+            },
+            synchronize_session=False
+        )
+        if not updated:
+            db.session.rollback()
+            bahan = BahanBaku.query.get(id_bahan)
+            if not bahan:
+                raise ResourceNotFoundError(f'Bahan with ID {id_bahan} not found')
+            raise StockError(
+                f'Insufficient stock for {bahan.nama_bahan}. ' +
+                f'Required: {total_usage:.2f} {bahan.satuan}, ' +
+                f'Available: {bahan.stok_awal:.2f} {bahan.satuan}'
+            )
+    
+    record_mutasi(JENIS_PENJUALAN, {
+        id_bahan: -total_usage for id_bahan, total_usage in usage_totals.items()
+    })
+
+def parse_penjualan(data):
+    """
+    Validate a sales payload
+    Returns: tuple of (id_menu, quantity, sale_date)
+    """
+    if not isinstance(data, dict):
+        raise ValidationError('Penjualan must be a JSON object')
+    
+    # Validate required fields
+    required_fields = ['id_menu', 'tanggal', 'jumlah_terjual']
+    for field in required_fields:
+        if field not in data:
+            raise ValidationError(f'Missing required field: {field}')
+    
+    try:
+        id_menu = int(data['id_menu'])
+    except (TypeError, ValueError):
+        raise ValidationError('id_menu must be an integer')
+    
+    # Validate quantity
+    try:
+        quantity = int(data['jumlah_terjual'])
+        if quantity <= 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValidationError('jumlah_terjual must be a positive integer')
+    
+    # Validate and parse date
+    try:
+        sale_date = datetime.strptime(data['tanggal'], '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValidationError('Invalid date format. Use YYYY-MM-DD')
+    
+    return id_menu, quantity, sale_date
+
+def read_batch_payload():
+    """
+    Read a batch of sales from the request body
+    Accepts a JSON array, a JSON object with a 'penjualan' array, or NDJSON
+    (one sale per line). Lines that fail to parse are returned as None so
+    they can be reported per item.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)
+    else:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get('penjualan')
+        if not isinstance(data, list):
+            raise ValidationError('Batch must be a JSON array of penjualan or NDJSON')
+        items = data
+    
+    if not items:
+        raise ValidationError('Batch must contain at least one penjualan')
+    if len(items) > MAX_BATCH_SIZE:
+        raise ValidationError(f'Batch cannot contain more than {MAX_BATCH_SIZE} penjualan')
+    
+    return items
+
+def publish_sales(sales, usage_totals):
+    """
+    Queue stream events for sales and the stock they took, sent on commit
+    sales is a list of (penjualan, usage_details) pairs.
+    """
+    publish_on_commit('sale_recorded', {
+        'sales': [
+            {
+                'id_penjualan': penjualan.id_penjualan,
+                'id_menu': penjualan.id_menu,
+                'tanggal': penjualan.tanggal,
+                'jumlah_terjual': penjualan.jumlah_terjual,
+                'total_cost': sum(usage['cost'] for usage in usage_details),
+                'total_waste': sum(usage['jumlah_waste'] for usage in usage_details)
+            }
+            for penjualan, usage_details in sales
+        ]
+    })
+    publish_on_commit('stock_changed', {
+        'changes': [
+            {'id_bahan': id_bahan, 'delta': -amount}
+            for id_bahan, amount in sorted(usage_totals.items())
+        ]
+    })
+
 @penjualan_bp.route('/penjualan', methods=['GET'])
 def get_all_penjualan():
-    """Get all sales records"""
-    penjualan_list = Penjualan.query.all()
+    """
+    Get sales records, one keyset page at a time
+    Filters: start_date and end_date (YYYY-MM-DD, inclusive) and id_menu
+    """
+    fields = parse_fields(request.args, Penjualan.__table__.columns.keys())
+    query = db.session.query(
+        *select_columns(Penjualan, fields, Penjualan.id_penjualan)
+    )
+    
+    try:
+        if 'start_date' in request.args:
+            start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date()
+            query = query.filter(Penjualan.tanggal >= start_date)
+        if 'end_date' in request.args:
+            end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date()
+            query = query.filter(Penjualan.tanggal <= end_date)
+    except ValueError:
+        raise ValidationError('Invalid date format. Use YYYY-MM-DD')
+    
+    if 'id_menu' in request.args:
+        try:
+            query = query.filter(Penjualan.id_menu == int(request.args['id_menu']))
+        except ValueError:
+            raise ValidationError('id_menu must be an integer')
+    
+    rows, pagination = paginate(query, Penjualan.id_penjualan, request.args)
     return jsonify({
         'status': 'success',
-        'data': [penjualan.to_dict() for penjualan in penjualan_list]
+        'data': rows_to_dicts(rows, fields),
+        'pagination': pagination
     })
 
 @penjualan_bp.route('/penjualan/<int:id_penjualan>', methods=['GET'])
@@ -70,68 +248,54 @@ def get_penjualan(id_penjualan):
     })
 
 @penjualan_bp.route('/penjualan', methods=['POST'])
+@idempotent
 def create_penjualan():
-    """Create a new sales record"""
-    data = request.get_json()
-    
-    # Validate required fields
-    required_fields = ['id_menu', 'tanggal', 'jumlah_terjual']
-    for field in required_fields:
-        if field not in data:
-            raise ValidationError(f'Missing required field: {field}')
+    """
+    Create a new sales record
+    Retries sent with the same Idempotency-Key get the first response back.
+    """
+    id_menu, quantity, sale_date = parse_penjualan(request.get_json())
     
     # Validate menu exists
-    menu = Menu.query.get(data['id_menu'])
-    if not menu:
-        raise ResourceNotFoundError(f'Menu with ID {data["id_menu"]} not found')
-    
-    # Validate quantity
-    try:
-        quantity = int(data['jumlah_terjual'])
-        if quantity <= 0:
-            raise ValueError
-    except ValueError:
-        raise ValidationError('jumlah_terjual must be a positive integer')
-    
-    # Validate and parse date
-    try:
-        sale_date = datetime.strptime(data['tanggal'], '%Y-%m-%d').date()
-    except ValueError:
-        raise ValidationError('Invalid date format. Use YYYY-MM-DD')
+    resep_vector = get_resep_vector(id_menu)
+    if resep_vector is None:
+        raise ResourceNotFoundError(f'Menu with ID {id_menu} not found')
     
     # Calculate usage and costs
-    usage_details = calculate_usage_and_cost(menu, quantity)
+    available_stock = load_stock(item.id_bahan for item in resep_vector)
+    usage_details = calculate_usage_and_cost(resep_vector, quantity, available_stock)
+    
+    # Take the stock first; this rolls back and raises if another sale won
+    usage_totals = {usage['id_bahan']: usage['total_usage'] for usage in usage_details}
+    apply_stock_usage(usage_totals)
     
     # Create sales record
     penjualan = Penjualan(
-        id_menu=menu.id_menu,
+        id_menu=id_menu,
         tanggal=sale_date,
         jumlah_terjual=quantity
     )
     db.session.add(penjualan)
+    db.session.flush()
     
-    # Create usage logs and update stock
+    # Create usage logs
     total_cost = 0
+    log_rows = []
     for usage in usage_details:
-        # Create usage log
-        log = LogPemakaian(
-            id_penjualan=penjualan.id_penjualan,
-            id_bahan=usage['id_bahan'],
-            jumlah_terpakai=usage['jumlah_terpakai'],
-            jumlah_waste=usage['jumlah_waste'],
-            total_cost=usage['cost']
-        )
-        db.session.add(log)
-        
-        # Update stock
-        bahan = BahanBaku.query.get(usage['id_bahan'])
-        bahan.stok_awal -= usage['total_usage']
-        
+        log_rows.append({
+            'id_penjualan': penjualan.id_penjualan,
+            'id_bahan': usage['id_bahan'],
+            'jumlah_terpakai': usage['jumlah_terpakai'],
+            'jumlah_waste': usage['jumlah_waste'],
+            'total_cost': usage['cost']
+        })
         total_cost += usage['cost']
+    write_usage_logs(log_rows, [penjualan])
     
-    db.session.commit()
+    record_sales([(sale_date, id_menu, quantity, usage_details)])
+    publish_sales([(penjualan, usage_details)], usage_totals)
     
-    return jsonify({
+    response = {
         'status': 'success',
         'message': 'Penjualan recorded successfully',
         'data': {
@@ -139,42 +303,168 @@ def create_penjualan():
             'usage_details': usage_details,
             'total_cost': total_cost
         }
-    }), 201
+    }
+    remember_response(response, 201)
+    db.session.commit()
+    
+    return jsonify(response), 201
+
+@penjualan_bp.route('/penjualan/batch', methods=['POST'])
+@idempotent
+def create_penjualan_batch():
+    """
+    Create many sales records in a single transaction
+    Every sale is validated and stock-checked up front against the stock left
+    by the sales before it in the batch. Invalid sales are reported per item
+    and skipped; the rest are written with bulk inserts and one stock update
+    per ingredient.
+    """
+    items = read_batch_payload()
+    
+    parsed = []
+    for item in items:
+        try:
+            if item is None:
+                raise ValidationError('Invalid JSON')
+            parsed.append(parse_penjualan(item))
+        except APIError as error:
+            parsed.append(error)
+    
+    # Load every referenced recipe and its ingredients' stock up front
+    resep_vectors = get_resep_vectors(
+        sale[0] for sale in parsed if not isinstance(sale, APIError)
+    )
+    available_stock = load_stock(
+        item.id_bahan
+        for resep_vector in resep_vectors.values()
+        for item in resep_vector
+    )
+    
+    results = []
+    accepted = []
+    for index, sale in enumerate(parsed):
+        try:
+            if isinstance(sale, APIError):
+                raise sale
+            id_menu, quantity, sale_date = sale
+            resep_vector = resep_vectors.get(id_menu)
+            if resep_vector is None:
+                raise ResourceNotFoundError(f'Menu with ID {id_menu} not found')
+            
+            # Check stock against what the earlier sales in the batch left
+            usage_details = calculate_usage_and_cost(resep_vector, quantity, available_stock)
+        except APIError as error:
+            results.append({
+                'index': index,
+                'status': 'error',
+                'message': error.message
+            })
+            continue
+        
+        for usage in usage_details:
+            available_stock[usage['id_bahan']] -= usage['total_usage']
+        
+        # Set here because the batch insert below skips the ORM's defaults
+        penjualan = Penjualan(
+            id_menu=id_menu,
+            tanggal=sale_date,
+            jumlah_terjual=quantity,
+            created_at=datetime.utcnow()
+        )
+        accepted.append((index, penjualan, usage_details))
+        results.append(None)
+    
+    if accepted:
+        usage_totals = {}
+        for _, _, usage_details in accepted:
+            for usage in usage_details:
+                usage_totals[usage['id_bahan']] = (
+                    usage_totals.get(usage['id_bahan'], 0) + usage['total_usage']
+                )
+        
+        # Take the stock for the whole batch once per ingredient
+        apply_stock_usage(usage_totals)
+        
+        # Insert sales first, in one statement, so the usage logs can reference their IDs
+        sales = [penjualan for _, penjualan, _ in accepted]
+        ids = insert_returning_ids(Penjualan, [
+            {
+                'id_menu': penjualan.id_menu,
+                'tanggal': penjualan.tanggal,
+                'jumlah_terjual': penjualan.jumlah_terjual,
+                'created_at': penjualan.created_at
+            }
+            for penjualan in sales
+        ])
+        for penjualan, id_penjualan in zip(sales, ids):
+            penjualan.id_penjualan = id_penjualan
+        
+        log_rows = []
+        for index, penjualan, usage_details in accepted:
+            total_cost = 0
+            for usage in usage_details:
+                log_rows.append({
+                    'id_penjualan': penjualan.id_penjualan,
+                    'id_bahan': usage['id_bahan'],
+                    'jumlah_terpakai': usage['jumlah_terpakai'],
+                    'jumlah_waste': usage['jumlah_waste'],
+                    'total_cost': usage['cost']
+                })
+                total_cost += usage['cost']
+            
+            results[index] = {
+                'index': index,
+                'status': 'success',
+                'id_penjualan': penjualan.id_penjualan,
+                'total_cost': total_cost
+            }
+        
+        write_usage_logs(log_rows, sales)
+        record_sales([
+            (penjualan.tanggal, penjualan.id_menu, penjualan.jumlah_terjual, usage_details)
+            for _, penjualan, usage_details in accepted
+        ])
+        publish_sales(
+            [(penjualan, usage_details) for _, penjualan, usage_details in accepted],
+            usage_totals
+        )
+    
+    failed = len(items) - len(accepted)
+    status_code = 201 if not failed else 207
+    response = {
+        'status': 'success',
+        'message': f'{len(accepted)} penjualan recorded, {failed} failed',
+        'data': {
+            'created': len(accepted),
+            'failed': failed,
+            'results': results
+        }
+    }
+    remember_response(response, status_code)
+    db.session.commit()
+    
+    return jsonify(response), status_code
 
 @penjualan_bp.route('/penjualan/daily/<string:date>', methods=['GET'])
 def get_daily_sales(date):
-    """Get sales summary for a specific date"""
+    """
+    Get sales summary for a specific date
+    Totals come from the daily rollup. The individual sales are only listed
+    when requested with ?include_sales=1.
+    """
     try:
         target_date = datetime.strptime(date, '%Y-%m-%d').date()
     except ValueError:
         raise ValidationError('Invalid date format. Use YYYY-MM-DD')
     
-    # Get all sales for the date
-    sales = Penjualan.query.filter_by(tanggal=target_date).all()
-    
-    # Calculate totals
-    total_sales = len(sales)
-    total_items = sum(sale.jumlah_terjual for sale in sales)
+    data = {'date': date}
+    data.update(get_daily_totals(target_date))
     
-    # Get usage logs for these sales
-    usage_logs = LogPemakaian.query.filter(
-        LogPemakaian.id_penjualan.in_([sale.id_penjualan for sale in sales])
-    ).all()
-    
-    # Calculate totals from logs
-    total_usage = sum(log.jumlah_terpakai for log in usage_logs)
-    total_waste = sum(log.jumlah_waste for log in usage_logs)
-    total_cost = sum(log.total_cost for log in usage_logs)
+    if request.args.get('include_sales', '').lower() in ('1', 'true', 'yes'):
+        sales = Penjualan.query.filter_by(tanggal=target_date).all()
+        data['sales'] = [sale.to_dict() for sale in sales]
     
     return jsonify({
         'status': 'success',
-        'data': {
-            'date': date,
-            'total_sales': total_sales,
-            'total_items_sold': total_items,
-            'total_ingredient_usage': total_usage,
-            'total_waste': total_waste,
-            'total_cost': total_cost,
-            'sales': [sale.to_dict() for sale in sales]
-        }
+        'data': data
     })
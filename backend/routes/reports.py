@@ -0,0 +1,207 @@
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, current_app, request
+from database import current_engine, db
+from outlets import outlet_context, parse_outlets
+from models import BahanBaku, Menu, RekapHarianMenu, RekapHarianBahan
+from errors import ValidationError
+from serializers import jsonify
+from sqlalchemy import func, select
+from datetime import datetime, timedelta
+
+reports_bp = Blueprint('reports', __name__)
+
+BUCKETS = ('day', 'week', 'month')
+
+# Longest range a single report may cover
+MAX_RANGE_DAYS = 366
+
+def parse_report_args(args):
+    """
+    Validate the date range and bucket of a report request
+    Defaults to the last 30 days bucketed by day.
+    Returns: tuple of (start, end, bucket)
+    """
+    try:
+        end = datetime.strptime(args['end'], '%Y-%m-%d').date() if 'end' in args \
+            else datetime.utcnow().date()
+        start = datetime.strptime(args['start'], '%Y-%m-%d').date() if 'start' in args \
+            else end - timedelta(days=29)
+    except ValueError:
+        raise ValidationError('Invalid date format. Use YYYY-MM-DD')
+    
+    if start > end:
+        raise ValidationError('start must not be after end')
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise ValidationError(f'Report range cannot exceed {MAX_RANGE_DAYS} days')
+    
+    bucket = args.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        raise ValidationError(f'bucket must be one of: {", ".join(BUCKETS)}')
+    
+    return start, end, bucket
+
+def bucket_column(column, bucket, dialect_name):
+    """Truncate a date column to the first day of its day, week or month"""
+    if dialect_name == 'postgresql':
+        return func.date(func.date_trunc(bucket, column))
+    if bucket == 'week':
+        # Monday of the week: next Sunday-or-today, minus six days
+        return func.date(column, 'weekday 0', '-6 days')
+    if bucket == 'month':
+        return func.date(column, 'start of month')
+    return func.date(column)
+
+def bahan_report_query(start, end, bucket, dialect_name):
+    """Build the per-ingredient usage report as a single GROUP BY statement"""
+    period = bucket_column(RekapHarianBahan.tanggal, bucket, dialect_name).label('periode')
+    totals = select(
+        period,
+        RekapHarianBahan.id_bahan,
+        func.sum(RekapHarianBahan.jumlah_terpakai).label('jumlah_terpakai'),
+        func.sum(RekapHarianBahan.jumlah_waste).label('jumlah_waste'),
+        func.sum(RekapHarianBahan.total_cost).label('total_cost')
+    ).where(
+        RekapHarianBahan.tanggal.between(start, end)
+    ).group_by(period, RekapHarianBahan.id_bahan).subquery()
+    
+    return select(
+        totals.c.periode,
+        totals.c.id_bahan,
+        BahanBaku.nama_bahan,
+        BahanBaku.satuan,
+        totals.c.jumlah_terpakai,
+        totals.c.jumlah_waste,
+        totals.c.total_cost
+    ).outerjoin(
+        BahanBaku, BahanBaku.id_bahan == totals.c.id_bahan
+    ).order_by(totals.c.periode, totals.c.id_bahan)
+
+def menu_report_query(start, end, bucket, dialect_name):
+    """Build the per-menu sales and usage report as a single GROUP BY statement"""
+    period = bucket_column(RekapHarianMenu.tanggal, bucket, dialect_name).label('periode')
+    totals = select(
+        period,
+        RekapHarianMenu.id_menu,
+        func.sum(RekapHarianMenu.jumlah_transaksi).label('jumlah_transaksi'),
+        func.sum(RekapHarianMenu.jumlah_terjual).label('jumlah_terjual'),
+        func.sum(RekapHarianMenu.jumlah_terpakai).label('jumlah_terpakai'),
+        func.sum(RekapHarianMenu.jumlah_waste).label('jumlah_waste'),
+        func.sum(RekapHarianMenu.total_cost).label('total_cost')
+    ).where(
+        RekapHarianMenu.tanggal.between(start, end)
+    ).group_by(period, RekapHarianMenu.id_menu).subquery()
+    
+    return select(
+        totals.c.periode,
+        totals.c.id_menu,
+        Menu.nama_menu,
+        totals.c.jumlah_transaksi,
+        totals.c.jumlah_terjual,
+        totals.c.jumlah_terpakai,
+        totals.c.jumlah_waste,
+        totals.c.total_cost
+    ).outerjoin(
+        Menu, Menu.id_menu == totals.c.id_menu
+    ).order_by(totals.c.periode, totals.c.id_menu)
+
+def run_report(build_query):
+    """Run a report query for the current request and wrap the rows"""
+    start, end, bucket = parse_report_args(request.args)
+    query = build_query(start, end, bucket, current_engine().dialect.name)
+    rows = db.session.execute(query)
+    
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'bucket': bucket,
+            'rows': [
+                {key: str(value) if key == 'periode' else value
+                 for key, value in row._mapping.items()}
+                for row in rows
+            ]
+        }
+    })
+
+def fan_out(build_query, start, end, bucket, outlets):
+    """
+    Run a report query at several outlets in parallel
+    Each outlet's query runs in its own thread against its own database.
+    Returns: list of (outlet, rows) in the order of outlets
+    """
+    app = current_app._get_current_object()
+    
+    def run(outlet):
+        with app.app_context(), outlet_context(outlet):
+            try:
+                query = build_query(start, end, bucket, current_engine().dialect.name)
+                return outlet, db.session.execute(query).mappings().all()
+            finally:
+                db.session.remove()
+    
+    workers = max(1, min(len(outlets), app.config['OUTLET_FANOUT_WORKERS']))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run, outlets))
+
+def run_outlet_report(build_query, name_columns):
+    """
+    Run a report at every outlet (or those in ?outlets=) and merge the results
+    IDs are local to each outlet's database, so rows are merged by period
+    and name. Each outlet's overall totals are listed too.
+    """
+    start, end, bucket = parse_report_args(request.args)
+    outlets = parse_outlets(request.args.get('outlets')) or current_app.config['OUTLETS']
+    unknown = [outlet for outlet in outlets if outlet not in current_app.config['OUTLETS']]
+    if unknown:
+        raise ValidationError(f'Unknown outlets: {", ".join(unknown)}')
+    
+    merged = {}
+    totals = {}
+    for outlet, rows in fan_out(build_query, start, end, bucket, outlets):
+        outlet_totals = totals.setdefault(outlet, {})
+        for row in rows:
+            key = (str(row['periode']),) + tuple(row[column] for column in name_columns)
+            merged_row = merged.get(key)
+            if merged_row is None:
+                merged_row = merged[key] = dict(zip(('periode',) + name_columns, key), outlets=[])
+            merged_row['outlets'].append(outlet)
+            for column, value in row.items():
+                if column == 'periode' or column in name_columns or column.startswith('id_'):
+                    continue
+                merged_row[column] = merged_row.get(column, 0) + (value or 0)
+                outlet_totals[column] = outlet_totals.get(column, 0) + (value or 0)
+    
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'bucket': bucket,
+            'outlets': totals,
+            'rows': sorted(
+                merged.values(),
+                key=lambda row: (row['periode'],) + tuple(str(row[column]) for column in name_columns)
+            )
+        }
+    })
+
+@reports_bp.route('/reports/bahan', methods=['GET'])
+def get_bahan_report():
+    """Get ingredient usage, waste and cost per bucket over a date range"""
+    return run_report(bahan_report_query)
+
+@reports_bp.route('/reports/menu', methods=['GET'])
+def get_menu_report():
+    """Get sales, usage, waste and cost per menu per bucket over a date range"""
+    return run_report(menu_report_query)
+
+@reports_bp.route('/reports/outlets/bahan', methods=['GET'])
+def get_outlets_bahan_report():
+    """Get ingredient usage across outlets, merged by period and ingredient name"""
+    return run_outlet_report(bahan_report_query, ('nama_bahan', 'satuan'))
+
+@reports_bp.route('/reports/outlets/menu', methods=['GET'])
+def get_outlets_menu_report():
+    """Get menu sales across outlets, merged by period and menu name"""
+    return run_outlet_report(menu_report_query, ('nama_menu',))
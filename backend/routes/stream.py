@@ -0,0 +1,48 @@
+from flask import Blueprint, Response, current_app, request
+from outlets import current_outlet
+from serializers import jsonify
+
+# Seconds a client turned away at the subscriber limit should wait
+RETRY_AFTER_SECONDS = 30
+
+stream_bp = Blueprint('stream', __name__)
+
+@stream_bp.route('/stream', methods=['GET'])
+def stream_events():
+    """
+    Server-sent events with live changes
+    Events: sale_recorded, stock_changed, bahan_changed, menu_changed, and
+    reset when the client must reload because it missed events. Only the
+    requested outlet's events are sent. Past EVENT_MAX_SUBSCRIBERS open
+    streams the answer is 503 with Retry-After.
+    """
+    broker = current_app.extensions['event_broker']
+    if not broker.add_subscriber():
+        return jsonify({
+            'status': 'error',
+            'message': 'Too many open event streams; retry later'
+        }), 503, {'Retry-After': str(RETRY_AFTER_SECONDS)}
+    
+    heartbeat = current_app.config['EVENT_HEARTBEAT_SECONDS']
+    last_event_id = request.headers.get('Last-Event-ID')
+    # The generator outlives the request, so the outlet is read now
+    outlet = current_outlet()
+    
+    def generate():
+        # Ask EventSource to reconnect after 3 seconds if the stream drops
+        yield b'retry: 3000\n\n'
+        for message in broker.listen(last_event_id, heartbeat, outlet):
+            yield message if message is not None else b': keep-alive\n\n'
+    
+    response = Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # Keep reverse proxies from buffering the stream
+            'X-Accel-Buffering': 'no'
+        }
+    )
+    # Runs when the client disconnects, whether or not the stream started
+    response.call_on_close(broker.remove_subscriber)
+    return response
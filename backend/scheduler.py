@@ -0,0 +1,369 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from database import db
+from models import ScheduledJob
+from outlets import outlet_context
+from errors import JobRunningError, ResourceNotFoundError
+from jobs import DEFAULT_JOBS
+from serializers import dumps
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# Shorthand schedules accepted in place of five cron fields
+CRON_ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *'
+}
+
+# (lowest, highest) value of each cron field: minute, hour, day, month, weekday
+CRON_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+# How far ahead next_after() looks; far enough for a 29 February schedule
+SEARCH_DAYS = 366 * 8
+
+# Schedulers to reset in a forked child, e.g. a gunicorn worker of a preloaded app
+_schedulers = weakref.WeakSet()
+
+def _parse_field(field, lowest, highest):
+    """Expand one cron field (*, */n, a, a-b, a-b/n and lists of these) into a set"""
+    values = set()
+    for part in field.split(','):
+        expression, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if expression == '*':
+            start, end = lowest, highest
+        elif '-' in expression:
+            start, end = (int(value) for value in expression.split('-', 1))
+        else:
+            start = int(expression)
+            end = highest if step > 1 else start
+        if step < 1 or not lowest <= start <= end <= highest:
+            raise ValueError(f'{part!r} is outside {lowest}-{highest}')
+        values.update(range(start, end + 1, step))
+    return values
+
+class CronSchedule:
+    """
+    A five-field cron schedule: minute, hour, day of month, month and day of
+    week (0 or 7 is Sunday)
+    As in cron, when both day fields are restricted a day matching either
+    one is enough.
+    """
+    def __init__(self, expression):
+        self.expression = expression
+        fields = CRON_ALIASES.get(expression, expression).split()
+        if len(fields) != 5:
+            raise ValueError(f'Cron schedule {expression!r} needs five fields')
+        try:
+            self.minutes, self.hours, self.days, self.months, weekdays = (
+                _parse_field(field, lowest, highest)
+                for field, (lowest, highest) in zip(fields, CRON_RANGES)
+            )
+        except ValueError as error:
+            raise ValueError(f'Invalid cron schedule {expression!r}: {error}')
+        self.weekdays = {weekday % 7 for weekday in weekdays}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+    
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        # isoweekday() is 1 for Monday to 7 for Sunday; cron counts Sunday as 0
+        weekday = moment.isoweekday() % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+    
+    def matches(self, moment):
+        return (
+            moment.minute in self.minutes
+            and moment.hour in self.hours
+            and moment.month in self.months
+            and self._day_matches(moment)
+        )
+    
+    def next_after(self, moment):
+        """The first matching minute after moment, or None if there is none"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=SEARCH_DAYS)
+        while candidate < limit:
+            if candidate.month not in self.months or not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        return None
+
+class Job:
+    """A named background task and when it runs"""
+    def __init__(self, name, func, schedule, description='', lease_seconds=3600):
+        self.name = name
+        self.func = func
+        # None means the job only runs when triggered
+        self.schedule = CronSchedule(schedule) if schedule else None
+        self.description = description
+        # A run whose worker dies frees the job again after this long
+        self.lease_seconds = lease_seconds
+
+class Scheduler:
+    """
+    In-process cron-like scheduler for background jobs
+    A ticker thread wakes every minute and hands due jobs to a thread pool.
+    Before running, a worker claims the job's slot with one conditional
+    UPDATE on scheduled_job in the default outlet's database, so with
+    several workers or servers each slot runs once and a job never runs
+    twice at the same time. Schedules are in UTC, like every timestamp in
+    the database.
+    """
+    def __init__(self, app, workers=2):
+        self.app = app
+        self.workers = workers
+        self.jobs = {}
+        self._reset_process_state()
+        _schedulers.add(self)
+    
+    def _reset_process_state(self):
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self.executor = None
+        self.thread = None
+        self.running = set()
+        self.rows_ready = False
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+    
+    def add_job(self, name, func, schedule, description='', lease_seconds=3600):
+        self.jobs[name] = Job(name, func, schedule, description, lease_seconds)
+    
+    def after_fork(self):
+        """Forget the parent's threads; the child starts its own when serving"""
+        self._reset_process_state()
+    
+    def _executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='job'
+                )
+            return self.executor
+    
+    def ensure_started(self):
+        """Start the ticker thread in this process unless it already runs"""
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._tick, name='job-scheduler', daemon=True)
+            self.thread.start()
+    
+    def shutdown(self, wait=False):
+        """Stop scheduling; running jobs finish unless the process exits first"""
+        self.stop_event.set()
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+    
+    @contextmanager
+    def _session(self):
+        """App context on the default outlet, whose database holds the leases"""
+        with self.app.app_context(), outlet_context(self.app.config['DEFAULT_OUTLET']):
+            try:
+                yield
+            finally:
+                db.session.remove()
+    
+    def _ensure_rows(self):
+        """Add the scheduled_job rows that the leases are taken on"""
+        if self.rows_ready:
+            return
+        with self._session():
+            known = {name for name, in db.session.query(ScheduledJob.name)}
+            missing = [name for name in self.jobs if name not in known]
+            if missing:
+                try:
+                    db.session.bulk_insert_mappings(ScheduledJob, [
+                        {'name': name, 'run_count': 0, 'total_duration_ms': 0} for name in missing
+                    ])
+                    db.session.commit()
+                except IntegrityError:
+                    # Another worker added them first
+                    db.session.rollback()
+        self.rows_ready = True
+    
+    def _claim(self, job, slot):
+        """Take the job's lease for a slot; False if that slot ran or a run holds the lease"""
+        now = datetime.utcnow()
+        with self._session():
+            claimed = ScheduledJob.query.filter(
+                ScheduledJob.name == job.name,
+                or_(ScheduledJob.slot.is_(None), ScheduledJob.slot < slot),
+                or_(ScheduledJob.lease_until.is_(None), ScheduledJob.lease_until < now)
+            ).update({
+                'slot': slot,
+                'owner': self.owner,
+                'lease_until': now + timedelta(seconds=job.lease_seconds),
+                'last_started_at': now
+            }, synchronize_session=False)
+            db.session.commit()
+            return claimed == 1
+    
+    def _finish(self, job, seconds, status, result=None, error=None):
+        duration_ms = seconds * 1000
+        with self._session():
+            ScheduledJob.query.filter(
+                ScheduledJob.name == job.name,
+                ScheduledJob.owner == self.owner
+            ).update({
+                'lease_until': None,
+                'last_finished_at': datetime.utcnow(),
+                'last_status': status,
+                'last_duration_ms': duration_ms,
+                'last_error': error,
+                'last_result': dumps(result).decode() if result is not None else None,
+                'run_count': ScheduledJob.run_count + 1,
+                'total_duration_ms': ScheduledJob.total_duration_ms + duration_ms
+            }, synchronize_session=False)
+            db.session.commit()
+    
+    def _execute(self, job):
+        self.running.add(job.name)
+        start = time.perf_counter()
+        try:
+            with self.app.app_context():
+                try:
+                    result = job.func()
+                finally:
+                    db.session.remove()
+        except Exception as error:
+            logger.exception('Job %s failed', job.name)
+            self._finish(job, time.perf_counter() - start, 'error', error=repr(error))
+        else:
+            seconds = time.perf_counter() - start
+            logger.info('Job %s finished in %.1f ms', job.name, seconds * 1000)
+            self._finish(job, seconds, 'success', result=result)
+        finally:
+            self.running.discard(job.name)
+    
+    def _submit(self, job, slot):
+        self._ensure_rows()
+        if self._claim(job, slot):
+            self._executor().submit(self._execute, job)
+            return True
+        return False
+    
+    def _tick(self):
+        last_minute = None
+        while not self.stop_event.is_set():
+            minute = datetime.utcnow().replace(second=0, microsecond=0)
+            if minute != last_minute:
+                last_minute = minute
+                for job in self.jobs.values():
+                    if job.schedule is not None and job.schedule.matches(minute):
+                        try:
+                            self._submit(job, minute)
+                        except Exception:
+                            logger.exception('Could not start job %s', job.name)
+            # Wake just after the next minute begins
+            now = datetime.utcnow()
+            self.stop_event.wait(60.05 - now.second - now.microsecond / 1e6)
+    
+    def get_job(self, name):
+        job = self.jobs.get(name)
+        if job is None:
+            raise ResourceNotFoundError(f'Job {name!r} not found')
+        return job
+    
+    def trigger(self, name):
+        """Run a job now in the background, unless a run of it holds the lease"""
+        job = self.get_job(name)
+        if not self._submit(job, datetime.utcnow()):
+            raise JobRunningError(f'Job {name!r} is already running')
+    
+    def run(self, name):
+        """Run a job now in the calling thread, holding its lease"""
+        job = self.get_job(name)
+        self._ensure_rows()
+        if not self._claim(job, datetime.utcnow()):
+            raise JobRunningError(f'Job {name!r} is already running')
+        self._execute(job)
+    
+    def status(self):
+        """Schedule, lease and timing of every job"""
+        with self._session():
+            rows = {row.name: row for row in ScheduledJob.query.all()}
+        now = datetime.utcnow()
+        jobs = []
+        for job in self.jobs.values():
+            row = rows.get(job.name)
+            next_run = job.schedule.next_after(now) if job.schedule else None
+            jobs.append({
+                'name': job.name,
+                'description': job.description,
+                'schedule': job.schedule.expression if job.schedule else None,
+                'next_run': next_run,
+                'running_here': job.name in self.running,
+                'lease_owner': row.owner if row and row.lease_until else None,
+                'lease_until': row.lease_until if row else None,
+                'last_started_at': row.last_started_at if row else None,
+                'last_finished_at': row.last_finished_at if row else None,
+                'last_status': row.last_status if row else None,
+                'last_duration_ms': row.last_duration_ms if row else None,
+                'average_duration_ms': (
+                    row.total_duration_ms / row.run_count if row and row.run_count else None
+                ),
+                'run_count': row.run_count if row else 0,
+                'last_error': row.last_error if row else None,
+                'last_result': json.loads(row.last_result) if row and row.last_result else None
+            })
+        return jobs
+
+def _after_fork_in_child():
+    for scheduler in list(_schedulers):
+        scheduler.after_fork()
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+def get_scheduler():
+    return current_app.extensions['scheduler']
+
+def init_scheduler(app):
+    """
+    Register the background jobs and, when SCHEDULER_ENABLED is set, run
+    them from every serving process
+    The ticker starts with the first request, or right after a gunicorn
+    worker boots, so CLI commands never start it. JOB_SCHEDULE_<NAME>
+    overrides a job's cron schedule; "off" leaves it to manual runs.
+    ADMIN_TOKEN enables the admin job endpoints for that bearer token.
+    """
+    app.config.setdefault('SCHEDULER_ENABLED', os.environ.get('SCHEDULER_ENABLED', '0') == '1')
+    app.config.setdefault('ADMIN_TOKEN', os.environ.get('ADMIN_TOKEN'))
+    app.config.setdefault('SCHEDULER_WORKERS', int(os.environ.get('SCHEDULER_WORKERS', 2)))
+    
+    scheduler = Scheduler(app, workers=app.config['SCHEDULER_WORKERS'])
+    for name, func, schedule, description in DEFAULT_JOBS:
+        setting = 'JOB_SCHEDULE_' + name.upper().replace('-', '_')
+        schedule = app.config.setdefault(setting, os.environ.get(setting, schedule))
+        try:
+            scheduler.add_job(name, func, None if schedule == 'off' else schedule, description)
+        except ValueError as error:
+            raise RuntimeError(f'{setting}: {error}')
+    app.extensions['scheduler'] = scheduler
+    
+    if app.config['SCHEDULER_ENABLED']:
+        @app.before_request
+        def start_scheduler():
+            scheduler.ensure_started()
@@ -0,0 +1,79 @@
+from flask import current_app
+from metrics import timed_serialization
+from datetime import date, datetime
+import json
+import os
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+def _default(value):
+    """Encode values the stdlib encoder does not know, the way orjson does"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def _dumps_stdlib(obj):
+    return json.dumps(obj, default=_default, separators=(',', ':')).encode()
+
+def _dumps_orjson(obj):
+    # orjson writes dates and datetimes in the same format as isoformat()
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+SERIALIZERS = {'json': _dumps_stdlib}
+if orjson is not None:
+    SERIALIZERS['orjson'] = _dumps_orjson
+
+# Active encoder, chosen by init_serializers()
+_dumps = SERIALIZERS.get('orjson', _dumps_stdlib)
+
+def dumps(obj):
+    """Encode an object as compact JSON bytes with the active serializer"""
+    return _dumps(obj)
+
+def jsonify(*args, **kwargs):
+    """Drop-in replacement for flask.jsonify using the active serializer"""
+    if args and kwargs:
+        raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+    if len(args) == 1:
+        data = args[0]
+    else:
+        data = args or kwargs
+    return current_app.response_class(dumps(data), mimetype='application/json')
+
+@timed_serialization
+def rows_to_dicts(rows, fields=None):
+    """
+    Serialize plain result rows without building ORM objects
+    Dates and datetimes are left for the JSON encoder to format.
+    """
+    result = []
+    for row in rows:
+        data = row._asdict()
+        if fields is not None:
+            data = {key: value for key, value in data.items() if key in fields}
+        result.append(data)
+    return result
+
+def select_columns(model, fields, key_column):
+    """Columns of a model to load for a projection, always including the key"""
+    columns = model.__table__.columns
+    if fields is None:
+        return list(columns)
+    return [column for column in columns if column.key in fields or column.key == key_column.key]
+
+def use_serializer(name):
+    """Switch the active JSON serializer"""
+    global _dumps
+    if name not in SERIALIZERS:
+        raise RuntimeError(f'JSON serializer {name!r} is not available')
+    _dumps = SERIALIZERS[name]
+
+def init_serializers(app):
+    """Pick the JSON serializer: JSON_SERIALIZER=orjson|json, orjson when installed"""
+    use_serializer(app.config.setdefault(
+        'JSON_SERIALIZER',
+        os.environ.get('JSON_SERIALIZER', 'orjson' if orjson is not None else 'json')
+    ))
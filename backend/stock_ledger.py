@@ -0,0 +1,169 @@
+from database import db
+from models import BahanBaku, MutasiStok, SnapshotStok
+from errors import ResourceNotFoundError, StockError
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+from datetime import datetime
+
+# Kinds of stock movement in the ledger
+JENIS_AWAL = 'awal'
+JENIS_PENERIMAAN = 'penerimaan'
+JENIS_PENJUALAN = 'penjualan'
+JENIS_PENYESUAIAN = 'penyesuaian'
+JENIS_MUTASI = (JENIS_AWAL, JENIS_PENERIMAAN, JENIS_PENJUALAN, JENIS_PENYESUAIAN)
+
+# Attempts at setting an absolute stock level while sales keep changing it
+SET_STOCK_ATTEMPTS = 5
+
+def record_mutasi(jenis, deltas, keterangan=None):
+    """
+    Append ledger rows to the current transaction
+    deltas maps id_bahan to the signed change in stock it already received.
+    """
+    now = datetime.utcnow()
+    db.session.bulk_insert_mappings(MutasiStok, [
+        {
+            'id_bahan': id_bahan,
+            'jenis': jenis,
+            'jumlah': delta,
+            'keterangan': keterangan,
+            'created_at': now
+        }
+        for id_bahan, delta in sorted(deltas.items())
+    ])
+
+def _get_bahan(id_bahan):
+    bahan = BahanBaku.query.get(id_bahan)
+    if not bahan:
+        raise ResourceNotFoundError(f'Bahan with ID {id_bahan} not found')
+    return bahan
+
+def change_stock(id_bahan, delta, jenis, keterangan=None):
+    """
+    Apply a receipt or adjustment to an ingredient's stock and the ledger
+    Like a sale, the UPDATE only matches while the stock stays non-negative.
+    """
+    updated = BahanBaku.query.filter(
+        BahanBaku.id_bahan == id_bahan,
+        BahanBaku.stok_awal + delta >= 0
+    ).update(
+        {
+            'stok_awal': BahanBaku.stok_awal + delta,
+            'updated_at': datetime.utcnow()
+        },
+        synchronize_session=False
+    )
+    if not updated:
+        bahan = _get_bahan(id_bahan)
+        raise StockError(
+            f'Stock of {bahan.nama_bahan} cannot go below zero. ' +
+            f'Change: {delta:.2f} {bahan.satuan}, ' +
+            f'Available: {bahan.stok_awal:.2f} {bahan.satuan}'
+        )
+    record_mutasi(jenis, {id_bahan: delta}, keterangan)
+
+def set_stock(id_bahan, stok, keterangan=None):
+    """
+    Set an ingredient's stock to a counted level, recording the difference
+    The UPDATE is guarded by the level it was computed from, so a sale
+    committed in between makes it retry rather than get lost.
+    Returns: the recorded change
+    """
+    for _ in range(SET_STOCK_ATTEMPTS):
+        current = db.session.query(BahanBaku.stok_awal).filter(
+            BahanBaku.id_bahan == id_bahan
+        ).scalar()
+        if current is None:
+            raise ResourceNotFoundError(f'Bahan with ID {id_bahan} not found')
+        
+        updated = BahanBaku.query.filter(
+            BahanBaku.id_bahan == id_bahan,
+            BahanBaku.stok_awal == current
+        ).update(
+            {'stok_awal': stok, 'updated_at': datetime.utcnow()},
+            synchronize_session=False
+        )
+        if updated:
+            delta = stok - current
+            if delta:
+                record_mutasi(JENIS_PENYESUAIAN, {id_bahan: delta}, keterangan)
+            return delta
+    raise StockError('Stock kept changing while it was being set; try again')
+
+def _balances(*ledger_conditions, moment=None, id_bahan=None):
+    """
+    Query each ingredient's newest snapshot and the ledger total after it
+    The snapshot is found with one seek on (id_bahan, diambil_pada) and the
+    ledger rows after its watermark with a range on (id_bahan, id_mutasi),
+    so the work per ingredient is bounded by the rows since the snapshot.
+    Rows: (id_bahan, snapshot stok or None, ledger total or None)
+    """
+    candidate = aliased(SnapshotStok)
+    newest = select(candidate.id_snapshot).where(
+        candidate.id_bahan == BahanBaku.id_bahan
+    )
+    if moment is not None:
+        newest = newest.where(candidate.diambil_pada <= moment)
+    newest = newest.order_by(candidate.diambil_pada.desc()).limit(1).scalar_subquery()
+    
+    ledger_total = select(func.sum(MutasiStok.jumlah)).where(
+        MutasiStok.id_bahan == BahanBaku.id_bahan,
+        MutasiStok.id_mutasi > func.coalesce(SnapshotStok.id_mutasi_terakhir, 0),
+        *ledger_conditions
+    ).scalar_subquery()
+    
+    query = select(
+        BahanBaku.id_bahan, SnapshotStok.stok, ledger_total
+    ).outerjoin(
+        SnapshotStok, SnapshotStok.id_snapshot == newest
+    )
+    if id_bahan is not None:
+        query = query.where(BahanBaku.id_bahan == id_bahan)
+    return db.session.execute(query.order_by(BahanBaku.id_bahan))
+
+def stock_at(moment, id_bahan=None):
+    """
+    Stock of every ingredient, or of one, at a point in time
+    Starts from each ingredient's newest snapshot taken at or before moment
+    and adds the ledger rows after it up to moment.
+    Returns: dictionary of id_bahan -> stock, leaving out ingredients
+    without any ledger history by then
+    """
+    return {
+        row_id_bahan: (stok or 0) + (total or 0)
+        for row_id_bahan, stok, total in _balances(
+            MutasiStok.created_at <= moment, moment=moment, id_bahan=id_bahan
+        )
+        if stok is not None or total is not None
+    }
+
+def take_snapshots():
+    """
+    Snapshot the stock of every ingredient that moved since its last snapshot
+    Each snapshot extends the previous one with the ledger rows up to the
+    current last row, so it stays consistent however sales interleave.
+    Returns: number of snapshots written
+    """
+    watermark = db.session.query(func.max(MutasiStok.id_mutasi)).scalar()
+    if watermark is None:
+        return 0
+    
+    now = datetime.utcnow()
+    rows = [
+        {
+            'id_bahan': id_bahan,
+            'stok': (stok or 0) + total,
+            'id_mutasi_terakhir': watermark,
+            'diambil_pada': now
+        }
+        for id_bahan, stok, total in _balances(MutasiStok.id_mutasi <= watermark)
+        if total is not None
+    ]
+    db.session.bulk_insert_mappings(SnapshotStok, rows)
+    db.session.commit()
+    return len(rows)
+
+def delete_history(id_bahan):
+    """Remove the ledger rows and snapshots of an ingredient being deleted"""
+    MutasiStok.query.filter(MutasiStok.id_bahan == id_bahan).delete(synchronize_session=False)
+    SnapshotStok.query.filter(SnapshotStok.id_bahan == id_bahan).delete(synchronize_session=False)
@@ -0,0 +1,64 @@
+"""
+Shared fixtures: every test gets its own app on a temporary SQLite file
+
+Run from backend/: python -m pytest tests
+"""
+from contextlib import contextmanager
+import os
+import sys
+
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from database import db, dispose_engines
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'OUTLET_DATABASE_URL': f'sqlite:///{tmp_path}/outlets/{{outlet}}.db'
+    })
+    yield app
+    dispose_engines(app)
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def count_queries(app):
+    """Context manager counting the SQL statements run inside it, as a list of one total"""
+    @contextmanager
+    def counter():
+        total = [0]
+        
+        def count(*args):
+            total[0] += 1
+        
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            yield total
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+    return counter
+
+def add_bahan(client, nama_bahan, stok_awal=1000, harga_per_gram=1):
+    response = client.post('/api/bahan', json={
+        'nama_bahan': nama_bahan,
+        'satuan': 'gram',
+        'stok_awal': stok_awal,
+        'harga_per_gram': harga_per_gram
+    })
+    assert response.status_code == 201, response.json
+    return response.json['data']['id_bahan']
+
+def add_menu(client, nama_menu, resep):
+    response = client.post('/api/menu', json={'nama_menu': nama_menu, 'resep': resep})
+    assert response.status_code == 201, response.json
+    return response.json['data']['id_menu']
@@ -0,0 +1,13 @@
+"""The admin job endpoints need ADMIN_TOKEN"""
+
+def test_admin_disabled_without_token(client):
+    response = client.post('/api/admin/jobs/vacuum-db/run')
+    assert response.status_code == 403
+
+def test_admin_requires_matching_token(app, client):
+    app.config['ADMIN_TOKEN'] = 'secret'
+    assert client.get('/api/admin/jobs').status_code == 403
+    wrong = client.get('/api/admin/jobs', headers={'Authorization': 'Bearer nope'})
+    assert wrong.status_code == 403
+    right = client.get('/api/admin/jobs', headers={'Authorization': 'Bearer secret'})
+    assert right.status_code == 200
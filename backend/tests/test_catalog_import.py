@@ -0,0 +1,69 @@
+"""Catalog imports write in a constant number of statements and validate like the API"""
+from conftest import add_bahan
+
+def import_catalog(client, count_queries, path, records):
+    with count_queries() as total:
+        response = client.post(path, json=records)
+    assert response.status_code == 200, response.json
+    return total[0]
+
+def bahan_records(start, count):
+    return [
+        {'nama_bahan': f'Bahan {i}', 'satuan': 'gram', 'stok_awal': i, 'harga_per_gram': 1}
+        for i in range(start, start + count)
+    ]
+
+def menu_records(start, count, id_bahan):
+    return [
+        {'nama_menu': f'Menu {i}', 'resep': [{'id_bahan': id_bahan, 'jumlah': i, 'waste_percent': 0}]}
+        for i in range(start, start + count)
+    ]
+
+def test_import_query_count_is_flat(client, count_queries):
+    # The first write of each kind also runs one-off queries, so warm up first
+    import_catalog(client, count_queries, '/api/bahan/import', bahan_records(100, 1))
+    one = import_catalog(client, count_queries, '/api/bahan/import', bahan_records(1, 1))
+    many = import_catalog(client, count_queries, '/api/bahan/import', bahan_records(2, 40))
+    assert many == one
+    
+    id_bahan = add_bahan(client, 'Kopi')
+    import_catalog(client, count_queries, '/api/menu/import', menu_records(100, 1, id_bahan))
+    one = import_catalog(client, count_queries, '/api/menu/import', menu_records(1, 1, id_bahan))
+    many = import_catalog(client, count_queries, '/api/menu/import', menu_records(2, 40, id_bahan))
+    assert many == one
+
+def test_imported_rows_get_their_own_ids(client):
+    client.post('/api/bahan/import', json=bahan_records(1, 5))
+    bahan = client.get('/api/bahan').json['data']
+    assert {item['nama_bahan']: item['stok_awal'] for item in bahan} == {
+        f'Bahan {i}': i for i in range(1, 6)
+    }
+    stok = client.get('/api/bahan/stok').json['data']
+    assert {item['id_bahan']: item['stok'] for item in stok} == {
+        item['id_bahan']: item['stok_awal'] for item in bahan
+    }
+    
+    client.post('/api/menu/import', json=menu_records(1, 5, bahan[0]['id_bahan']))
+    for menu in client.get('/api/menu').json['data']:
+        assert [resep['jumlah'] for resep in menu['resep']] == [int(menu['nama_menu'].split()[1])]
+
+def test_import_rejects_ingredient_listed_twice(client):
+    id_bahan = add_bahan(client, 'Kopi')
+    response = client.post('/api/menu/import', json=[{'nama_menu': 'Espresso', 'resep': [
+        {'id_bahan': id_bahan, 'jumlah': 1, 'waste_percent': 0},
+        {'nama_bahan': 'Kopi', 'jumlah': 2, 'waste_percent': 0}
+    ]}])
+    assert response.status_code == 400
+    assert response.json['errors'][0]['message'] == f'Bahan with ID {id_bahan} appears twice in the recipe'
+    assert client.get('/api/menu').json['data'] == []
+
+def test_import_rejects_boolean_amounts(client):
+    id_bahan = add_bahan(client, 'Kopi')
+    for field in ('jumlah', 'waste_percent'):
+        line = {'id_bahan': id_bahan, 'jumlah': 1, 'waste_percent': 0, field: True}
+        imported = client.post('/api/menu/import', json=[{'nama_menu': 'Espresso', 'resep': [line]}])
+        assert imported.status_code == 400
+        assert imported.json['errors'][0]['field'] == field
+        created = client.post('/api/menu', json={'nama_menu': 'Espresso', 'resep': [line]})
+        assert created.status_code == 400
+    assert client.get('/api/menu').json['data'] == []
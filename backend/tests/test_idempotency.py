@@ -0,0 +1,39 @@
+"""Concurrent retries with an expired Idempotency-Key apply the sale once"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import threading
+
+from conftest import add_bahan, add_menu
+from database import db
+from models import IdempotencyKey, Penjualan
+
+THREADS = 8
+
+def test_expired_key_reused_concurrently_runs_once(app, client):
+    id_bahan = add_bahan(client, 'Kopi')
+    id_menu = add_menu(client, 'Espresso', [
+        {'id_bahan': id_bahan, 'jumlah': 1, 'waste_percent': 0}
+    ])
+    sale = {'id_menu': id_menu, 'tanggal': '2024-01-01', 'jumlah_terjual': 1}
+    headers = {'Idempotency-Key': 'retry-1'}
+    assert client.post('/api/penjualan', json=sale, headers=headers).status_code == 201
+    with app.app_context():
+        IdempotencyKey.query.get('retry-1').expires_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+    barrier = threading.Barrier(THREADS)
+    
+    def retry():
+        thread_client = app.test_client()
+        barrier.wait()
+        return thread_client.post('/api/penjualan', json=sale, headers=headers)
+    
+    with ThreadPoolExecutor(THREADS) as executor:
+        futures = [executor.submit(retry) for _ in range(THREADS)]
+    responses = [future.result() for future in futures]
+    
+    assert [response.status_code for response in responses] == [201] * THREADS
+    replayed = [response.headers.get('Idempotent-Replayed') for response in responses]
+    assert replayed.count('true') == THREADS - 1
+    with app.app_context():
+        assert Penjualan.query.count() == 2
+        assert IdempotencyKey.query.get('retry-1').expires_at > datetime.utcnow()
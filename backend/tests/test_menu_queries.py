@@ -0,0 +1,50 @@
+"""The menu read paths load recipes and ingredients in a constant number of queries"""
+import pytest
+
+from conftest import add_bahan, add_menu
+
+INGREDIENTS_PER_MENU = 10
+
+@pytest.fixture
+def add_menus(client):
+    bahan_ids = [add_bahan(client, f'Bahan {i}') for i in range(30)]
+    
+    def add(count):
+        return [
+            add_menu(client, f'Menu {i}', [
+                {'id_bahan': bahan_ids[(i + j) % len(bahan_ids)], 'jumlah': 1, 'waste_percent': 5}
+                for j in range(INGREDIENTS_PER_MENU)
+            ])
+            for i in range(count)
+        ]
+    return add
+
+def queries_for(client, count_queries, path):
+    with count_queries() as total:
+        response = client.get(path)
+    assert response.status_code == 200
+    return total[0], response.json
+
+def test_menu_list_query_count_is_flat(client, count_queries, add_menus):
+    add_menus(1)
+    one, body = queries_for(client, count_queries, '/api/menu')
+    assert len(body['data']) == 1
+    
+    add_menus(24)
+    many, body = queries_for(client, count_queries, '/api/menu')
+    assert len(body['data']) == 25
+    assert all(len(menu['resep']) == INGREDIENTS_PER_MENU for menu in body['data'])
+    assert many == one
+
+def test_single_menu_and_recipe_query_count_is_flat(client, count_queries):
+    small = add_menu(client, 'Small', [
+        {'id_bahan': add_bahan(client, 'Kopi'), 'jumlah': 1, 'waste_percent': 0}
+    ])
+    large = add_menu(client, 'Large', [
+        {'id_bahan': add_bahan(client, f'Bahan {i}'), 'jumlah': 1, 'waste_percent': 0}
+        for i in range(20)
+    ])
+    for path in ('/api/menu/{}', '/api/menu/{}/recipe'):
+        small_queries, _ = queries_for(client, count_queries, path.format(small))
+        large_queries, body = queries_for(client, count_queries, path.format(large))
+        assert large_queries == small_queries
@@ -0,0 +1,19 @@
+"""Outlet configuration"""
+from app import create_app
+from database import dispose_engines
+
+def test_outlets_given_as_comma_separated_string(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'OUTLET_DATABASE_URL': f'sqlite:///{tmp_path}/outlets/{{outlet}}.db',
+        'OUTLETS': 'main, b'
+    })
+    try:
+        assert app.config['OUTLETS'] == ['main', 'b']
+        assert app.config['DEFAULT_OUTLET'] == 'main'
+        response = app.test_client().get('/api/reports/outlets/menu')
+        assert response.status_code == 200
+        assert set(response.json['data']['outlets']) == {'main', 'b'}
+    finally:
+        dispose_engines(app)
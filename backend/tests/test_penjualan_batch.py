@@ -0,0 +1,44 @@
+"""Batch sales are inserted in a constant number of statements"""
+from conftest import add_bahan, add_menu
+from models import LogPemakaian, Penjualan
+
+def post_batch(client, count_queries, sales):
+    with count_queries() as total:
+        response = client.post('/api/penjualan/batch', json=sales)
+    assert response.status_code == 201, response.json
+    return total[0], response.json
+
+def test_batch_query_count_is_flat(client, count_queries):
+    id_menu = add_menu(client, 'Espresso', [
+        {'id_bahan': add_bahan(client, 'Kopi', stok_awal=10000), 'jumlah': 1, 'waste_percent': 0}
+    ])
+    sale = {'id_menu': id_menu, 'tanggal': '2024-01-01', 'jumlah_terjual': 1}
+    # Warm the recipe cache so both counts are of the insert path alone
+    post_batch(client, count_queries, [sale])
+    one, _ = post_batch(client, count_queries, [sale])
+    many, body = post_batch(client, count_queries, [sale] * 50)
+    assert body['data']['created'] == 50
+    assert many == one
+
+def test_batch_ids_match_their_sales(app, client):
+    kopi = add_bahan(client, 'Kopi')
+    teh = add_bahan(client, 'Teh')
+    menus = {
+        add_menu(client, 'Kopi', [{'id_bahan': kopi, 'jumlah': 1, 'waste_percent': 0}]): kopi,
+        add_menu(client, 'Teh', [{'id_bahan': teh, 'jumlah': 1, 'waste_percent': 0}]): teh
+    }
+    sales = [
+        {'id_menu': id_menu, 'tanggal': '2024-01-01', 'jumlah_terjual': quantity}
+        for quantity in range(1, 6) for id_menu in menus
+    ]
+    response = client.post('/api/penjualan/batch', json=sales)
+    assert response.status_code == 201, response.json
+    
+    with app.app_context():
+        for sale, result in zip(sales, response.json['data']['results']):
+            penjualan = Penjualan.query.get(result['id_penjualan'])
+            assert (penjualan.id_menu, penjualan.jumlah_terjual) == (
+                sale['id_menu'], sale['jumlah_terjual']
+            )
+            logs = LogPemakaian.query.filter_by(id_penjualan=penjualan.id_penjualan).all()
+            assert [log.id_bahan for log in logs] == [menus[sale['id_menu']]]
@@ -0,0 +1,49 @@
+"""Parallel sales against one SQLite file never oversell or lose a decrement"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from conftest import add_bahan, add_menu
+from database import db
+from models import BahanBaku, LogPemakaian, MutasiStok, Penjualan
+from sqlalchemy import func
+
+THREADS = 8
+SALES_PER_THREAD = 6
+STOCK = 30
+USAGE_PER_SALE = 2
+
+def test_parallel_sales_conserve_stock(app, client):
+    id_bahan = add_bahan(client, 'Kopi', stok_awal=STOCK)
+    id_menu = add_menu(client, 'Espresso', [
+        {'id_bahan': id_bahan, 'jumlah': USAGE_PER_SALE, 'waste_percent': 0}
+    ])
+    # Start every thread's sales together to make them collide
+    barrier = threading.Barrier(THREADS)
+    
+    def sell():
+        thread_client = app.test_client()
+        barrier.wait()
+        return [
+            thread_client.post('/api/penjualan', json={
+                'id_menu': id_menu, 'tanggal': '2024-01-01', 'jumlah_terjual': 1
+            }).status_code
+            for _ in range(SALES_PER_THREAD)
+        ]
+    
+    with ThreadPoolExecutor(THREADS) as executor:
+        futures = [executor.submit(sell) for _ in range(THREADS)]
+    statuses = [status for future in futures for status in future.result()]
+    
+    sold = statuses.count(201)
+    # Only running out of stock may fail a sale
+    assert set(statuses) <= {201, 400}
+    assert sold == STOCK // USAGE_PER_SALE
+    
+    with app.app_context():
+        stok_awal = db.session.query(BahanBaku.stok_awal).filter_by(id_bahan=id_bahan).scalar()
+        assert stok_awal == STOCK - sold * USAGE_PER_SALE
+        assert db.session.query(func.min(BahanBaku.stok_awal)).scalar() >= 0
+        assert Penjualan.query.count() == sold
+        assert LogPemakaian.query.count() == sold
+        ledger = db.session.query(func.sum(MutasiStok.jumlah)).filter_by(id_bahan=id_bahan).scalar()
+        assert ledger == stok_awal
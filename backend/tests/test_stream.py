@@ -0,0 +1,16 @@
+"""Event streams past the subscriber limit are turned away"""
+
+def test_stream_subscriber_limit(app, client):
+    app.extensions['event_broker'].max_subscribers = 2
+    streams = [client.get('/api/stream', buffered=False) for _ in range(2)]
+    assert [stream.status_code for stream in streams] == [200, 200]
+    
+    refused = client.get('/api/stream', buffered=False)
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'].isdigit()
+    
+    streams[0].close()
+    reopened = client.get('/api/stream', buffered=False)
+    assert reopened.status_code == 200
+    reopened.close()
+    streams[1].close()
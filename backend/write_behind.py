@@ -0,0 +1,469 @@
+from collections import deque
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from database import db
+from models import LogPemakaian, Penjualan
+from outlets import current_outlet, outlet_context
+import atexit
+import fcntl
+import glob
+import itertools
+import json
+import logging
+import os
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# Session.info key holding usage logs to journal when the sale commits
+DEFERRED_KEY = 'deferred_usage_logs'
+
+# Session.info key holding journaled usage logs to queue once the commit succeeds
+JOURNALED_KEY = 'journaled_usage_logs'
+
+# Usage log IDs checked per query when replaying a journal
+REPLAY_CHUNK_SIZE = 500
+
+# Writers to reset in a forked child, e.g. a gunicorn worker of a preloaded app
+_writers = weakref.WeakSet()
+
+def _journal_entries(path):
+    """
+    Read the entries of a journal file, ignoring a torn final line
+    Entries are journaled before their sale commits; those of sales that
+    rolled back are followed by a {"drop": [entry IDs]} record and left out.
+    """
+    entries = []
+    dropped = set()
+    with open(path) as journal:
+        for line in journal:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning('Skipping unreadable line in %s', path)
+                continue
+            if isinstance(record, dict) and 'drop' in record:
+                dropped.update(record['drop'])
+            else:
+                entries.append(record)
+    return [
+        entry for entry in entries
+        if isinstance(entry, list) or entry.get('id') not in dropped
+    ]
+
+def _entry_rows(entry):
+    # Journals written before outlets existed hold bare lists of rows
+    return entry if isinstance(entry, list) else entry['rows']
+
+def _by_outlet(entries):
+    """Group queue entries by the outlet whose database they belong in"""
+    groups = {}
+    for entry in entries:
+        outlet = None if isinstance(entry, list) else entry['outlet']
+        groups.setdefault(outlet, []).append(entry)
+    return groups
+
+def _insert_missing(entries):
+    """
+    Insert journaled usage logs whose sale has no logs in the database yet
+    Every entry holds all the logs of its sales and is flushed in one
+    transaction, so a sale is either fully written or not written at all.
+    A process that died mid-commit can leave entries of sales that never
+    committed, whose IDs a later sale may have taken, so rows are only
+    inserted for sales that exist with the creation time journaled for them.
+    Returns: number of log rows inserted
+    """
+    rows = [row for entry in entries for row in _entry_rows(entry)]
+    journaled_at = {
+        int(id_penjualan): created_at
+        for entry in entries if not isinstance(entry, list)
+        for id_penjualan, created_at in entry.get('sales', {}).items()
+    }
+    sale_ids = sorted({row['id_penjualan'] for row in rows})
+    created = {}
+    written = set()
+    for i in range(0, len(sale_ids), REPLAY_CHUNK_SIZE):
+        chunk = sale_ids[i:i + REPLAY_CHUNK_SIZE]
+        created.update(
+            # Batch sales saved before created_at was set on them have none
+            (id_penjualan, created_at and created_at.isoformat())
+            for id_penjualan, created_at in
+            db.session.query(Penjualan.id_penjualan, Penjualan.created_at).filter(
+                Penjualan.id_penjualan.in_(chunk)
+            )
+        )
+        written.update(
+            id_penjualan for (id_penjualan,) in db.session.query(
+                LogPemakaian.id_penjualan
+            ).filter(LogPemakaian.id_penjualan.in_(chunk)).distinct()
+        )
+    missing = [
+        row for row in rows
+        if row['id_penjualan'] in created
+        and row['id_penjualan'] not in written
+        and journaled_at.get(row['id_penjualan'], created[row['id_penjualan']])
+        == created[row['id_penjualan']]
+    ]
+    if missing:
+        db.session.bulk_insert_mappings(LogPemakaian, missing)
+    db.session.commit()
+    return len(missing)
+
+class _Segment:
+    """One journal file and the count of its entries not yet flushed or dropped"""
+    def __init__(self, path):
+        self.path = path
+        self.handle = open(path, 'a')
+        fcntl.flock(self.handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.written = 0
+        self.outstanding = 0
+    
+    def close(self, delete):
+        if delete:
+            os.unlink(self.path)
+        # Closing releases the flock, so the file is gone before it is free
+        self.handle.close()
+
+class UsageLogWriter:
+    """
+    Write-behind queue for LogPemakaian rows
+    Entries are journaled while their sale commits and queued once it has,
+    and a background thread inserts them in batches. The journal is split
+    into segments: each batch taken starts a new one, and a segment is
+    deleted once all of its entries are flushed or dropped, so the journal
+    stays bounded under steady load. Each process holds an exclusive flock
+    on its open segments, so journals whose lock can be taken belong to a
+    process that died and are replayed on startup.
+    """
+    def __init__(self, app, journal_dir, max_pending=10000, batch_size=500,
+                 flush_interval=0.2, fsync=False):
+        self.app = app
+        self.journal_dir = journal_dir
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.pending = deque()
+        self.unflushed = 0
+        self.condition = threading.Condition()
+        self._reset_journal()
+        self.thread = None
+        self.stopping = False
+        self.start_lock = threading.Lock()
+        self.restart_pending = False
+        self.drain_registered = False
+        _writers.add(self)
+    
+    def _reset_journal(self):
+        self.segment = None
+        self.segment_numbers = itertools.count(1)
+        self.entry_ids = itertools.count(1)
+        # Segment of every journaled entry not yet flushed or dropped
+        self.segment_of = {}
+    
+    def _open_segment(self):
+        self.segment = _Segment(os.path.join(
+            self.journal_dir, f'journal-{os.getpid()}-{next(self.segment_numbers)}.ndjson'
+        ))
+    
+    def start(self):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self.replay()
+        self._open_segment()
+        self.thread = threading.Thread(
+            target=self._run, name='usage-log-writer', daemon=True
+        )
+        self.thread.start()
+        if not self.drain_registered:
+            atexit.register(self.drain)
+            self.drain_registered = True
+    
+    def ensure_started(self):
+        """Start this process's own writer if it was forked from a running one"""
+        if self.restart_pending:
+            with self.start_lock:
+                if self.restart_pending:
+                    self.start()
+                    self.restart_pending = False
+    
+    def after_fork(self):
+        """
+        Drop the state a forked child copied from its parent
+        The queue, journal and thread belong to the parent, which keeps
+        flushing them; the child starts a writer of its own on first use.
+        """
+        self.pending = deque()
+        self.unflushed = 0
+        self.condition = threading.Condition()
+        self.start_lock = threading.Lock()
+        # The parent's flocks stay with the parent's descriptors
+        for segment in {self.segment, *self.segment_of.values()} - {None}:
+            segment.handle.close()
+        self._reset_journal()
+        self.restart_pending = self.thread is not None
+        self.thread = None
+        self.stopping = False
+    
+    def replay(self):
+        """
+        Insert the logs left in the journals of processes that are gone
+        Returns: number of log rows inserted
+        """
+        inserted = 0
+        for path in glob.glob(os.path.join(self.journal_dir, 'journal-*.ndjson')):
+            with open(path, 'a') as handle:
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # The owning process is alive and flushing it
+                    continue
+                entries = _journal_entries(path)
+                if entries:
+                    with self.app.app_context():
+                        for outlet, group in _by_outlet(entries).items():
+                            with outlet_context(outlet):
+                                try:
+                                    inserted += _insert_missing(group)
+                                finally:
+                                    db.session.remove()
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    # Its process deleted it after flushing everything
+                    pass
+        if inserted:
+            logger.info('Replayed %d usage log(s) from journals', inserted)
+        return inserted
+    
+    def has_capacity(self):
+        return self.thread is not None and not self.stopping \
+            and len(self.pending) < self.max_pending
+    
+    def journal(self, entries):
+        """Append the entries of a committing sale to the journal, numbering them"""
+        with self.condition:
+            segment = self.segment
+            for entry in entries:
+                entry['id'] = next(self.entry_ids)
+            segment.handle.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+            segment.handle.flush()
+            if self.fsync:
+                os.fsync(segment.handle.fileno())
+            segment.written += len(entries)
+            segment.outstanding += len(entries)
+            for entry in entries:
+                self.segment_of[entry['id']] = segment
+    
+    def enqueue(self, entries):
+        """Queue journaled entries whose sale committed"""
+        with self.condition:
+            self.pending.extend(entries)
+            self.unflushed += len(entries)
+            self.condition.notify()
+    
+    def drop(self, entries):
+        """Mark journaled entries whose sale did not commit, so replay skips them"""
+        with self.condition:
+            # Entries are forgotten when the writer drains or forks
+            segments = {
+                self.segment_of[entry['id']] for entry in entries if entry['id'] in self.segment_of
+            }
+            record = json.dumps({'drop': [entry['id'] for entry in entries]}) + '\n'
+            for segment in segments:
+                try:
+                    segment.handle.write(record)
+                    segment.handle.flush()
+                except OSError:
+                    # Replay still skips sales that do not exist
+                    logger.exception('Could not mark dropped usage logs in %s', segment.path)
+            self._settle(entries)
+    
+    def _settle(self, entries):
+        """Forget flushed or dropped entries, deleting segments left with none"""
+        segments = set()
+        for entry in entries:
+            segment = self.segment_of.pop(entry['id'], None)
+            if segment is None:
+                continue
+            segment.outstanding -= 1
+            segments.add(segment)
+        for segment in segments:
+            if segment is not self.segment and segment.outstanding == 0:
+                segment.close(delete=True)
+    
+    def _rotate(self):
+        """Start a new segment so the current one can be deleted once flushed"""
+        previous = self.segment
+        try:
+            self._open_segment()
+        except OSError:
+            logger.exception('Could not start a new journal segment')
+            return
+        if previous.outstanding == 0:
+            previous.close(delete=True)
+    
+    def _take_batch(self):
+        if self.segment.written:
+            self._rotate()
+        batch = []
+        rows = 0
+        while self.pending and rows < self.batch_size:
+            entry = self.pending.popleft()
+            batch.append(entry)
+            rows += len(entry['rows'])
+        return batch
+    
+    def _flush(self, outlet, entries):
+        """Insert the entries of one outlet in one transaction"""
+        with self.app.app_context(), outlet_context(outlet):
+            try:
+                db.session.bulk_insert_mappings(
+                    LogPemakaian, [row for entry in entries for row in entry['rows']]
+                )
+                db.session.commit()
+            finally:
+                db.session.remove()
+        
+        with self.condition:
+            self.unflushed -= len(entries)
+            self._settle(entries)
+    
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopping:
+                    self.condition.wait(self.flush_interval)
+                if self.stopping and not self.pending:
+                    return
+                batch = self._take_batch()
+            failed = []
+            for outlet, entries in _by_outlet(batch).items():
+                try:
+                    self._flush(outlet, entries)
+                except Exception:
+                    logger.exception(
+                        'Flushing %d usage log entries of outlet %s failed; retrying',
+                        len(entries), outlet
+                    )
+                    failed.extend(entries)
+            if failed:
+                with self.condition:
+                    self.pending.extendleft(reversed(failed))
+                    if self.stopping:
+                        # The journal still has them for the next start
+                        return
+                    self.condition.wait(self.flush_interval)
+    
+    def drain(self):
+        """Stop the writer after flushing everything it has queued"""
+        if self.thread is None:
+            return
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        self.thread.join()
+        self.thread = None
+        
+        with self.condition:
+            # Segments still holding entries are replayed on the next start
+            for segment in {self.segment, *self.segment_of.values()}:
+                segment.close(delete=segment.outstanding == 0)
+            self._reset_journal()
+
+def write_usage_logs(log_rows, sales):
+    """
+    Write LogPemakaian rows as part of the current sale
+    With the write-behind queue enabled the rows are journaled as the sale
+    commits and queued once it has; otherwise, or while the queue is full,
+    they are inserted in the sale's own transaction. sales are the flushed
+    Penjualan rows the logs belong to.
+    """
+    writer = current_app.extensions.get('usage_log_writer')
+    if writer is not None:
+        writer.ensure_started()
+    if writer is None or not writer.has_capacity():
+        db.session.bulk_insert_mappings(LogPemakaian, log_rows)
+        return
+    db.session.info.setdefault(DEFERRED_KEY, []).append({
+        'outlet': current_outlet(),
+        # Lets replay tell these sales from later ones that reused their IDs
+        'sales': {
+            str(penjualan.id_penjualan): penjualan.created_at.isoformat() for penjualan in sales
+        },
+        'rows': log_rows
+    })
+
+def _after_fork_in_child():
+    for writer in list(_writers):
+        writer.after_fork()
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+def _before_commit(session):
+    """Journal the sale's usage logs before it commits, so a crash cannot lose them"""
+    entries = session.info.pop(DEFERRED_KEY, None)
+    if not entries:
+        return
+    try:
+        session.app.extensions['usage_log_writer'].journal(entries)
+    except Exception:
+        logger.exception('Journaling usage logs failed; writing them with the sale')
+        session.bulk_insert_mappings(
+            LogPemakaian, [row for entry in entries for row in entry['rows']]
+        )
+        return
+    session.info[JOURNALED_KEY] = entries
+
+def _after_commit(session):
+    entries = session.info.pop(JOURNALED_KEY, None)
+    if not entries:
+        return
+    try:
+        session.app.extensions['usage_log_writer'].enqueue(entries)
+    except Exception:
+        # The sale is committed; its logs are replayed from the journal
+        logger.exception('Queueing %d usage log entries failed', len(entries))
+
+def _after_transaction_end(session, transaction):
+    """Drop the usage logs of a sale that ended without committing"""
+    if transaction.parent is not None:
+        return
+    session.info.pop(DEFERRED_KEY, None)
+    entries = session.info.pop(JOURNALED_KEY, None)
+    if entries:
+        try:
+            session.app.extensions['usage_log_writer'].drop(entries)
+        except Exception:
+            logger.exception('Dropping %d usage log entries failed', len(entries))
+
+def init_write_behind(app):
+    """Start the usage log write-behind queue when LOG_WRITE_BEHIND is set"""
+    app.config.setdefault('LOG_WRITE_BEHIND', os.environ.get('LOG_WRITE_BEHIND', '0') == '1')
+    app.config.setdefault('LOG_JOURNAL_DIR', os.environ.get(
+        'LOG_JOURNAL_DIR', os.path.join(app.instance_path, 'log_journal')
+    ))
+    app.config.setdefault('LOG_JOURNAL_FSYNC', os.environ.get('LOG_JOURNAL_FSYNC', '0') == '1')
+    app.config.setdefault('LOG_QUEUE_SIZE', int(os.environ.get('LOG_QUEUE_SIZE', 10000)))
+    app.config.setdefault('LOG_FLUSH_BATCH_SIZE', int(os.environ.get('LOG_FLUSH_BATCH_SIZE', 500)))
+    app.config.setdefault('LOG_FLUSH_INTERVAL_MS', int(os.environ.get('LOG_FLUSH_INTERVAL_MS', 200)))
+    
+    if not app.config['LOG_WRITE_BEHIND']:
+        return
+    
+    writer = UsageLogWriter(
+        app,
+        journal_dir=app.config['LOG_JOURNAL_DIR'],
+        max_pending=app.config['LOG_QUEUE_SIZE'],
+        batch_size=app.config['LOG_FLUSH_BATCH_SIZE'],
+        flush_interval=app.config['LOG_FLUSH_INTERVAL_MS'] / 1000,
+        fsync=app.config['LOG_JOURNAL_FSYNC']
+    )
+    writer.start()
+    app.extensions['usage_log_writer'] = writer
+    
+    if not event.contains(Session, 'after_commit', _after_commit):
+        event.listen(Session, 'before_commit', _before_commit)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_transaction_end', _after_transaction_end)
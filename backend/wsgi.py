@@ -0,0 +1,12 @@
+"""
+WSGI entry point for production servers
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Uses the production preset unless APP_ENV says otherwise, so the schema is
+not touched while workers boot: run `flask db upgrade` when deploying.
+"""
+from app import create_app
+import os
+
+app = create_app(os.environ.get('APP_ENV', 'production'))
@@ -28,6 +28,45 @@ function showAlert(message, type = 'success') {
     alertContainer.classList.remove('hidden');
 }
 
+// Responses of conditional GETs, keyed by URL, with the ETag they were served with
+const responseCache = new Map();
+
+// GET a JSON endpoint, revalidating the cached copy with If-None-Match
+async function fetchJSON(url) {
+    const cached = responseCache.get(url);
+    const headers = cached ? { 'If-None-Match': cached.etag } : {};
+    const response = await fetch(url, { headers });
+    if (response.status === 304 && cached) {
+        return cached.data;
+    }
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    if (response.ok && etag) {
+        responseCache.set(url, { etag, data });
+    }
+    return data;
+}
+
+// Fetch every page of a paginated list endpoint
+async function fetchAllPages(path) {
+    let items = [];
+    // Ingredients referenced by id_bahan from menu recipe lines
+    const bahan = {};
+    let cursor = null;
+    do {
+        const separator = path.includes('?') ? '&' : '?';
+        const cursorParam = cursor !== null ? `&cursor=${cursor}` : '';
+        const data = await fetchJSON(`${API_URL}${path}${separator}limit=1000${cursorParam}`);
+        if (data.status !== 'success') {
+            return data;
+        }
+        items = items.concat(data.data);
+        Object.assign(bahan, data.bahan);
+        cursor = data.pagination.next_cursor;
+    } while (cursor !== null);
+    return { status: 'success', data: items, bahan };
+}
+
 function formatPrice(price) {
     return new Intl.NumberFormat('id-ID', {
         style: 'currency',
@@ -40,8 +79,7 @@ if (window.location.pathname.includes('bahan.html')) {
     // Load bahan data
     async function loadBahanData() {
         try {
-            const response = await fetch(`${API_URL}/bahan`);
-            const data = await response.json();
+            const data = await fetchAllPages('/bahan');
             
             if (data.status === 'success') {
                 const tableBody = document.getElementById('bahanTable');
@@ -148,8 +186,7 @@ if (window.location.pathname.includes('menu.html')) {
     // Load menu data
     async function loadMenuData() {
         try {
-            const response = await fetch(`${API_URL}/menu`);
-            const data = await response.json();
+            const data = await fetchAllPages('/menu');
             
             if (data.status === 'success') {
                 const menuContainer = document.getElementById('menuContainer');
@@ -172,8 +209,8 @@ if (window.location.pathname.includes('menu.html')) {
                             <div class="space-y-2">
                                 ${menu.resep.map(item => `
                                     <div class="flex justify-between text-sm">
-                                        <span class="text-gray-500">${item.bahan.nama_bahan}</span>
-                                        <span class="text-gray-900">${item.jumlah} ${item.bahan.satuan} (${item.waste_percent}% waste)</span>
+                                        <span class="text-gray-500">${data.bahan[item.id_bahan].nama_bahan}</span>
+                                        <span class="text-gray-900">${item.jumlah} ${data.bahan[item.id_bahan].satuan} (${item.waste_percent}% waste)</span>
                                     </div>
                                 `).join('')}
                             </div>
@@ -189,8 +226,7 @@ if (window.location.pathname.includes('menu.html')) {
     // Load bahan data for dropdowns
     async function loadBahanData() {
         try {
-            const response = await fetch(`${API_URL}/bahan`);
-            const data = await response.json();
+            const data = await fetchAllPages('/bahan');
             
             if (data.status === 'success') {
                 bahanList = data.data;
@@ -313,8 +349,7 @@ if (window.location.pathname.includes('menu.html')) {
 
     window.editMenu = async function(menuId) {
         try {
-            const response = await fetch(`${API_URL}/menu/${menuId}`);
-            const data = await response.json();
+            const data = await fetchJSON(`${API_URL}/menu/${menuId}`);
             
             if (data.status === 'success') {
                 const menu = data.data;
@@ -375,8 +410,7 @@ if (window.location.pathname.includes('penjualan.html')) {
     // Load menu data for dropdown
     async function loadMenuData() {
         try {
-            const response = await fetch(`${API_URL}/menu`);
-            const data = await response.json();
+            const data = await fetchAllPages('/menu?fields=id_menu,nama_menu');
             
             if (data.status === 'success') {
                 menuList = data.data;
@@ -397,7 +431,7 @@ if (window.location.pathname.includes('penjualan.html')) {
     async function loadTodaysSales() {
         const today = new Date().toISOString().split('T')[0];
         try {
-            const response = await fetch(`${API_URL}/penjualan/daily/${today}`);
+            const response = await fetch(`${API_URL}/penjualan/daily/${today}?include_sales=1`);
             const data = await response.json();
             
             if (data.status === 'success') {
@@ -489,52 +523,116 @@ if (window.location.pathname.includes('penjualan.html')) {
 
 // Dashboard Page Functions
 if (window.location.pathname === '/' || window.location.pathname.includes('index.html')) {
+    const today = new Date().toISOString().split('T')[0];
+    // Dashboard state, kept current by /api/stream events
+    const dashboard = { totalSales: 0, totalCost: 0, totalWaste: 0, bahan: new Map() };
+
+    function renderSummary() {
+        document.getElementById('totalSales').textContent = dashboard.totalSales;
+        document.getElementById('totalCogs').textContent = formatPrice(dashboard.totalCost);
+        document.getElementById('totalWaste').textContent = `${dashboard.totalWaste} gr`;
+    }
+
+    function renderLowStock() {
+        const lowStockItems = Array.from(dashboard.bahan.values()).filter(bahan => bahan.stok_awal < 1000); // Example threshold
+        document.getElementById('lowStockCount').textContent = lowStockItems.length;
+        
+        const lowStockTable = document.getElementById('lowStockTable');
+        lowStockTable.innerHTML = lowStockItems.map(bahan => `
+            <tr>
+                <td class="px-6 py-4 whitespace-nowrap text-sm font-medium text-gray-900">
+                    ${bahan.nama_bahan}
+                </td>
+                <td class="px-6 py-4 whitespace-nowrap text-sm text-gray-500">
+                    ${bahan.stok_awal} ${bahan.satuan}
+                </td>
+                <td class="px-6 py-4 whitespace-nowrap text-sm text-gray-500">
+                    ${bahan.satuan}
+                </td>
+                <td class="px-6 py-4 whitespace-nowrap">
+                    <span class="px-2 inline-flex text-xs leading-5 font-semibold rounded-full bg-red-100 text-red-800">
+                        Low Stock
+                    </span>
+                </td>
+            </tr>
+        `).join('');
+    }
+
     async function loadDashboardData() {
-        const today = new Date().toISOString().split('T')[0];
         try {
             // Load today's summary
             const response = await fetch(`${API_URL}/penjualan/daily/${today}`);
             const data = await response.json();
             
             if (data.status === 'success') {
-                document.getElementById('totalSales').textContent = data.data.total_sales;
-                document.getElementById('totalCogs').textContent = formatPrice(data.data.total_cost);
-                document.getElementById('totalWaste').textContent = `${data.data.total_waste} gr`;
+                dashboard.totalSales = data.data.total_sales;
+                dashboard.totalCost = data.data.total_cost;
+                dashboard.totalWaste = data.data.total_waste;
+                renderSummary();
             }
             
-            // Load low stock items
-            const bahanResponse = await fetch(`${API_URL}/bahan`);
-            const bahanData = await bahanResponse.json();
+            // Load stock levels
+            const bahanData = await fetchAllPages('/bahan');
             
             if (bahanData.status === 'success') {
-                const lowStockItems = bahanData.data.filter(bahan => bahan.stok_awal < 1000); // Example threshold
-                document.getElementById('lowStockCount').textContent = lowStockItems.length;
-                
-                const lowStockTable = document.getElementById('lowStockTable');
-                lowStockTable.innerHTML = lowStockItems.map(bahan => `
-                    <tr>
-                        <td class="px-6 py-4 whitespace-nowrap text-sm font-medium text-gray-900">
-                            ${bahan.nama_bahan}
-                        </td>
-                        <td class="px-6 py-4 whitespace-nowrap text-sm text-gray-500">
-                            ${bahan.stok_awal} ${bahan.satuan}
-                        </td>
-                        <td class="px-6 py-4 whitespace-nowrap text-sm text-gray-500">
-                            ${bahan.satuan}
-                        </td>
-                        <td class="px-6 py-4 whitespace-nowrap">
-                            <span class="px-2 inline-flex text-xs leading-5 font-semibold rounded-full bg-red-100 text-red-800">
-                                Low Stock
-                            </span>
-                        </td>
-                    </tr>
-                `).join('');
+                dashboard.bahan = new Map(bahanData.data.map(bahan => [bahan.id_bahan, bahan]));
+                renderLowStock();
             }
         } catch (error) {
             showAlert('Failed to load dashboard data', 'error');
         }
     }
 
+    // Apply live changes instead of polling
+    function subscribeDashboard() {
+        const stream = new EventSource(`${API_URL}/stream`);
+        
+        stream.addEventListener('sale_recorded', event => {
+            const sales = JSON.parse(event.data).sales.filter(sale => sale.tanggal === today);
+            if (sales.length === 0) return;
+            for (const sale of sales) {
+                dashboard.totalSales += 1;
+                dashboard.totalCost += sale.total_cost;
+                dashboard.totalWaste += sale.total_waste;
+            }
+            renderSummary();
+        });
+        
+        stream.addEventListener('stock_changed', event => {
+            for (const change of JSON.parse(event.data).changes) {
+                const bahan = dashboard.bahan.get(change.id_bahan);
+                if (bahan) bahan.stok_awal += change.delta;
+            }
+            renderLowStock();
+        });
+        
+        stream.addEventListener('bahan_changed', event => {
+            const data = JSON.parse(event.data);
+            if (data.action === 'deleted') {
+                dashboard.bahan.delete(data.id_bahan);
+            } else {
+                dashboard.bahan.set(data.bahan.id_bahan, data.bahan);
+            }
+            renderLowStock();
+        });
+        
+        // Missed events (or a different server after reconnecting): start over
+        stream.addEventListener('reset', loadDashboardData);
+        
+        // Turned away (e.g. 503 at the stream limit): EventSource gives up, so
+        // reload and subscribe again later
+        stream.addEventListener('error', () => {
+            if (stream.readyState !== EventSource.CLOSED) return;
+            setTimeout(() => {
+                loadDashboardData();
+                subscribeDashboard();
+            }, 30000);
+        });
+    }
+
     // Initialize dashboard
-    window.addEventListener('load', loadDashboardData);
+    window.addEventListener('load', () => {
+        loadDashboardData();
+        subscribeDashboard();
+    });
 }